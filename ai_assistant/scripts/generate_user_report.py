@@ -16,6 +16,9 @@ try:
     PROJECT_ROOT = SCRIPT_DIR.parent.parent
     sys.path.append(str(PROJECT_ROOT))
     from settings import BASE_DIR
+    from modules.wg_config import load_wg_config
+    from modules.wg_dump import format_bytes, read_wg_dump
+    from modules.handshake_updater import convert_handshake_timestamp
 except ImportError as e:
     print(f"Error importing settings: {e}")
     sys.exit(1)
@@ -25,60 +28,37 @@ SERVER_CONFIG_FILE = Path("/etc/wireguard/wg0.conf")
 PARAMS_FILE = Path("/etc/wireguard/params")
 
 def parse_wg_config(config_path):
-    """Reads WireGuard configuration and extracts client information."""
-    clients = []
-    current_client = None
-
+    """Reads WireGuard configuration and yields client information one client at a time."""
     try:
-        with open(config_path, "r") as file:
-            for line in file:
-                line = line.strip()
-                if line.startswith("### Client"):
-                    if current_client:
-                        clients.append(current_client)
-                    current_client = {"login": line.split("### Client")[-1].strip(), "peer": {}}
-                elif line.startswith("[Peer]"):
-                    continue
-                elif "=" in line and current_client:
-                    key, value = map(str.strip, line.split("=", 1))
-                    current_client["peer"][key] = value
-            if current_client:
-                clients.append(current_client)
+        config = load_wg_config(config_path)
     except FileNotFoundError:
         print(f"Configuration file {config_path} not found.")
         sys.exit(1)
 
-    return clients
+    for peer in config.peers:
+        if peer.name is not None:
+            yield {"login": peer.name, "peer": peer.as_dict()}
 
 def get_wg_status():
-    """Gets WireGuard status using the `wg show` command."""
+    """Gets WireGuard status with a single `wg show <nic> dump` call."""
     try:
-        output = subprocess.check_output(["wg", "show"], text=True).splitlines()
-    except subprocess.CalledProcessError as e:
+        _, peers = read_wg_dump()
+    except (OSError, subprocess.CalledProcessError, ValueError) as e:
         print(f"Error executing wg show command: {e}")
         sys.exit(1)
 
-    peers = {}
-    current_peer = None
-
-    for line in output:
-        if line.startswith("peer:"):
-            if current_peer:
-                peers[current_peer["PublicKey"]] = current_peer
-            current_peer = {"PublicKey": line.split("peer:")[1].strip(), "Transfer": {}}
-        elif "latest handshake:" in line and current_peer:
-            current_peer["LatestHandshake"] = line.split("latest handshake:")[1].strip()
-        elif "transfer:" in line and current_peer:
-            transfer_data = line.split("transfer:")[1].strip().split(",")
-            current_peer["Transfer"] = {
-                "Received": transfer_data[0].strip(),
-                "Sent": transfer_data[1].strip()
-            }
-
-    if current_peer:
-        peers[current_peer["PublicKey"]] = current_peer
-
-    return peers
+    return {
+        public_key: {
+            "PublicKey": public_key,
+            "LatestHandshake": convert_handshake_timestamp(peer.latest_handshake),
+            "Transfer": {
+                "Received": format_bytes(peer.transfer_rx),
+                "Sent": format_bytes(peer.transfer_tx)
+            },
+            "Bytes": peer.transfer_rx + peer.transfer_tx
+        }
+        for public_key, peer in peers.items()
+    }
 
 def read_params_file(filepath):
     """Reads the WireGuard parameters file."""
@@ -102,9 +82,9 @@ def generate_user_report(clients, wg_status, params_data):
         allowed_ip = peer.get("AllowedIPs", "Unknown")
 
         wg_peer_status = wg_status.get(public_key, {})
-        transfer = wg_peer_status.get("Transfer", {"Received": "0 MiB", "Sent": "0 MiB"})
+        transfer = wg_peer_status.get("Transfer", {"Received": "0 B", "Sent": "0 B"})
 
-        if any(float(value.split()[0]) > 0 for value in transfer.values()):
+        if wg_peer_status.get("Bytes", 0) > 0:
             active_users.append(f"- {allowed_ip} - {login}: Incoming: {transfer['Received']}, Outgoing: {transfer['Sent']}")
         else:
             inactive_users.append(f"- {allowed_ip} - {login}")
@@ -4,6 +4,7 @@
 # Version: 5.3
 # Updated: 2024-12-02 22:00
 
+import ipaddress
 import json
 import time
 import sys
@@ -128,8 +129,8 @@ def check_masquerade_rules():
     try:
         wireguard_subnet = get_wireguard_subnet()
         required_rules = [
-            {"type": "IPv4", "rule": f"{wireguard_subnet.split('/')[0].rsplit('.', 1)[0]}.0/24"},
-            {"type": "IPv6", "rule": "fd42:42:42::0/24"}
+            {"type": "IPv4", "rule": str(ipaddress.ip_interface(wireguard_subnet).network)},
+            {"type": "IPv6", "rule": "fd42:42:42::0/64"}
         ]
     except Exception as e:
         logger.error(f"Error extracting WireGuard subnet: {e}")
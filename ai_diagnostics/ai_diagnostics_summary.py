@@ -16,7 +16,8 @@ PROJECT_ROOT = Path(__file__).resolve().parent.parent
 sys.path.append(str(PROJECT_ROOT))  # Add the project root to sys.path
 
 # Import settings
-from settings import PROJECT_DIR, SUMMARY_REPORT_PATH, USER_DB_PATH, LOG_LEVEL
+from settings import PROJECT_DIR, SUMMARY_REPORT_PATH, USER_DB_PATH, USER_DB_BACKEND, LOG_LEVEL
+from modules.user_store import get_user_store
 
 # Configure logging
 logging.basicConfig(
@@ -86,19 +87,15 @@ def check_wireguard_status():
 
 
 def count_users():
-    """Counts the number of users from user_records.json."""
-    if USER_DB_PATH.exists():
-        try:
-            with open(USER_DB_PATH, "r", encoding="utf-8") as file:
-                user_data = json.load(file)
-                user_count = len(user_data)
-                logger.debug(f"Detected users: {user_count}")
-                return user_count, "user_records.json"
-        except json.JSONDecodeError:
-            logger.error("Error reading user_records.json.")
-            return 0, "Error reading user_records.json"
-    logger.warning("File user_records.json is missing.")
-    return 0, "Missing file user_records.json"
+    """Counts the number of users from the user database."""
+    source = "user_records.json" if USER_DB_BACKEND == "json" else "user_records.sqlite3"
+    try:
+        user_count = get_user_store().count()
+        logger.debug(f"Detected users: {user_count}")
+        return user_count, source
+    except Exception as e:
+        logger.error(f"Error reading the user database: {e}")
+        return 0, f"Error reading {source}"
 
 
 def count_peers(wg_info):
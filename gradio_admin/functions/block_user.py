@@ -1,129 +1,122 @@
 #!/usr/bin/env python3
 # gradio_admin/functions/block_user.py
 
-import json
-import subprocess  # For managing VPN via system commands
-from settings import USER_DB_PATH, SERVER_CONFIG_FILE  # Paths to JSON and WireGuard configuration
+from settings import SERVER_CONFIG_FILE  # Path to WireGuard configuration
 from settings import SERVER_WG_NIC
+from modules.user_store import get_user_store
+from modules.wg_changeset import ChangeSet
+from modules.wg_config import load_wg_config
 
-def load_user_records():
-    """Loads user records from JSON."""
+def set_user_status(username, status):
+    """Updates the status of a single user record."""
     try:
-        with open(USER_DB_PATH, "r") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {}
+        return get_user_store().update(username, {"status": status})
     except Exception as e:
-        print(f"[ERROR] Failed to load user records: {e}")
-        return {}
+        print(f"[ERROR] Failed to update user record: {e}")
+        return False
 
-def save_user_records(records):
-    """Saves user records to JSON."""
+def record_blocked_peers(usernames):
+    """
+    After a failed block: marks as blocked the users whose peers were blocked in
+    wg0.conf anyway (the write succeeded, the sync did not), so the reconciler
+    does not restore their access from the database.
+    """
     try:
-        with open(USER_DB_PATH, "w") as f:
-            json.dump(records, f, indent=4)
-        return True
+        config = load_wg_config(SERVER_CONFIG_FILE)
+        blocked = []
+        for username in usernames:
+            peer = config.peer_by_name(username)
+            if peer is not None and peer.blocked:
+                blocked.append(username)
+        if blocked:
+            get_user_store().update_many({username: {"status": "blocked"} for username in blocked})
     except Exception as e:
-        print(f"[ERROR] Failed to save user records: {e}")
-        return False
+        print(f"[ERROR] Failed to update user records: {e}")
 
 def block_user(username):
     """
     Blocks a user:
-    1. Updates the status in JSON to 'blocked'.
-    2. Removes the user from the WireGuard configuration.
+    1. Removes the user from the WireGuard configuration.
+    2. Updates the status in the user database to 'blocked'.
     """
-    records = load_user_records()
-    if username not in records:
+    if username not in get_user_store():
         return False, f"User '{username}' not found."
 
-    # Update status in JSON
-    records[username]["status"] = "blocked"
-    if not save_user_records(records):
-        return False, f"Failed to update JSON for user '{username}'."
-
-    # Remove user from configuration
+    # Change the configuration first: if it fails, the database is not changed
     if not update_wireguard_config(username, block=True):
+        record_blocked_peers([username])
         return False, f"Failed to block VPN access for user '{username}'."
 
+    # Update status in the database
+    if not set_user_status(username, "blocked"):
+        return False, f"Failed to update the user database for user '{username}'."
+
     return True, f"User '{username}' has been blocked and VPN access revoked."
 
 def unblock_user(username):
     """
     Unblocks a user:
-    1. Updates the status in JSON to 'active'.
-    2. Restores the user in the WireGuard configuration.
+    1. Restores the user in the WireGuard configuration.
+    2. Updates the status in the user database to 'active'.
     """
-    records = load_user_records()
-    if username not in records:
+    if username not in get_user_store():
         return False, f"User '{username}' not found."
 
-    # Update status in JSON
-    records[username]["status"] = "active"
-    if not save_user_records(records):
-        return False, f"Failed to update JSON for user '{username}'."
-
-    # Restore user in configuration
+    # Change the configuration first: if it fails, the database is not changed
     if not update_wireguard_config(username, block=False):
         return False, f"Failed to restore VPN access for user '{username}'."
 
+    # Update status in the database
+    if not set_user_status(username, "active"):
+        return False, f"Failed to update the user database for user '{username}'."
+
     return True, f"User '{username}' has been unblocked and VPN access restored."
 
+def set_users_blocked(usernames, block=True):
+    """
+    Blocks or unblocks several users with one configuration write and one WireGuard sync.
+    :param usernames: Usernames to change.
+    :param block: True to block, False to unblock.
+    :return: (success, message).
+    """
+    store = get_user_store()
+    missing = [username for username in usernames if username not in store]
+    if missing:
+        return False, f"Users not found: {', '.join(missing)}."
+
+    # Change the configuration first: if a peer is missing, nothing is changed
+    if not update_wireguard_config(usernames, block=block):
+        if block:
+            record_blocked_peers(usernames)
+        return False, f"Failed to {'block' if block else 'restore'} VPN access for {len(usernames)} user(s)."
+
+    status = "blocked" if block else "active"
+    try:
+        store.update_many({username: {"status": status} for username in usernames})
+    except Exception as e:
+        print(f"[ERROR] Failed to update user records: {e}")
+        return False, "Failed to update the user database."
+
+    return True, f"{len(usernames)} user(s) {'blocked' if block else 'unblocked'}."
+
 def update_wireguard_config(username, block=True):
     """
     Updates the WireGuard configuration file:
     1. If block=True, comments out the entire [Peer] block related to the user.
     2. If block=False, restores the [Peer] block.
+    :param username: Username or list of usernames (changed together, with one sync).
     """
+    usernames = [username] if isinstance(username, str) else list(username)
     try:
-        with open(SERVER_CONFIG_FILE, "r") as f:
-            config_lines = f.readlines()
-
-        updated_lines = []
-        in_peer_block = False
-        peer_belongs_to_user = False
-
-        for idx, line in enumerate(config_lines):
-            stripped_line = line.strip()
-
-            # Identify the user via the comment ### Client <username>
-            if stripped_line == f"### Client {username}":
-                in_peer_block = True
-                peer_belongs_to_user = True
-                updated_lines.append(line)  # Add the comment as is
-                continue
-
-            # Process the [Peer] block if it belongs to the user
-            if in_peer_block and peer_belongs_to_user:
-                if block:
-                    if not line.startswith("#"):
-                        updated_lines.append(f"# {line}")  # Comment out the line
-                    else:
-                        updated_lines.append(line)  # Already commented
-                else:
-                    if line.startswith("# "):
-                        updated_lines.append(line[2:])  # Remove the comment
-                    else:
-                        updated_lines.append(line)  # Already uncommented
-
-                # End of [Peer] block - empty line
-                if stripped_line == "":
-                    in_peer_block = False
-                    peer_belongs_to_user = False
-                continue
-
-            # All other lines
-            updated_lines.append(line)
-
-        # Save the updated configuration file
-        with open(SERVER_CONFIG_FILE, "w") as f:
-            f.writelines(updated_lines)
-
-        # Sync WireGuard
-        sync_command = f'wg syncconf "{SERVER_WG_NIC}" <(wg-quick strip "{SERVER_WG_NIC}")'
-        subprocess.run(sync_command, shell=True, check=True, executable='/bin/bash')
-        print(f"WireGuard synced for interface {SERVER_WG_NIC}")
-
+        # Only the users' blocks are rewritten; WireGuard is synced once, and access
+        # is reported as changed only after the sync reached the interface
+        changes = ChangeSet(SERVER_CONFIG_FILE, SERVER_WG_NIC)
+        for name in usernames:
+            if block:
+                changes.block(name)
+            else:
+                changes.unblock(name)
+        changes.apply(wait=True)
         return True
 
     except Exception as e:
@@ -2,6 +2,9 @@
 import os
 import subprocess
 from pathlib import Path
+from modules.user_cache import invalidate_user_records
+from modules.artifact_store import get_artifact_store
+from modules.qr_cache import qr_image
 
 def create_user(username, email="N/A", telegram_id="N/A"):
     if not username:
@@ -9,10 +12,10 @@ def create_user(username, email="N/A", telegram_id="N/A"):
 
     # Получаем абсолютные пути
     base_dir = Path(__file__).parent.parent.parent
-    config_path = base_dir / "configs" / f"{username}.conf"
-    
+    artifacts = get_artifact_store()
+
     # Проверка существования пользователя перед вызовом subprocess
-    if config_path.exists():
+    if artifacts.path(username, "config"):
         return f"Error: User '{username}' already exists!", None
 
     try:
@@ -24,11 +27,13 @@ def create_user(username, email="N/A", telegram_id="N/A"):
             capture_output=True,
             text=True
         )
+        # The user was written by another process
+        invalidate_user_records()
         
-        # Проверяем создание QR-кода
-        qr_code_path = base_dir / "user" / "data" / "qrcodes" / f"{username}.png"
-        if qr_code_path.exists():
-            return f"✅ User {username} successfully created.", str(qr_code_path)
+        # QR-код из кэша: main.py уже отрисовал его по тексту конфигурации
+        config = artifacts.read(username, "config")
+        if config:
+            return f"✅ User {username} successfully created.", qr_image(config.decode("utf-8"))
         return f"✅ User {username} created, but QR code not found.", None
 
     except subprocess.CalledProcessError as e:
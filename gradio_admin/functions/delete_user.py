@@ -2,11 +2,14 @@
 # delete_user.py
 # Script for deleting users in the pyWGgen project
 
-import os
-import subprocess
 from datetime import datetime
-from modules.utils import read_json, write_json, get_wireguard_config_path
-from settings import WG_CONFIG_DIR, QR_CODE_DIR, SERVER_WG_NIC
+from modules.utils import get_wireguard_config_path
+from modules.user_store import get_user_store
+from modules.wg_config import load_wg_config, remove_peer
+from modules.wg_changeset import ChangeSet
+from modules.wg_sync import request_sync
+from modules.user_cleanup import forget_user
+from settings import SERVER_WG_NIC
 
 # Logging function (similar to log_debug)
 def log_debug(message):
@@ -25,44 +28,22 @@ def delete_user(username):
     """
     log_debug("---------- 🔥 User deletion process activated ----------")
 
-    base_dir = os.getcwd()
-    user_records_path = os.path.join(base_dir, "user", "data", "user_records.json")
     wg_config_path = get_wireguard_config_path()
 
     log_debug(f"➡️ Starting deletion of user: '{username}'.")
 
-    if not os.path.exists(user_records_path):
-        log_debug(f"❌ User data file not found: {user_records_path}")
-        log_debug("---------- 🔥 User deletion process finished ---------------\n")
-        return "❌ Error: User data file is missing."
-
     try:
-        # Load user data
-        user_data = read_json(user_records_path)
-        log_debug(f"📂 User data successfully loaded.")
-
-        if username not in user_data:
+        # Remove user record from the user database
+        user_info = get_user_store().delete(username)
+        if user_info is None:
             log_debug(f"❌ User '{username}' not found in data.")
             log_debug("---------- 🔥 User deletion process finished ---------------\n")
             return f"❌ User '{username}' does not exist."
 
-        # Remove user record from user_records.json
-        user_info = user_data.pop(username)
-        user_info["removed_at"] = datetime.now().isoformat()
-        write_json(user_records_path, user_data)
-        log_debug(f"📝 User record '{username}' removed from data.")
-
-        # Delete user's configuration file
-        wg_config_file = os.path.join(WG_CONFIG_DIR, f"{username}.conf")
-        if os.path.exists(wg_config_file):
-            os.remove(wg_config_file)
-            log_debug(f"🗑️ User's configuration file '{wg_config_file}' deleted.")
-
-        # Delete user's QR code
-        qr_code_file = os.path.join(QR_CODE_DIR, f"{username}.png")
-        if os.path.exists(qr_code_file):
-            os.remove(qr_code_file)
-            log_debug(f"🗑️ User's QR code '{qr_code_file}' deleted.")
+        # Record the deletion, delete user's configuration file and QR code, release the addresses
+        for kind, path in forget_user(username, user_info):
+            log_debug(f"🗑️ User's {kind} artifact '{path}' deleted.")
+        log_debug(f"📝 User record '{username}' removed from data at {user_info['removed_at']}.")
 
         # Extract user's public key
         public_key = extract_public_key(username, wg_config_path)
@@ -71,18 +52,14 @@ def delete_user(username):
             log_debug("---------- 🔥 User deletion process finished ---------------\n")
             return f"❌ Public key for user '{username}' is missing."
 
-        # Remove user from WireGuard
-        subprocess.run(["sudo", "wg", "set", "wg0", "peer", public_key, "remove"], check=True)
-        log_debug(f"🔐 User '{username}' removed from WireGuard.")
-
         # Update WireGuard configuration
         remove_peer_from_config(public_key, wg_config_path, username)
         log_debug(f"✅ WireGuard configuration successfully updated.")
 
-        # Sync WireGuard
-        sync_command = f'wg syncconf "{SERVER_WG_NIC}" <(wg-quick strip "{SERVER_WG_NIC}")'
-        subprocess.run(sync_command, shell=True, check=True, executable='/bin/bash')
-        print(f"WireGuard synced for interface {SERVER_WG_NIC}")
+        # Remove user from WireGuard (the sync compares the configuration with the
+        # kernel state and issues `wg set <nic> peer <key> remove` for this peer)
+        request_sync(SERVER_WG_NIC, wait=True)
+        log_debug(f"🔐 User '{username}' removed from WireGuard.")
 
         log_debug("---------- 🔥 User deletion process finished ---------------\n")
         return f"✅ User '{username}' successfully deleted."
@@ -91,6 +68,48 @@ def delete_user(username):
         log_debug("---------- 🔥 User deletion process finished ---------------\n")
         return f"❌ Error deleting user '{username}': {str(e)}"
 
+def delete_users(usernames):
+    """
+    Deletes several users with one WireGuard configuration write and one sync.
+    :param usernames: Usernames to delete.
+    :return: Message about the result of the operation.
+    """
+    log_debug("---------- 🔥 Bulk user deletion process activated ----------")
+    wg_config_path = get_wireguard_config_path()
+
+    try:
+        # Remove all peers first; if the change set is invalid, nothing is deleted
+        config = load_wg_config(wg_config_path)
+        changes = ChangeSet(wg_config_path, SERVER_WG_NIC)
+        for username in usernames:
+            if config.peer_by_name(username) is None:
+                log_debug(f"❌ User '{username}' not found in WireGuard configuration.")
+            else:
+                changes.remove_peer(username)
+        changes.apply(sync=False)
+        log_debug(f"✅ WireGuard configuration updated ({changes.applied} block(s) removed).")
+
+        store = get_user_store()
+        deleted = 0
+        for username in usernames:
+            user_info = store.delete(username)
+            if user_info is None:
+                continue
+            forget_user(username, user_info)
+            deleted += 1
+        log_debug(f"📝 {deleted} user record(s) and their data removed.")
+
+        # Remove the peers from WireGuard (one sync for all users)
+        request_sync(SERVER_WG_NIC, wait=True)
+        log_debug(f"🔐 {deleted} user(s) removed from WireGuard.")
+
+        log_debug("---------- 🔥 Bulk user deletion process finished ---------------\n")
+        return f"✅ {deleted} user(s) successfully deleted."
+    except Exception as e:
+        log_debug(f"⚠️ Error deleting users: {str(e)}")
+        log_debug("---------- 🔥 Bulk user deletion process finished ---------------\n")
+        return f"❌ Error deleting users: {str(e)}"
+
 def extract_public_key(username, config_path):
     """
     Extracts the public key of a user from the WireGuard configuration.
@@ -100,17 +119,10 @@ def extract_public_key(username, config_path):
     """
     log_debug(f"🔍 Searching for public key for user '{username}' in {config_path}.")
     try:
-        with open(config_path, "r") as f:
-            lines = f.readlines()
-
-        found_username = False
-        for line in lines:
-            if username in line:
-                found_username = True
-            elif found_username and line.strip().startswith("PublicKey"):
-                public_key = line.split("=", 1)[1].strip()
-                log_debug(f"🔑 Found public key for '{username}': {public_key}")
-                return public_key
+        peer = load_wg_config(config_path).peer_by_name(username)
+        if peer is not None and peer.public_key:
+            log_debug(f"🔑 Found public key for '{username}': {peer.public_key}")
+            return peer.public_key
         log_debug(f"❌ Public key for '{username}' not found.")
         return None
     except Exception as e:
@@ -120,7 +132,6 @@ def extract_public_key(username, config_path):
 def remove_peer_from_config(public_key, config_path, client_name):
     """
     Removes the [Peer] block and associated comment from the WireGuard configuration file.
-    Deletes the comment and 4 lines starting from it.
     :param public_key: User's public key.
     :param config_path: Path to the WireGuard configuration file.
     :param client_name: Client name.
@@ -128,32 +139,10 @@ def remove_peer_from_config(public_key, config_path, client_name):
     log_debug(f"🛠️ Removing configuration for user '{client_name}' from {config_path}.")
 
     try:
-        with open(config_path, "r") as f:
-            lines = f.readlines()
-
-        updated_lines = []
-        skip_lines = 0  # Line skip counter
-
-        for i, line in enumerate(lines):
-            # If client comment is found
-            if line.strip() == f"### Client {client_name}":
-                log_debug(f"📌 Found block for '{client_name}' on line {i}. Removing...")
-                skip_lines = 5  # Skip 5 lines starting from here
-                continue
-
-            # Skip lines related to the removed block
-            if skip_lines > 0:
-                log_debug(f"⏩ Skipping line {i}: {line.strip()}")
-                skip_lines -= 1
-                continue
-
-            # Save remaining lines
-            updated_lines.append(line)
-
-        # Write updated configuration
-        with open(config_path, "w") as f:
-            f.writelines(updated_lines)
-
+        peer = remove_peer(config_path, name=client_name, public_key=public_key)
+        if peer is None:
+            log_debug(f"❌ Block for '{client_name}' not found.")
+            return
         log_debug(f"✅ Configuration for user '{client_name}' removed.")
     except Exception as e:
         log_debug(f"⚠️ Error updating configuration: {str(e)}")
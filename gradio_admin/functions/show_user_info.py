@@ -3,6 +3,11 @@
 
 from gradio_admin.functions.user_records import load_user_records
 from gradio_admin.functions.format_helpers import format_time
+from modules.handshake_updater import convert_handshake_timestamp
+from modules.telemetry_poller import get_telemetry_snapshot
+from modules.traffic_history import get_traffic_history
+from modules.traffic_updater import format_transfer, traffic_totals
+from modules.wg_dump import format_bytes
 
 def show_user_info(username):
     """Displays detailed information about a user."""
@@ -20,8 +25,12 @@ def show_user_info(username):
     created = user_data.get("created_at", "N/A")
     expires = user_data.get("expires_at", "N/A")
     int_ip = user_data.get("allowed_ips", "N/A")
-    total_transfer = user_data.get("total_transfer", "N/A")
-    last_handshake = user_data.get("last_handshake", "N/A")
+    # Traffic and handshake from the latest telemetry sample, if the peer was sampled
+    peers = get_telemetry_snapshot().peers
+    peer = peers.get(user_data.get("public_key"))
+    totals = traffic_totals(user_data, peer)
+    last_handshake = convert_handshake_timestamp(peer.latest_handshake) if peer else user_data.get("last_handshake", "N/A")
+    received, sent = get_traffic_history().bytes_since(user_data.get("public_key", ""), 24 * 3600)
     status = user_data.get("status", "N/A")
     email = user_data.get("email", "N/A")
     subscription_plan = user_data.get("subscription_plan", "N/A")
@@ -34,7 +43,9 @@ def show_user_info(username):
 🌱 Created: {format_time(created)}
 🔥 Expires: {format_time(expires)}
 🌐 Internal IP: {int_ip}
-📊 Total Transfer: {total_transfer}
+📊 Total Transfer: {format_transfer(totals["rx_bytes"], totals["tx_bytes"])}
+🗓️ This Month ({totals["period_start"]}): {format_transfer(totals["period_rx_bytes"], totals["period_tx_bytes"])}
+📈 Last 24 Hours: {format_bytes(received)} received, {format_bytes(sent)} sent
 🤝 Last Handshake: {last_handshake}
 ⚡ Status: {status}
 📜 Subscription Plan: {subscription_plan}
@@ -1,18 +1,23 @@
 #!/usr/bin/env python3
 # gradio_admin/functions/table_helpers.py
 
-import os
-import json
 import pandas as pd  # type: ignore
-from settings import USER_DB_PATH  # Path to the JSON file with user data
+from gradio_admin.functions.user_records import load_user_records
+from modules.telemetry_poller import get_telemetry_snapshot
+from modules.traffic_updater import format_transfer, traffic_totals
 
-def load_data(show_inactive=True):
-    """Loads user data from JSON."""
-    if not os.path.exists(USER_DB_PATH):
-        return []
+def live_transfer(user_info, peers):
+    """
+    Returns the lifetime transfer of a user: the stored byte counters plus
+    the traffic of the latest telemetry sample that is not yet stored.
+    """
+    totals = traffic_totals(user_info, peers.get(user_info.get("public_key")))
+    return format_transfer(totals["rx_bytes"], totals["tx_bytes"])
 
-    with open(USER_DB_PATH, "r") as f:
-        users = json.load(f)
+def load_data(show_inactive=True):
+    """Loads user data from the user database, with traffic from the telemetry poller."""
+    users = load_user_records()
+    peers = get_telemetry_snapshot().peers
 
     table = []
     for username, user_info in users.items():
@@ -20,7 +25,7 @@ def load_data(show_inactive=True):
             continue
         table.append({
             "username": user_info.get("username", "N/A"),
-            "total_transfer": user_info.get("total_transfer", "0.0 KiB"),
+            "total_transfer": live_transfer(user_info, peers),
             "data_limit": user_info.get("data_limit", "100.0 GB"),
             "allowed_ips": user_info.get("allowed_ips", "N/A"),  # Adding IP address
             "status": user_info.get("status", "inactive"),
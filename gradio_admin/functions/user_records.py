@@ -2,19 +2,15 @@
 # gradio_admin/functions/user_records.py
 # Utilities for working with user data in the wg_qr_generator project
 
-import json
-import os
-
-USER_RECORDS_PATH = os.path.join(os.path.dirname(__file__), "../../user/data/user_records.json")
+from modules.user_cache import get_user_records
 
 def load_user_records():
-    """Loads user data from the user_records.json file."""
+    """
+    Loads user data from the shared in-process cache of the user database.
+    The returned mapping and records are read-only snapshots.
+    """
     try:
-        with open(USER_RECORDS_PATH, "r") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        print("[DEBUG] user_records.json not found!")
-        return {}
-    except json.JSONDecodeError as e:
-        print(f"[DEBUG] JSON decode error in user_records.json: {e}")
+        return get_user_records()
+    except Exception as e:
+        print(f"[DEBUG] Failed to load user records: {e}")
         return {}
@@ -17,11 +17,11 @@ def create_user_tab():
     qr_code_display = gr.Image(label="QR Code", visible=False)
 
     def handle_create_user(username, email, telegram_id):
-        result, qr_code_path = create_user(username, email, telegram_id)
+        result, qr_code = create_user(username, email, telegram_id)
         
         # Разделяем успешные и ошибочные сообщения
         if result.startswith("✅"):
-            return result, gr.update(visible=True, value=qr_code_path) if qr_code_path else gr.update(visible=False)
+            return result, gr.update(visible=True, value=qr_code) if qr_code is not None else gr.update(visible=False)
         else:
             return result, gr.update(visible=False)
 
@@ -2,9 +2,9 @@
 # gradio_admin/tabs/manage_user_tab.py
 
 import gradio as gr  # type: ignore
-from gradio_admin.functions.delete_user import delete_user
+from gradio_admin.functions.delete_user import delete_user, delete_users
 from gradio_admin.functions.user_records import load_user_records
-from gradio_admin.functions.block_user import block_user, unblock_user
+from gradio_admin.functions.block_user import block_user, unblock_user, set_users_blocked
 
 # Import the new synchronization function
 from sync import sync_users_from_config_paths
@@ -22,7 +22,14 @@ def manage_user_tab():
         return ["Select a user"] + user_list
 
     def refresh_user_list():
-        return gr.update(choices=get_user_list(), value="Select a user"), "User list updated."
+        return (
+            gr.update(choices=get_user_list(), value="Select a user"),
+            gr.update(choices=get_user_list()[1:], value=[]),
+            "User list updated."
+        )
+
+    def selected_usernames(selected_users):
+        return [selected_user.split(" ")[0] for selected_user in selected_users or []]
 
     def handle_user_deletion(selected_user):
         username = selected_user.split(" ")[0]
@@ -41,6 +48,29 @@ def manage_user_tab():
         success, message = unblock_user(username)
         return gr.update(choices=get_user_list(), value="Select a user"), message
 
+    # Bulk actions: one configuration write and one WireGuard sync for all selected users
+    def handle_bulk_deletion(selected_users):
+        usernames = selected_usernames(selected_users)
+        if not usernames:
+            return gr.update(), gr.update(), "Select at least one user."
+        message = delete_users(usernames)
+        return (
+            gr.update(choices=get_user_list(), value="Select a user"),
+            gr.update(choices=get_user_list()[1:], value=[]),
+            message
+        )
+
+    def handle_bulk_block(selected_users, block):
+        usernames = selected_usernames(selected_users)
+        if not usernames:
+            return gr.update(), gr.update(), "Select at least one user."
+        success, message = set_users_blocked(usernames, block=block)
+        return (
+            gr.update(choices=get_user_list(), value="Select a user"),
+            gr.update(choices=get_user_list()[1:], value=[]),
+            message
+        )
+
     # New function for the "Synchronize" button
     def handle_sync(config_dir_str, qr_dir_str):
         success, log = sync_users_from_config_paths(config_dir_str, qr_dir_str)
@@ -60,6 +90,17 @@ def manage_user_tab():
         block_button = gr.Button("Block User")
         unblock_button = gr.Button("Unblock User")
 
+    # Row with the selection and buttons for bulk actions
+    with gr.Row():
+        bulk_selector = gr.Dropdown(
+            choices=get_user_list()[1:], value=[], multiselect=True, interactive=True,
+            label="Select users for bulk actions"
+        )
+    with gr.Row():
+        bulk_delete_button = gr.Button("Delete Selected")
+        bulk_block_button = gr.Button("Block Selected")
+        bulk_unblock_button = gr.Button("Unblock Selected")
+
     # Field to display the result (deletion, blocking, unblocking)
     with gr.Row():
         result_display = gr.Textbox(label="Result", value="", lines=2, interactive=False)
@@ -74,7 +115,7 @@ def manage_user_tab():
     refresh_button.click(
         fn=refresh_user_list,
         inputs=[],
-        outputs=[user_selector, result_display]
+        outputs=[user_selector, bulk_selector, result_display]
     )
     delete_button.click(
         fn=handle_user_deletion,
@@ -91,6 +132,21 @@ def manage_user_tab():
         inputs=[user_selector],
         outputs=[user_selector, result_display]
     )
+    bulk_delete_button.click(
+        fn=handle_bulk_deletion,
+        inputs=[bulk_selector],
+        outputs=[user_selector, bulk_selector, result_display]
+    )
+    bulk_block_button.click(
+        fn=lambda selected_users: handle_bulk_block(selected_users, True),
+        inputs=[bulk_selector],
+        outputs=[user_selector, bulk_selector, result_display]
+    )
+    bulk_unblock_button.click(
+        fn=lambda selected_users: handle_bulk_block(selected_users, False),
+        inputs=[bulk_selector],
+        outputs=[user_selector, bulk_selector, result_display]
+    )
     sync_button.click(
         fn=handle_sync,
         inputs=[config_dir_input, qr_dir_input],
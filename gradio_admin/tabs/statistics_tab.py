@@ -9,15 +9,14 @@ from gradio_admin.functions.table_helpers import update_table
 from gradio_admin.functions.format_helpers import format_user_info
 from gradio_admin.functions.user_records import load_user_records
 from gradio_admin.functions.show_user_info import show_user_info
-from modules.traffic_updater import update_traffic_data
-from settings import USER_DB_PATH
-from settings import QR_CODE_DIR
+from modules.telemetry_poller import get_telemetry_snapshot
+from modules.artifact_store import get_artifact_store
+from modules.qr_cache import qr_image
 
 def statistics_tab():
     """Creates a statistics tab for WireGuard users."""
-    # Fetch initial data
+    # Fetch initial data (traffic comes from the background telemetry poller, no `wg` call here)
     def get_initial_data():
-        update_traffic_data(USER_DB_PATH)
         table = update_table(True)
         user_list = ["Select a user"] + table["👤 User"].tolist() if not table.empty else ["Select a user"]
         return table, user_list
@@ -26,6 +25,7 @@ def statistics_tab():
 
     with gr.Row():
         gr.Markdown("## Statistics")
+        telemetry_status = gr.Markdown(get_telemetry_snapshot().describe())
 
     # Show inactive checkbox and Refresh button
     with gr.Row():
@@ -70,7 +70,6 @@ def statistics_tab():
 
     # Function to refresh the table and reset data
     def refresh_table(show_inactive):
-        update_traffic_data(USER_DB_PATH)
         table = update_table(show_inactive)
         if table.empty:
             print("[DEBUG] Table is empty after update.")
@@ -79,13 +78,13 @@ def statistics_tab():
         user_list = ["Select a user"] + table["👤 User"].tolist() if not table.empty else ["Select a user"]
         print(f"[DEBUG] User list: {user_list}")
         # Reset user_info_display, user_selector, and qr_code_display
-        return "", table, gr.update(choices=user_list, value="Select a user"), "", None
+        return "", table, gr.update(choices=user_list, value="Select a user"), "", None, get_telemetry_snapshot().describe()
 
     # Refresh table on button click
     refresh_button.click(
         fn=refresh_table,
         inputs=[show_inactive],
-        outputs=[search_input, stats_table, user_selector, user_info_display, qr_code_display]
+        outputs=[search_input, stats_table, user_selector, user_info_display, qr_code_display, telemetry_status]
     )
 
     # Function to search within the table
@@ -107,17 +106,19 @@ def statistics_tab():
         outputs=[stats_table]
     )
 
-    # Function to find a user's QR code
+    # Function to get a user's QR code
     def find_qr_code(username):
         """
-        Finds the path to a user's QR code.
+        Returns a user's QR code, rendered from the client configuration through the QR cache.
         :param username: User's name
-        :return: Path to the QR code file or None if the file is not found.
+        :return: QR code image, path of the stored QR code if there is no configuration, or None.
         """
-        qr_code_file = QR_CODE_DIR / f"{username}.png"
-        if qr_code_file.exists():
-            return str(qr_code_file)
-        return None
+        artifacts = get_artifact_store()
+        config = artifacts.read(username, "config")
+        if config:
+            return qr_image(config.decode("utf-8"))
+        qr_code_file = artifacts.path(username, "qr")
+        return str(qr_code_file) if qr_code_file else None
 
     # Display user information and their QR code
     def display_user_info(selected_user):
@@ -134,10 +135,10 @@ def statistics_tab():
 
         # Retrieve user information
         user_info = show_user_info(selected_user)
-        qr_code_path = find_qr_code(selected_user)
+        qr_code = find_qr_code(selected_user)
         print(f"[DEBUG] User info:\n{user_info}")
-        print(f"[DEBUG] QR Code path for {selected_user}: {qr_code_path}")
-        return user_info, qr_code_path
+        print(f"[DEBUG] QR Code for {selected_user}: {'found' if qr_code is not None else 'not found'}")
+        return user_info, qr_code
 
     user_selector.change(
         fn=display_user_info,
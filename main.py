@@ -4,24 +4,27 @@
 ## Main script for creating WireGuard users
 ##
 ## This script automatically generates configurations for new users,
-## including unique keys, IP address, and QR code. The script calculates the subnet
-## based on the server's IP address (SERVER_WG_IPV4) and restarts the WireGuard interface.
+## including unique keys, IP addresses, and QR code. The client subnets are taken from
+## the [Interface] Address of wg0.conf (IPv4 of any prefix length, plus IPv6 if configured).
 
 import sys
 import os
-import json
-import ipaddress
-from datetime import datetime
+import io
 import settings
 from modules.config import load_params
-from modules.keygen import generate_private_key, generate_public_key, generate_preshared_key
+from modules.key_pool import take_keys
+from modules.qr_cache import get_qr_cache
 from modules.directory_setup import setup_directories
 from modules.client_config import create_client_config
 from modules.main_registration_fields import create_user_record  # Import of the new function
-import subprocess
+from modules.user_store import file_key, get_user_store
+from modules.atomic_io import locked
+from modules.ip_allocator import allocate_ip, client_networks, confirm_allocations, free_ips, ipv6_address
+from modules.artifact_store import get_artifact_store
+from modules.wg_config import load_wg_config
+from modules.wg_changeset import ChangeSet
+from modules.wg_sync import request_sync
 import logging
-import qrcode
-import tempfile
 
 # Logger setup
 logging.basicConfig(
@@ -51,100 +54,54 @@ class EmojiLoggerAdapter(logging.LoggerAdapter):
 
 logger = EmojiLoggerAdapter(logging.getLogger(__name__), {})
 
-def calculate_subnet(server_wg_ipv4, default_subnet="10.66.66.0/24"):
-    """
-    Calculates the subnet based on the WireGuard server's IP address.
-    :param server_wg_ipv4: WireGuard server IP address.
-    :param default_subnet: Default subnet.
-    :return: Subnet in CIDR format (e.g., '10.66.66.0/24').
-    """
-    try:
-        ip = ipaddress.ip_interface(f"{server_wg_ipv4}/24")
-        subnet = str(ip.network)
-        logger.debug(f"Subnet calculated based on SERVER_WG_IPV4: {subnet}")
-        return subnet
-    except ValueError as e:
-        logger.warning(f"Error calculating subnet: {e}. Using default value: {default_subnet}")
-        return default_subnet
-
-def generate_next_ip(config_file, subnet="10.66.66.0/24"):
+def generate_next_ip(config_file, subnet="10.66.66.0/24", reserved=None, server_ip=None):
     """
     Generates the next available IP address in the subnet.
     :param config_file: Path to the WireGuard configuration file.
     :param subnet: Subnet to search for available IPs.
+    :param reserved: Addresses already taken but not yet written (e.g. queued in a ChangeSet).
+    :param server_ip: Server tunnel address (SERVER_WG_IPV4), never handed out.
     :return: Next available IP address.
     """
     logger.debug(f"Searching for a free IP address in subnet {subnet}.")
-    existing_ips = []
-    if os.path.exists(config_file):
-        logger.debug(f"Reading existing IP addresses from file {config_file}.")
-        with open(config_file, "r") as f:
-            for line in f:
-                if line.strip().startswith("AllowedIPs"):
-                    ip = line.split("=")[1].strip().split("/")[0]
-                    existing_ips.append(ip)
-    network = ipaddress.ip_network(subnet)
-    for ip in network.hosts():
-        ip_str = str(ip)
-        if ip_str not in existing_ips and not ip_str.endswith(".0") and not ip_str.endswith(".1") and not ip_str.endswith(".255"):
-            logger.debug(f"Free IP address found: {ip_str}")
-            return ip_str
-    logger.error("No available IP addresses in the specified subnet.")
-    raise ValueError("No available IP addresses in the specified subnet.")
+    try:
+        ip_str = allocate_ip(config_file, subnet, exclude=reserved or (), server_ipv4=server_ip)
+    except ValueError as e:
+        logger.error(str(e))
+        raise
+    logger.debug(f"Free IP address found: {ip_str}")
+    return ip_str
 
 def generate_qr_code(data, output_path):
     """
-    Generates a QR code based on the configuration data.
+    Generates a QR code based on the configuration data (rendered once per configuration, see qr_cache).
     :param data: WireGuard configuration text.
-    :param output_path: Path to save the QR code image.
+    :param output_path: Path or binary stream to save the QR code image (PNG) to.
     """
     logger.debug(f"Generating QR code for data with length {len(data)} characters.")
     try:
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(data)
-        qr.make(fit=True)
-        img = qr.make_image(fill_color="black", back_color="white")
-        img.save(output_path)
-
+        get_qr_cache().write(data, output_path)
     except Exception as e:
         logger.error(f"Error generating QR code: {e}")
         raise
 
-def load_existing_users():
+def find_existing_user(nickname):
     """
-    Loads the list of existing users from the database.
+    Looks up a user in the database by name (case-insensitive).
+    :return: Stored username or None.
     """
-    user_records_path = os.path.join("user", "data", "user_records.json")
-    logger.debug(f"Loading user database from {user_records_path}")
-    if os.path.exists(user_records_path):
-        with open(user_records_path, "r", encoding="utf-8") as file:
-            try:
-                user_data = json.load(file)
-                logger.info(f"Successfully loaded {len(user_data)} users.")
-                return {user.lower(): user_data[user] for user in user_data}  # Normalize names
-            except json.JSONDecodeError as e:
-                logger.warning(f"Error reading database: {e}. Returning an empty database.")
-                return {}
-    logger.warning(f"User database file {user_records_path} not found.")
-    return {}
+    logger.debug(f"Looking up user {nickname} ({settings.USER_DB_BACKEND} backend)")
+    return get_user_store().find("username", nickname)
 
 def is_user_in_server_config(nickname, config_file):
     """
     Checks if the user exists in the server configuration.
     """
-    nickname_lower = nickname.lower()
     logger.debug(f"Checking if user {nickname} exists in configuration {config_file}.")
     try:
-        with open(config_file, "r") as file:
-            for line in file:
-                if nickname_lower in line.lower():
-                    logger.info(f"User {nickname} found in the server configuration.")
-                    return True
+        if load_wg_config(config_file).peer_by_name(nickname) is not None:
+            logger.info(f"User {nickname} found in the server configuration.")
+            return True
     except FileNotFoundError:
         logger.warning(f"Configuration file {config_file} not found.")
     return False
@@ -174,13 +131,111 @@ def restart_wireguard(interface="wg0"):
         logger.error(f"Error restarting WireGuard: {e}")
 '''
 
-def add_user_to_server_config(config_file, nickname, public_key, preshared_key, allowed_ips):
-    with open(config_file, 'a') as file:
-        file.write(f"\n### Client {nickname}\n")
-        file.write(f"[Peer]\n")
-        file.write(f"PublicKey = {public_key}\n")
-        file.write(f"PresharedKey = {preshared_key}\n")
-        file.write(f"AllowedIPs = {allowed_ips}\n")
+def get_server_wg_nic(params_path="/etc/wireguard/params"):
+    """
+    Reads the WireGuard interface name from the params file.
+    :return: SERVER_WG_NIC value.
+    """
+    if not os.path.exists(params_path):
+        raise FileNotFoundError(f"File {params_path} not found.")
+    with open(params_path, "r") as file:
+        for line in file:
+            if line.startswith("SERVER_WG_NIC="):
+                return line.strip().split("=")[1].strip('"')
+    raise ValueError("SERVER_WG_NIC not found in /etc/wireguard/params.")
+
+def prepare_user(nickname, params, config_file, changes, email="N/A", telegram_id="N/A"):
+    """
+    Generates keys, address, client configuration and QR code of a new user
+    and queues its peer in a change set. The caller holds the lock on
+    config_file until the change set is applied. Nothing is stored yet: the
+    configuration and QR code hold the private key, so save_user() writes
+    them only once the peer is in config_file.
+    :param changes: ChangeSet for config_file.
+    :return: Prepared user for save_user().
+    """
+    logger.info(f"{INFO_EMOJI} Starting configuration generation for user: {nickname}")
+
+    # Check for SERVER_PUB_IP
+    server_public_key = params['SERVER_PUB_KEY']
+    if not params.get('SERVER_PUB_IP'):
+        raise ValueError("SERVER_PUB_IP parameter is missing. Check the configuration file.")
+
+    endpoint = f"{params['SERVER_PUB_IP']}:{params['SERVER_PORT']}"
+    dns_servers = f"{params['CLIENT_DNS_1']},{params['CLIENT_DNS_2']}"
+
+    # Pre-generated keys from the key pool (generated here if the pool is empty)
+    private_key, public_key, preshared_key = take_keys()
+    logger.debug(f"{DEBUG_EMOJI} Keys successfully obtained.")
+
+    # Client subnets from the [Interface] Address of wg0.conf (any prefix length, IPv6 if configured)
+    server_ip = params.get('SERVER_WG_IPV4')
+    subnet, ipv6_subnet = client_networks(config_file, server_ip)
+    logger.debug(f"{DEBUG_EMOJI} Subnets being used: {subnet}, {ipv6_subnet or 'no IPv6'}")
+
+    # Generate IP addresses (addresses queued for other new users are taken too)
+    new_ipv4 = generate_next_ip(config_file, str(subnet), reserved=changes.addresses(), server_ip=server_ip)
+    try:
+        new_ipv6 = ipv6_address(new_ipv4, subnet, ipv6_subnet)
+    except ValueError:
+        free_ips([new_ipv4])
+        raise
+    address = f"{new_ipv4}/32,{new_ipv6}/128" if new_ipv6 else f"{new_ipv4}/32"
+    logger.info(f"{INFO_EMOJI} New user IP address: {address}")
+
+    # Queue the peer for the server configuration (its addresses are freed if the creation fails)
+    changes.add_peer(nickname, public_key.decode('utf-8'), preshared_key.decode('utf-8'), address)
+
+    # Generate client configuration
+    client_config = create_client_config(
+        private_key=private_key,
+        address=address,
+        dns_servers=dns_servers,
+        server_public_key=server_public_key,
+        preshared_key=preshared_key,
+        endpoint=endpoint
+    )
+    logger.debug(f"{DEBUG_EMOJI} Client configuration successfully created.")
+
+    qr_image = io.BytesIO()
+    generate_qr_code(client_config, qr_image)
+
+    return {
+        "username": nickname,
+        "address": address,
+        "public_key": public_key.decode('utf-8'),
+        "preshared_key": preshared_key.decode('utf-8'),
+        "email": email,
+        "telegram_id": telegram_id,
+        "config": client_config,
+        "qr": qr_image.getvalue(),
+    }
+
+def save_user(prepared):
+    """
+    Saves the configuration and QR code of a user prepared by prepare_user()
+    in the artifact store and creates its record. Called once the peer is
+    written to the server configuration.
+    :return: (user record, config path, QR code path).
+    """
+    nickname = prepared["username"]
+    artifacts = get_artifact_store()
+    config_path = str(artifacts.put(nickname, "config", prepared["config"]))
+    logger.info(f"{INFO_EMOJI} User configuration saved to {config_path}")
+    qr_path = str(artifacts.put(nickname, "qr", prepared["qr"]))
+
+    # Create user record
+    user_record = create_user_record(
+        username=nickname,
+        address=prepared["address"],
+        public_key=prepared["public_key"],
+        preshared_key=prepared["preshared_key"],
+        qr_code_path=qr_path,
+        email=prepared["email"],
+        telegram_id=prepared["telegram_id"]
+    )
+    logger.debug(f"{DEBUG_EMOJI} User record created.")
+    return user_record, config_path, qr_path
 
 def generate_config(nickname, params, config_file, email="N/A", telegram_id="N/A"):
     """
@@ -188,110 +243,61 @@ def generate_config(nickname, params, config_file, email="N/A", telegram_id="N/A
     """
     logger.info("+--------- Process 🌱 User Creation Activated ---------+")
     try:
-        logger.info(f"{INFO_EMOJI} Starting configuration generation for user: {nickname}")
-        
-        # Check for SERVER_PUB_IP
-        server_public_key = params['SERVER_PUB_KEY']
-        if not params.get('SERVER_PUB_IP'):
-            raise ValueError("SERVER_PUB_IP parameter is missing. Check the configuration file.")
-        
-        endpoint = f"{params['SERVER_PUB_IP']}:{params['SERVER_PORT']}"
-        dns_servers = f"{params['CLIENT_DNS_1']},{params['CLIENT_DNS_2']}"
-
-        private_key = generate_private_key()
-        logger.debug(f"{DEBUG_EMOJI} Private key successfully generated.")
-        public_key = generate_public_key(private_key)
-        logger.debug(f"{DEBUG_EMOJI} Public key successfully generated.")
-        preshared_key = generate_preshared_key()
-        logger.debug(f"{DEBUG_EMOJI} Preshared key successfully generated.")
-
-        # Calculate subnet
-        subnet = calculate_subnet(params.get('SERVER_WG_IPV4', '10.66.66.1'))
-        logger.debug(f"{DEBUG_EMOJI} Subnet being used: {subnet}")
-
-        # Generate IP address
-        new_ipv4 = generate_next_ip(config_file, subnet)
-        logger.info(f"{INFO_EMOJI} New user IP address: {new_ipv4}")
-
-        # Generate client configuration
-        client_config = create_client_config(
-            private_key=private_key,
-            address=new_ipv4,
-            dns_servers=dns_servers,
-            server_public_key=server_public_key,
-            preshared_key=preshared_key,
-            endpoint=endpoint
-        )
-        logger.debug(f"{DEBUG_EMOJI} Client configuration successfully created.")
-
-        config_path = os.path.join(settings.WG_CONFIG_DIR, f"{nickname}.conf")
-        qr_path = os.path.join(settings.QR_CODE_DIR, f"{nickname}.png")
-
-        # Save configuration
-        os.makedirs(settings.WG_CONFIG_DIR, exist_ok=True)
-        with open(config_path, "w") as file:
-            file.write(client_config)
-        logger.info(f"{INFO_EMOJI} User configuration saved to {config_path}")
-
-        # Generate QR code
-        generate_qr_code(client_config, qr_path)
-
-        # Add user to server configuration
-        add_user_to_server_config(config_file, nickname, public_key.decode('utf-8'), preshared_key.decode('utf-8'), new_ipv4)
-        logger.info(f"{INFO_EMOJI} User successfully added to the server configuration.")
-
-        # Add user record
-        user_record = create_user_record(
-            username=nickname,
-            address=new_ipv4,
-            public_key=public_key.decode('utf-8'),
-            preshared_key=preshared_key.decode('utf-8'),
-            qr_code_path=qr_path,
-            email=email,
-            telegram_id=telegram_id
-        )
-        logger.debug(f"{DEBUG_EMOJI} User record created.")
-
-        # Save to database
-        user_records_path = os.path.join("user", "data", "user_records.json")
-        os.makedirs(os.path.dirname(user_records_path), exist_ok=True)
-        with open(user_records_path, "r+", encoding="utf-8") as file:
-            try:
-                user_data = json.load(file)
-                logger.debug(f"{DEBUG_EMOJI} Loaded existing user records.")
-            except json.JSONDecodeError:
-                user_data = {}
-                logger.warning(f"{WARNING_EMOJI} Error reading user database, a new one will be created.")
-            user_data[nickname] = user_record
-            file.seek(0)
-            json.dump(user_data, file, indent=4)
-            file.truncate()
-        logger.info(f"{INFO_EMOJI} User data for {nickname} successfully added to {user_records_path}")
-
-        # Sync WireGuard
-        params_path = "/etc/wireguard/params"
-        if os.path.exists(params_path):
-            with open(params_path, "r") as file:
-                for line in file:
-                    if line.startswith("SERVER_WG_NIC="):
-                        server_wg_nic = line.strip().split("=")[1].strip('"')
-                        break
-                else:
-                    raise ValueError("SERVER_WG_NIC not found in /etc/wireguard/params.")
-        else:
-            raise FileNotFoundError(f"File {params_path} not found.")
-
-        sync_command = f'wg syncconf "{server_wg_nic}" <(wg-quick strip "{server_wg_nic}")'
-        subprocess.run(sync_command, shell=True, check=True, executable='/bin/bash')
-        logger.info(f"WireGuard synchronized for interface {server_wg_nic}")
-
+        paths = generate_configs([(nickname, email, telegram_id)], params, config_file)
         logger.info("+--------- Process 🌱 User Creation Completed --------------+\n")
-        return config_path, qr_path
+        return paths[nickname]
     except Exception as e:
         logger.error(f"Execution error: {e}")
         logger.info("+--------- Process 🌱 User Creation Completed --------------+\n")
         raise
 
+def generate_configs(users, params, config_file):
+    """
+    Creates several users with one server configuration write and one WireGuard sync.
+    :param users: List of (nickname, email, telegram_id).
+    :param params: Server parameters.
+    :param config_file: Path to the WireGuard configuration file.
+    :return: {nickname: (config path, QR code path)}.
+    :raises ChangeSetError: If a user conflicts with the configuration; nothing is added then.
+    """
+    server_wg_nic = get_server_wg_nic()
+    prepared = []
+    records = {}
+    paths = {}
+
+    # The server configuration stays locked from picking the IPs until the peers are added,
+    # so concurrent user creations cannot get the same address
+    with locked(config_file):
+        changes = ChangeSet(config_file, server_wg_nic)
+        try:
+            for nickname, email, telegram_id in users:
+                prepared.append(prepare_user(nickname, params, config_file, changes, email, telegram_id))
+            written = file_key(config_file)
+            changes.apply(sync=False)
+        except Exception:
+            # Nothing was written: the allocated addresses go back to the pool
+            free_ips(changes.addresses())
+            raise
+        confirm_allocations(config_file, written)
+    logger.info(f"{INFO_EMOJI} {len(prepared)} user(s) successfully added to the server configuration.")
+
+    # Client configurations and QR codes are stored only for users that were added
+    for user in prepared:
+        user_record, config_path, qr_path = save_user(user)
+        records[user["username"]] = user_record
+        paths[user["username"]] = (config_path, qr_path)
+
+    # Save to database
+    store = get_user_store()
+    for nickname, user_record in records.items():
+        store.put(nickname, user_record)
+    logger.info(f"{INFO_EMOJI} User data for {', '.join(records)} successfully added to the user database")
+
+    # Sync WireGuard (debounced; flushed at the latest when the process exits)
+    request_sync(server_wg_nic)
+    logger.info(f"WireGuard sync requested for interface {server_wg_nic}")
+    return paths
+
 if __name__ == "__main__":
     if len(sys.argv) < 2:
         logger.error("Not enough arguments. Usage: python3 main.py <nickname> [email] [telegram_id]")
@@ -311,8 +317,7 @@ if __name__ == "__main__":
         params = load_params(params_file)
 
         logger.info("Checking for existing user.")
-        existing_users = load_existing_users()
-        if nickname.lower() in existing_users:
+        if find_existing_user(nickname):
             logger.error(f"User with name '{nickname}' already exists in the database.")
             sys.exit(1)
 
@@ -70,6 +70,7 @@ def show_main_menu():
         print(f"  g. 🌐  Open Gradio Admin Panel")
         print(f"  u. 👤  Manage Users")
         print(f" sy. 📡  Synchronize Users")
+        print(f" rc. 🔁  Reconcile Users with WireGuard")
         print(f" du. 🧹  Clear User Database")
         display_message_slowly(f" ------------------------------------------", print_speed=local_print_speed, indent=False)
         if wireguard_installed:
@@ -135,6 +136,11 @@ def show_main_menu():
         elif choice == "sy":
             from modules.sync import sync_users_from_config
             sync_users_from_config()
+        elif choice == "rc":
+            from modules.reconciler import reconcile
+            plan = reconcile(dry_run=True)
+            if len(plan) and input_with_history(" Apply these changes? (y/n): ").strip().lower() == "y":
+                reconcile()
         elif choice == "dg":
             from modules.debugger import run_diagnostics
             run_diagnostics()
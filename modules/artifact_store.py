@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# modules/artifact_store.py
+# ===========================================
+# Content-addressed storage for client configs and QR codes
+# ===========================================
+# Client configurations and QR codes used to live in two flat directories
+# (<username>.conf, <username>.png), which get slow to list and probe with
+# tens of thousands of users. The artifact store keeps them as blobs named
+# after the SHA-256 of their content, fanned out over two levels of
+# subdirectories:
+#     user/data/artifacts/objects/ab/cd/abcd...ef.png
+# Identical blobs are stored once. A manifest (SQLite) maps
+# (username, kind) to a blob, so looking up a user's file is an index
+# query instead of a filesystem probe. A blob is removed when no manifest
+# entry refers to it any more.
+#
+# Kinds: "config" (client .conf) and "qr" (QR code image).
+#
+# On first use, files from the old flat directories are imported once.
+#
+# Example usage:
+# ---------------------
+# from modules.artifact_store import get_artifact_store
+#
+# store = get_artifact_store()
+# store.put("alice", "config", config_text.encode(), ".conf")
+# print(store.path("alice", "qr"))
+#
+# Manual import of the flat directories:
+#   python3 -m modules.artifact_store migrate
+
+import hashlib
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+from pathlib import Path
+
+import settings
+
+ARTIFACT_KINDS = {"config": ".conf", "qr": ".png"}
+
+
+class ArtifactStore:
+    """Content-addressed blob directory with a username -> artifact manifest."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS artifacts (
+            username TEXT NOT NULL,
+            kind     TEXT NOT NULL,
+            digest   TEXT NOT NULL,
+            ext      TEXT NOT NULL,
+            PRIMARY KEY (username, kind)
+        ) WITHOUT ROWID
+    """
+
+    def __init__(self, root, timeout=30.0):
+        self.root = Path(root)
+        self.objects_dir = self.root / "objects"
+        self.manifest_path = self.root / "manifest.sqlite3"
+        self.timeout = timeout
+        self._local = threading.local()
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        conn = self._connect()
+        conn.execute(self.SCHEMA)
+        conn.execute("CREATE INDEX IF NOT EXISTS artifacts_digest ON artifacts (digest)")
+
+    def _connect(self):
+        """Returns the manifest connection of the current thread."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.manifest_path), timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def blob_path(self, digest, ext):
+        """Returns the location of a blob: objects/<2 hex>/<2 hex>/<digest><ext>."""
+        return self.objects_dir / digest[:2] / digest[2:4] / f"{digest}{ext}"
+
+    def _write_blob(self, data, ext):
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.blob_path(digest, ext)
+        if path.exists():
+            return digest  # Deduplicated
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Blobs never change once written: temp file + rename is enough, and
+        # two writers of the same blob write identical content
+        fd, tmp_path = tempfile.mkstemp(prefix=".blob.", dir=path.parent)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                if settings.FSYNC_WRITES:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.chmod(tmp_path, 0o600)  # Client configs contain private keys
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return digest
+
+    def put(self, username, kind, data, ext=None):
+        """
+        Stores an artifact and points the user's manifest entry at it.
+        :param username: Owner of the artifact.
+        :param kind: "config" or "qr".
+        :param data: Content (bytes or str).
+        :param ext: File extension; defaults to the usual one for the kind.
+        :return: Path of the stored blob.
+        """
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        ext = ext or ARTIFACT_KINDS[kind]
+        digest = self._write_blob(data, ext)
+
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            old = conn.execute(
+                "SELECT digest, ext FROM artifacts WHERE username = ? AND kind = ?", (username, kind)
+            ).fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO artifacts (username, kind, digest, ext) VALUES (?, ?, ?, ?)",
+                (username, kind, digest, ext),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if old is not None and tuple(old) != (digest, ext):
+            self._collect(*old)
+        return self.blob_path(digest, ext)
+
+    def put_file(self, username, kind, source_path):
+        """Stores a copy of an existing file, keeping its extension."""
+        source_path = Path(source_path)
+        return self.put(username, kind, source_path.read_bytes(), source_path.suffix or None)
+
+    def path(self, username, kind):
+        """
+        Resolves a user's artifact through the manifest (no filesystem access).
+        :return: Path of the blob or None if the user has no such artifact.
+        """
+        row = self._connect().execute(
+            "SELECT digest, ext FROM artifacts WHERE username = ? AND kind = ?", (username, kind)
+        ).fetchone()
+        return self.blob_path(*row) if row else None
+
+    def paths(self, kind):
+        """Returns {username: path} for all artifacts of one kind."""
+        rows = self._connect().execute(
+            "SELECT username, digest, ext FROM artifacts WHERE kind = ?", (kind,)
+        )
+        return {username: self.blob_path(digest, ext) for username, digest, ext in rows}
+
+    def read(self, username, kind):
+        """Returns the content of an artifact or None."""
+        path = self.path(username, kind)
+        try:
+            return path.read_bytes() if path else None
+        except FileNotFoundError:
+            return None
+
+    def remove(self, username, kind=None):
+        """
+        Drops the manifest entries of a user (all kinds by default) and
+        deletes blobs that are no longer referenced.
+        :return: List of removed manifest entries as (kind, path).
+        """
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if kind is None:
+                rows = conn.execute(
+                    "SELECT kind, digest, ext FROM artifacts WHERE username = ?", (username,)
+                ).fetchall()
+                conn.execute("DELETE FROM artifacts WHERE username = ?", (username,))
+            else:
+                rows = conn.execute(
+                    "SELECT kind, digest, ext FROM artifacts WHERE username = ? AND kind = ?", (username, kind)
+                ).fetchall()
+                conn.execute("DELETE FROM artifacts WHERE username = ? AND kind = ?", (username, kind))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        for _, digest, ext in rows:
+            self._collect(digest, ext)
+        return [(row_kind, self.blob_path(digest, ext)) for row_kind, digest, ext in rows]
+
+    def _collect(self, digest, ext):
+        """Deletes a blob once no manifest entry refers to it."""
+        in_use = self._connect().execute(
+            "SELECT 1 FROM artifacts WHERE digest = ? AND ext = ? LIMIT 1", (digest, ext)
+        ).fetchone()
+        if in_use is None:
+            try:
+                self.blob_path(digest, ext).unlink()
+            except FileNotFoundError:
+                pass
+
+    def clear(self, kind=None):
+        """Removes all artifacts (of one kind, if given)."""
+        conn = self._connect()
+        if kind is None:
+            usernames = [row[0] for row in conn.execute("SELECT DISTINCT username FROM artifacts")]
+        else:
+            usernames = [row[0] for row in conn.execute("SELECT username FROM artifacts WHERE kind = ?", (kind,))]
+        for username in usernames:
+            self.remove(username, kind)
+
+    def count(self, kind=None):
+        """Returns the number of manifest entries."""
+        if kind is None:
+            return self._connect().execute("SELECT COUNT(*) FROM artifacts").fetchone()[0]
+        return self._connect().execute("SELECT COUNT(*) FROM artifacts WHERE kind = ?", (kind,)).fetchone()[0]
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def import_flat_directories(store, config_dir, qr_dir):
+    """
+    Imports <username>.conf and <username>.png files from the old flat directories.
+    Users that already have an artifact of that kind are skipped; the files are kept.
+    :return: Number of imported files.
+    """
+    imported = 0
+    for kind, directory in (("config", config_dir), ("qr", qr_dir)):
+        if not os.path.isdir(directory):
+            continue
+        known = store.paths(kind)
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                username, ext = os.path.splitext(entry.name)
+                if not entry.is_file() or ext != ARTIFACT_KINDS[kind] or username in known:
+                    continue
+                store.put_file(username, kind, entry.path)
+                imported += 1
+    return imported
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_artifact_store():
+    """Returns the process-wide artifact store, importing the flat directories on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            first_use = not (Path(settings.ARTIFACT_DIR) / "manifest.sqlite3").exists()
+            _store = ArtifactStore(settings.ARTIFACT_DIR)
+            if first_use:
+                imported = import_flat_directories(_store, settings.WG_CONFIG_DIR, settings.QR_CODE_DIR)
+                if imported:
+                    print(f"✅ Imported {imported} client configs and QR codes into {settings.ARTIFACT_DIR}")
+        return _store
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "migrate":
+        store = get_artifact_store()
+        count = import_flat_directories(store, settings.WG_CONFIG_DIR, settings.QR_CODE_DIR)
+        print(f"✅ Imported {count} files into {settings.ARTIFACT_DIR}")
+    else:
+        print("Usage: python3 -m modules.artifact_store migrate")
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# modules/atomic_io.py
+# ===========================================
+# Locked, crash-safe file writes
+# ===========================================
+# The menu, the Gradio server and cron-driven updaters can modify the same
+# files (user database, /etc/wireguard/wg0.conf) at the same time. All of
+# them go through this module:
+# - fcntl advisory locks on a "<file>.lock" side file: shared for readers,
+#   exclusive for writers. The side file is locked instead of the data file
+#   because an atomic rename replaces the data file's inode;
+# - writes go to a temporary file in the same directory, which is then
+#   renamed over the target with os.replace(), so a reader sees either the
+#   old or the new content, never a truncated file;
+# - splice_bytes() replaces a byte range of a file the same way, copying the
+#   unchanged parts in the kernel, for small edits of large files;
+# - with settings.FSYNC_WRITES the data (and the directory entry) are
+#   flushed to disk before the call returns.
+#
+# Locks are re-entrant within a thread, so a read-modify-write cycle can hold
+# the exclusive lock and still call read_text()/write_text() inside it.
+#
+# Example usage:
+# ---------------------
+# from modules.atomic_io import locked, read_text, write_text
+#
+# with locked(settings.SERVER_CONFIG_FILE):
+#     config = read_text(settings.SERVER_CONFIG_FILE)
+#     write_text(settings.SERVER_CONFIG_FILE, config.replace("old", "new"))
+
+import fcntl
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import settings
+
+_held = threading.local()
+
+
+def lock_path(path):
+    """Returns the side file used to lock the given file."""
+    path = Path(path)
+    return path.with_name(f"{path.name}.lock")
+
+
+@contextmanager
+def locked(path, exclusive=True):
+    """
+    Holds an advisory lock on a file for the duration of the block.
+    :param path: File to lock (the lock itself is taken on "<path>.lock").
+    :param exclusive: True for writers, False for readers.
+    """
+    key = str(lock_path(path))
+    held = getattr(_held, "locks", None)
+    if held is None:
+        held = _held.locks = {}
+
+    if key in held:
+        fd, is_exclusive, depth = held[key]
+        if exclusive and not is_exclusive:
+            # Upgrading in place would let another writer in between
+            raise RuntimeError(f"Cannot upgrade a shared lock to exclusive: {path}")
+        held[key] = (fd, is_exclusive, depth + 1)
+        try:
+            yield
+        finally:
+            fd, is_exclusive, depth = held[key]
+            held[key] = (fd, is_exclusive, depth - 1)
+        return
+
+    if exclusive:
+        Path(key).parent.mkdir(parents=True, exist_ok=True)
+    try:
+        fd = os.open(key, os.O_RDWR | os.O_CREAT, 0o600)
+    except (FileNotFoundError, PermissionError):
+        if exclusive:
+            raise
+        # Read-only access to the directory (e.g. wg0.conf as a regular user)
+        yield
+        return
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        held[key] = (fd, exclusive, 1)
+        try:
+            yield
+        finally:
+            del held[key]
+            fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
+
+
+def _fsync_dir(directory):
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _replace_file(path, write, fsync=None):
+    """
+    Builds a new version of a file in a temporary file and renames it over the target.
+    The permissions of an existing file are kept (wg0.conf must stay 0600).
+    :param path: Target file.
+    :param write: Callable receiving the unbuffered temporary file object.
+    :param fsync: Flush to disk before returning; defaults to settings.FSYNC_WRITES.
+    """
+    path = Path(path)
+    if fsync is None:
+        fsync = settings.FSYNC_WRITES
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    with locked(path):
+        fd, tmp_path = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+        try:
+            with os.fdopen(fd, "wb", buffering=0) as f:
+                write(f)
+                if fsync:
+                    os.fsync(f.fileno())
+            try:
+                os.chmod(tmp_path, os.stat(path).st_mode & 0o7777)
+            except FileNotFoundError:
+                os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        if fsync:
+            _fsync_dir(path.parent)
+
+
+def _write_all(f, data):
+    view = memoryview(data)
+    while view:
+        view = view[f.write(view):]
+
+
+def _copy_range(src_fd, dst, offset, count):
+    """Copies count bytes at offset of src_fd to the current position of dst (in the kernel if possible)."""
+    copy_file_range = getattr(os, "copy_file_range", None)
+    while count > 0:
+        if copy_file_range is not None:
+            try:
+                copied = copy_file_range(src_fd, dst.fileno(), count, offset)
+            except OSError:
+                copy_file_range = None  # Different filesystems, old kernel, ...
+                continue
+            if copied == 0:
+                break
+        else:
+            chunk = os.pread(src_fd, min(count, 1 << 20), offset)
+            if not chunk:
+                break
+            _write_all(dst, chunk)
+            copied = len(chunk)
+        offset += copied
+        count -= copied
+
+
+def write_bytes(path, data, fsync=None):
+    """
+    Replaces a file atomically under an exclusive lock.
+    :param path: Target file.
+    :param data: New content (bytes).
+    :param fsync: Flush to disk before returning; defaults to settings.FSYNC_WRITES.
+    """
+    _replace_file(path, lambda f: _write_all(f, data), fsync=fsync)
+
+
+def splice_bytes(path, start, end, data, fsync=None):
+    """
+    Atomically replaces the bytes [start, end) of a file with data.
+    Only data passes through Python; the unchanged head and tail are copied
+    by the kernel (copy_file_range), so the cost of an edit depends on the
+    size of the edited part, not of the file.
+    :param path: Target file (must exist).
+    :param start: Offset of the first replaced byte.
+    :param end: Offset after the last replaced byte (start for a pure insert).
+    :param data: Replacement bytes.
+    :param fsync: Flush to disk before returning; defaults to settings.FSYNC_WRITES.
+    """
+    with locked(path):
+        src_fd = os.open(path, os.O_RDONLY)
+        try:
+            size = os.fstat(src_fd).st_size
+            if not 0 <= start <= end <= size:
+                raise ValueError(f"Invalid byte range {start}-{end} for {path} ({size} bytes)")
+
+            def write(f):
+                _copy_range(src_fd, f, 0, start)
+                _write_all(f, data)
+                _copy_range(src_fd, f, end, size - end)
+
+            _replace_file(path, write, fsync=fsync)
+        finally:
+            os.close(src_fd)
+
+
+def write_text(path, text, fsync=None):
+    """Replaces a text file atomically (see write_bytes)."""
+    write_bytes(path, text.encode("utf-8"), fsync=fsync)
+
+
+def append_text(path, text, fsync=None):
+    """Appends text to a file with an atomic rewrite, so readers never see a partial append."""
+    with locked(path):
+        try:
+            size = os.stat(path).st_size
+        except FileNotFoundError:
+            write_text(path, text, fsync=fsync)
+            return
+        splice_bytes(path, size, size, text.encode("utf-8"), fsync=fsync)
+
+
+def read_bytes(path):
+    """Reads a file under a shared lock."""
+    with locked(path, exclusive=False):
+        with open(path, "rb") as f:
+            return f.read()
+
+
+def read_text(path):
+    """Reads a text file under a shared lock."""
+    with locked(path, exclusive=False):
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+
+
+def read_json(path, default=None):
+    """
+    Reads a JSON file under a shared lock.
+    :return: Parsed data or default if the file does not exist.
+    """
+    try:
+        return json.loads(read_text(path))
+    except FileNotFoundError:
+        return default
+
+
+def write_json(path, data, fsync=None, **dump_kwargs):
+    """Writes JSON atomically; dump_kwargs default to the project's indent=4 format."""
+    dump_kwargs.setdefault("indent", 4)
+    dump_kwargs.setdefault("ensure_ascii", False)
+    write_text(path, json.dumps(data, **dump_kwargs), fsync=fsync)
@@ -5,11 +5,13 @@
 import os
 import json
 import subprocess
-from datetime import datetime
+from settings import SERVER_WG_NIC
+from modules.handshake_updater import convert_handshake_timestamp
+from modules.user_store import get_user_store
+from modules.wg_dump import format_bytes, read_wg_dump
 
 # Paths to data
 WG_USERS_JSON = os.path.join("logs", "wg_users.json")
-USER_RECORDS_JSON = os.path.join("user", "data", "user_records.json")
 
 def load_json(filepath):
     """Loads data from a JSON file."""
@@ -20,35 +22,28 @@ def load_json(filepath):
         return {}
 
 def get_wg_show_data():
-    """Retrieves data from the 'wg show' command."""
+    """Retrieves peer data with a single `wg show <nic> dump` call."""
     try:
-        output = subprocess.check_output(["wg", "show"], text=True)
-        peers = {}
-        current_peer = None
-
-        for line in output.splitlines():
-            if line.startswith("peer:"):
-                current_peer = line.split(":")[1].strip()
-                peers[current_peer] = {"peer": current_peer}  # Save peer
-            elif current_peer:
-                if "allowed ips:" in line:
-                    peers[current_peer]["allowed_ips"] = line.split(":")[1].strip()
-                elif "endpoint:" in line:
-                    peers[current_peer]["endpoint"] = line.split(":")[1].strip()
-                elif "latest handshake:" in line:
-                    peers[current_peer]["last_handshake"] = line.split(":")[1].strip()
-                elif "transfer:" in line:
-                    transfer_data = line.split(":")[1].strip().split(", ")
-                    peers[current_peer]["uploaded"] = transfer_data[0]
-                    peers[current_peer]["downloaded"] = transfer_data[1]
-
-        return peers
-    except subprocess.CalledProcessError:
+        _, peers = read_wg_dump(SERVER_WG_NIC)
+    except (OSError, subprocess.CalledProcessError, ValueError):
         return {}
 
+    return {
+        public_key: {
+            "peer": public_key,
+            "allowed_ips": ", ".join(peer.allowed_ips),
+            "endpoint": peer.endpoint or "N/A",
+            "last_handshake": convert_handshake_timestamp(peer.latest_handshake),
+            "uploaded": format_bytes(peer.transfer_rx),
+            "downloaded": format_bytes(peer.transfer_tx),
+        }
+        for public_key, peer in peers.items()
+    }
+
 def sync_user_data():
     """Synchronizes data from all sources."""
-    user_records = load_json(USER_RECORDS_JSON)
+    store = get_user_store()
+    user_records = store.all()
     wg_show_data = get_wg_show_data()
 
     synced_data = {}
@@ -73,34 +68,19 @@ def sync_user_data():
             "status": "active" if wg_data else "inactive",
         }
 
-    # Check for new users from wg show that are not in user_records
+    # Peers of wg show without a user record are not turned into users;
+    # the reconciler reports them (python3 -m modules.reconciler --dry-run)
+    known_peers = {record.get("peer") for record in synced_data.values()}
     for peer, peer_data in wg_show_data.items():
-        if not any(record.get("peer") == peer for record in synced_data.values()):
-            new_user_id = f"unknown_{peer}"
-            print(f"⚠️ New user from wg show: {peer_data.get('allowed_ips')}")
-            synced_data[new_user_id] = {
-                "peer": peer,
-                "username": new_user_id,
-                "email": "N/A",
-                "telegram_id": "N/A",
-                "allowed_ips": peer_data.get("allowed_ips", "N/A"),
-                "endpoint": peer_data.get("endpoint", "N/A"),
-                "last_handshake": peer_data.get("last_handshake", "N/A"),
-                "uploaded": peer_data.get("uploaded", "N/A"),
-                "downloaded": peer_data.get("downloaded", "N/A"),
-                "created": datetime.utcnow().isoformat(),
-                "expiry": "N/A",
-                "qr_code_path": "N/A",
-                "status": "active",
-            }
+        if peer not in known_peers:
+            print(f"⚠️ Peer without a user record in wg show: {peer_data.get('allowed_ips')}")
 
     # Save data
-    with open(USER_RECORDS_JSON, "w") as user_records_file:
-        json.dump(synced_data, user_records_file, indent=4)
+    store.replace_all(synced_data)
     with open(WG_USERS_JSON, "w") as wg_users_file:
         json.dump(synced_data, wg_users_file, indent=4)
 
-    print(f"✅ Data successfully synchronized. Files updated:\n - {WG_USERS_JSON}\n - {USER_RECORDS_JSON}")
+    print(f"✅ Data successfully synchronized. Updated:\n - {WG_USERS_JSON}\n - user database")
     return synced_data
 
 if __name__ == "__main__":
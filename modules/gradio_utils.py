@@ -5,13 +5,21 @@ import os
 import subprocess
 from gradio_admin.main_interface import admin_interface
 from modules.firewall_utils import open_firewalld_port, close_firewalld_port, handle_port_conflict, get_external_ip
+from modules.reconciler import start_reconciler
+from modules.key_pool import start_key_pool_refiller
 
 def run_gradio_admin_interface(port):
     """Launches the Gradio interface on the specified port."""
     handle_port_conflict(port)
     
     open_firewalld_port(port)
+    reconciler = start_reconciler()  # Periodic user database / wg0.conf / interface check
+    key_pool = start_key_pool_refiller()  # Keeps pre-generated keys ready for new users
     print(f"\n  🌐  Launching Gradio:  http://{get_external_ip()}:{port}")
     admin_interface.launch(server_name="0.0.0.0", server_port=port, share=False)
     print(f"")
+    if reconciler:
+        reconciler.set()
+    if key_pool:
+        key_pool.set()
     close_firewalld_port(port)
@@ -1,11 +1,10 @@
 #!/usr/bin/env python3
 # modules/handshake_updater.py
 
-import os
-import json
-import subprocess
 from datetime import datetime
 from settings import USER_DB_PATH, SERVER_WG_NIC
+from modules.user_store import get_user_store
+from modules.wg_dump import read_wg_dump
 
 def get_latest_handshakes(interface):
     """
@@ -14,18 +13,11 @@ def get_latest_handshakes(interface):
     :return: Dictionary {public_key: last_handshake}.
     """
     try:
-        output = subprocess.check_output(["wg", "show", interface, "latest-handshakes"], text=True)
-        lines = output.strip().split("\n")
-        handshakes = {}
-
-        for line in lines:
-            parts = line.split()
-            if len(parts) >= 2:
-                public_key = parts[0]
-                timestamp = int(parts[1])
-                handshakes[public_key] = convert_handshake_timestamp(timestamp)
-
-        return handshakes
+        _, peers = read_wg_dump(interface)
+        return {
+            public_key: convert_handshake_timestamp(peer.latest_handshake)
+            for public_key, peer in peers.items()
+        }
     except Exception as e:
         print(f"Error while retrieving handshake information: {e}")
         return {}
@@ -40,28 +32,38 @@ def convert_handshake_timestamp(timestamp):
         return "Never"
     return datetime.utcfromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S UTC")
 
-def update_handshakes(user_records_path, interface):
+def update_handshakes(user_records_path, interface, batch=None, peers=None, user_records=None, users_by_key=None):
     """
-    Updates information about the latest handshakes of users in user_records.json.
-    :param user_records_path: Path to the user_records.json file.
+    Updates information about the latest handshakes of users in the user database.
+    :param user_records_path: Kept for compatibility; the configured user store is used.
     :param interface: Name of the WireGuard interface.
+    :param batch: UserBatch to queue the changes in; by default they are written at the end of the call.
+    :param peers: {public_key: WgPeerStatus} already read with read_wg_dump(); read here if omitted.
+    :param user_records: All user records already read with store.all(); read here if omitted.
+    :param users_by_key: store.index_map("public_key") already read; read here if omitted.
     """
-    if not os.path.exists(user_records_path):
-        print(f"File {user_records_path} not found.")
-        return
-
-    with open(user_records_path, "r") as f:
-        user_records = json.load(f)
+    store = get_user_store()
+    if batch is None:
+        with store.batch() as batch:
+            return update_handshakes(user_records_path, interface, batch, peers, user_records, users_by_key)
 
-    handshakes = get_latest_handshakes(interface)
+    if user_records is None:
+        user_records = store.all()
+    if users_by_key is None:
+        users_by_key = store.index_map("public_key")
 
-    for username, user_data in user_records.items():
-        public_key = user_data.get("public_key")
-        if public_key in handshakes:
-            user_data["last_handshake"] = handshakes[public_key]
+    if peers is None:
+        handshakes = get_latest_handshakes(interface)
+    else:
+        handshakes = {
+            public_key: convert_handshake_timestamp(peer.latest_handshake)
+            for public_key, peer in peers.items()
+        }
 
-    with open(user_records_path, "w") as f:
-        json.dump(user_records, f, indent=4)
+    for public_key, last_handshake in handshakes.items():
+        username = users_by_key.get(public_key)
+        if username in user_records and user_records[username].get("last_handshake") != last_handshake:
+            batch.update(username, {"last_handshake": last_handshake})
 
     print("Latest handshake information successfully updated.")
 
@@ -131,19 +131,20 @@ def generate_keypair():
     return private_key, public_key
 
 def generate_wg_config(subnet, port):
-    """Generates the WireGuard configuration."""
-    base_subnet = subnet.split("/")[0]
+    """Generates the WireGuard configuration (the subnet may have any prefix length, e.g. /16)."""
+    network = ipaddress.ip_network(subnet, strict=False)
+    server_address = f"{network.network_address + 1}/{network.prefixlen}"
     server_private_key, server_public_key = generate_keypair()
 
     server_pub_ip, server_pub_nic = detect_server_ip_and_nic()
 
     server_config = f"""
 [Interface]
-Address = {subnet},fd42:42:42::1/64
+Address = {server_address},fd42:42:42::1/64
 ListenPort = {port}
 PrivateKey = {server_private_key}
-PostUp = firewall-cmd --add-port {port}/udp && firewall-cmd --add-rich-rule='rule family=ipv4 source address={base_subnet}/24 masquerade' && firewall-cmd --add-rich-rule='rule family=ipv6 source address=fd42:42:42::0/64 masquerade'
-PostDown = firewall-cmd --remove-port {port}/udp && firewall-cmd --remove-rich-rule='rule family=ipv4 source address={base_subnet}/24 masquerade' && firewall-cmd --remove-rich-rule='rule family=ipv6 source address=fd42:42:42::0/64 masquerade'
+PostUp = firewall-cmd --add-port {port}/udp && firewall-cmd --add-rich-rule='rule family=ipv4 source address={network} masquerade' && firewall-cmd --add-rich-rule='rule family=ipv6 source address=fd42:42:42::0/64 masquerade'
+PostDown = firewall-cmd --remove-port {port}/udp && firewall-cmd --remove-rich-rule='rule family=ipv4 source address={network} masquerade' && firewall-cmd --remove-rich-rule='rule family=ipv6 source address=fd42:42:42::0/64 masquerade'
     """
     with open(SERVER_CONFIG_FILE, "w") as config_file:
         config_file.write(server_config)
@@ -154,9 +155,9 @@ PostDown = firewall-cmd --remove-port {port}/udp && firewall-cmd --remove-rich-r
 
 def configure_firewalld(port, subnet):
     """Configures firewalld."""
-    base_subnet = subnet.split("/")[0]
+    network = ipaddress.ip_network(subnet, strict=False)
     subprocess.run(["firewall-cmd", "--add-port", f"{port}/udp", "--permanent"], check=True)
-    subprocess.run(["firewall-cmd", "--add-rich-rule", f"rule family=ipv4 source address={base_subnet}/24 masquerade", "--permanent"], check=True)
+    subprocess.run(["firewall-cmd", "--add-rich-rule", f"rule family=ipv4 source address={network} masquerade", "--permanent"], check=True)
     subprocess.run(["firewall-cmd", "--add-rich-rule", "rule family=ipv6 source address=fd42:42:42::0/64 masquerade", "--permanent"], check=True)
     subprocess.run(["firewall-cmd", "--reload"], check=True)
 
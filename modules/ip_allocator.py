@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+# modules/ip_allocator.py
+# ===========================================
+# Tunnel IP allocator backed by a persistent bitmap
+# ===========================================
+# Picking the address of a new user used to read wg0.conf and walk the
+# subnet host by host. The allocator keeps one bit per address of the
+# subnet in settings.IP_ALLOCATOR_PATH instead:
+# - a set bit is taken: used by a peer of wg0.conf (blocked ones included),
+#   reserved, or in quarantine;
+# - allocation is next-fit: the search starts at the last allocated
+#   address and skips fully taken bytes with one C-level scan, so handing
+#   out addresses one after another is O(1) amortized;
+# - the network and broadcast addresses, the server's own addresses (the
+#   [Interface] Address and SERVER_WG_IPV4 of the params file, which differ
+#   on old installs written as "Address = 10.66.66.0/24"),
+#   settings.IP_RESERVED and addresses passed to reserve() are never
+#   handed out;
+# - an address that disappears from wg0.conf (deleted user) stays in
+#   quarantine for settings.IP_QUARANTINE seconds before it is reused, so
+#   a stale client config of the old user does not reach the new one;
+# - an address whose user creation failed before wg0.conf was written never
+#   reached a client: free_ips() returns it to the pool at once.
+#
+# The state remembers the version of wg0.conf it was last compared with
+# (inode, mtime, size). When the file changed since then (users added or
+# deleted by any tool, manual edits), the bitmap is compared with the
+# addresses of the configuration and corrected; a state file of another
+# subnet, or none at all, is rebuilt from the configuration. A tool that
+# writes the allocated peers itself calls confirm_allocations() afterwards,
+# so its own write is not taken for drift and allocation does not depend
+# on the number of peers.
+#
+# Address plan: the client subnets are the networks of the [Interface]
+# Address option of wg0.conf, so /16 or /20 networks are used as written
+# there (up to MAX_ADDRESSES addresses). With settings.WG_DUAL_STACK a
+# client also gets the IPv6 address at the same offset in the IPv6 network
+# (10.66.0.2 -> fd42:42:42::2, 10.66.1.7 -> fd42:42:42::107); it is unique
+# because the IPv4 address is, and needs no bitmap of its own.
+#
+# Example usage:
+# ---------------------
+# from modules.ip_allocator import allocate_ip, client_networks, ipv6_address
+#
+# ipv4_network, ipv6_network = client_networks(settings.SERVER_CONFIG_FILE, params["SERVER_WG_IPV4"])
+# with locked(settings.SERVER_CONFIG_FILE):
+#     ipv4 = allocate_ip(settings.SERVER_CONFIG_FILE, ipv4_network, server_ipv4=params["SERVER_WG_IPV4"])
+#     ipv6 = ipv6_address(ipv4, ipv4_network, ipv6_network)
+#     ...  # Add the peer with these addresses to wg0.conf
+
+import base64
+import ipaddress
+import re
+import time
+
+import settings
+from modules.atomic_io import locked, read_json, write_json
+from modules.user_store import file_key
+from modules.wg_config import load_wg_config
+
+STATE_VERSION = 1
+MAX_ADDRESSES = 1 << 24  # A /8 of IPv4: 2 MiB of bitmap
+_FREE_BYTE = re.compile(rb"[^\xff]")
+_TAKEN_BYTE = re.compile(rb"[^\x00]")
+
+
+class IpAllocator:
+    """Free/taken bitmap of one subnet with reservations and a quarantine."""
+
+    def __init__(self, network, bitmap=None, reserved=(), quarantine=None, cursor=0, signature=None,
+                 server_ipv4=None):
+        """
+        :param network: Subnet, e.g. "10.66.66.0/24".
+        :param bitmap: Saved bitmap (bytes); empty if omitted.
+        :param reserved: Addresses reserved with reserve().
+        :param quarantine: {address: Unix time when it becomes free}.
+        :param cursor: Index of the last allocated address.
+        :param signature: Version of wg0.conf the bitmap was last compared with.
+        :param server_ipv4: Server tunnel address (SERVER_WG_IPV4), never handed out.
+        """
+        self.network = ipaddress.ip_network(network, strict=False)
+        self.size = self.network.num_addresses
+        if self.size > MAX_ADDRESSES:
+            raise ValueError(f"{self.network} is too large for the allocator (at most {MAX_ADDRESSES} addresses)")
+        length = (self.size + 7) // 8
+        self.bitmap = bytearray(bitmap) if bitmap and len(bitmap) == length else bytearray(length)
+        self.reserved = set(reserved)
+        self.quarantine = dict(quarantine or {})
+        self.cursor = cursor
+        self.signature = signature
+        self.fixed = set()  # Indexes never handed out: network, broadcast, server, settings.IP_RESERVED
+        # Padding bits of the last byte are taken
+        for index in range(self.size, length * 8):
+            self._set(index)
+        if self.network.prefixlen < self.network.max_prefixlen - 1:
+            self.fixed.update((0, self.size - 1))
+        fixed = list(settings.IP_RESERVED) + ([server_ipv4] if server_ipv4 else [])
+        self.fixed.update(index for index in map(self._index, fixed) if index is not None)
+        for index in self.fixed:
+            self._set(index)
+        for address in list(self.reserved):
+            self.reserve(address)
+
+    # Bits
+
+    def _index(self, address):
+        """Returns the index of an address in the subnet, or None if it is outside."""
+        try:
+            address = ipaddress.ip_address(address.split("/", 1)[0].strip())
+        except ValueError:
+            return None
+        if address.version != self.network.version or address not in self.network:
+            return None
+        return int(address) - int(self.network.network_address)
+
+    def _address(self, index):
+        return str(self.network.network_address + index)
+
+    def _set(self, index):
+        self.bitmap[index >> 3] |= 1 << (index & 7)
+
+    def _clear(self, index):
+        self.bitmap[index >> 3] &= ~(1 << (index & 7))
+
+    def is_taken(self, address):
+        index = self._index(address)
+        return index is not None and bool(self.bitmap[index >> 3] & (1 << (index & 7)))
+
+    def _taken(self):
+        """Yields the indexes of all set bits."""
+        for match in _TAKEN_BYTE.finditer(self.bitmap):
+            position = match.start()
+            byte = self.bitmap[position]
+            for bit in range(8):
+                if byte & (1 << bit):
+                    yield position * 8 + bit
+
+    # Reservations and quarantine
+
+    def reserve(self, address):
+        """Keeps an address of the subnet from being handed out."""
+        index = self._index(address)
+        if index is None:
+            raise ValueError(f"{address} is not in {self.network}")
+        self.reserved.add(str(self.network.network_address + index))
+        self._set(index)
+
+    def unreserve(self, address):
+        """Returns a reserved address to the pool (unless a peer uses it)."""
+        index = self._index(address)
+        if index is not None and self._address(index) in self.reserved:
+            self.reserved.discard(self._address(index))
+            if index not in self.fixed:
+                self._clear(index)
+                self.signature = None  # A peer may use it: compare with the configuration again
+
+    def release(self, address, now=None):
+        """Puts an address that is no longer used into quarantine."""
+        index = self._index(address)
+        if index is None or index in self.fixed or self._address(index) in self.reserved:
+            return
+        self._set(index)
+        self.quarantine[self._address(index)] = (now or time.time()) + settings.IP_QUARANTINE
+
+    def free(self, address):
+        """Returns an allocated address that never reached the configuration to the pool."""
+        index = self._index(address)
+        if index is None or index in self.fixed:
+            return
+        address = self._address(index)
+        if address not in self.reserved and address not in self.quarantine:
+            self._clear(index)
+
+    def expire(self, now=None):
+        """Frees the addresses whose quarantine is over."""
+        now = now or time.time()
+        for address, until in list(self.quarantine.items()):
+            if until <= now:
+                del self.quarantine[address]
+                index = self._index(address)
+                if index is not None and index not in self.fixed and address not in self.reserved:
+                    self._clear(index)
+
+    # Configuration
+
+    def peer_addresses(self):
+        """Returns the addresses taken by peers (set bits that are not reserved or quarantined)."""
+        skip = self.reserved | set(self.quarantine)
+        return {
+            address
+            for address in (self._address(index) for index in self._taken() if index < self.size and index not in self.fixed)
+            if address not in skip
+        }
+
+    def sync(self, config, signature=None, now=None):
+        """
+        Brings the bitmap in line with the peers of a configuration: new
+        addresses are taken, addresses that are gone go into quarantine.
+        :param config: WgConfig instance, or None if the file does not exist.
+        :param signature: file_key() of the configuration the config was read from.
+        :return: (number of taken addresses, number of quarantined addresses).
+        """
+        used = set()
+        if config is not None:
+            for address in config.used_addresses():
+                index = self._index(address)
+                if index is not None:
+                    used.add(self._address(index))
+            for address in (config.interface.get("Address") or "").split(","):
+                index = self._index(address) if address.strip() else None
+                if index is not None:
+                    self.fixed.add(index)
+                    self._set(index)
+        known = self.peer_addresses()
+        for address in used - known:
+            self.quarantine.pop(address, None)
+            self._set(self._index(address))
+        gone = known - used
+        for address in gone:
+            self.release(address, now)
+        self.signature = signature
+        return len(used - known), len(gone)
+
+    def allocate(self, exclude=()):
+        """
+        Takes the next free address after the last allocated one.
+        :param exclude: Addresses taken but not yet in the configuration (e.g. queued in a ChangeSet).
+        :return: Address as a string.
+        :raises ValueError: If the subnet is full.
+        """
+        for address in exclude:
+            index = self._index(address)
+            if index is not None:
+                self._set(index)
+        start = self.cursor + 1
+        position = start >> 3
+        free = ~self.bitmap[position] & (0xFF << (start & 7)) & 0xFF if position < len(self.bitmap) else 0
+        if not free:
+            # Whole bytes after the cursor, then from the start of the subnet
+            match = (_FREE_BYTE.search(self.bitmap, position + 1)
+                     or _FREE_BYTE.search(self.bitmap, 0, position + 1))
+            if match is None:
+                raise ValueError(f"No available IP addresses in {self.network}.")
+            position = match.start()
+            free = ~self.bitmap[position] & 0xFF
+        index = position * 8 + ((free & -free).bit_length() - 1)  # Lowest free bit
+        self._set(index)
+        self.cursor = index
+        return self._address(index)
+
+    # Persistence
+
+    def to_dict(self):
+        return {
+            "version": STATE_VERSION,
+            "network": str(self.network),
+            "signature": list(self.signature) if self.signature else None,
+            "cursor": self.cursor,
+            "reserved": sorted(self.reserved),
+            "quarantine": self.quarantine,
+            "bitmap": base64.b64encode(bytes(self.bitmap)).decode("ascii"),
+        }
+
+    @classmethod
+    def from_dict(cls, data, network, server_ipv4=None):
+        """
+        Restores a saved allocator; a missing state or one of another subnet
+        gives an empty allocator that is rebuilt on its first sync.
+        """
+        network = ipaddress.ip_network(network, strict=False)
+        if not data or data.get("version") != STATE_VERSION or data.get("network") != str(network):
+            return cls(network, server_ipv4=server_ipv4)
+        signature = data.get("signature")
+        return cls(
+            network,
+            bitmap=base64.b64decode(data.get("bitmap", "")),
+            reserved=data.get("reserved", ()),
+            quarantine=data.get("quarantine"),
+            cursor=data.get("cursor", 0),
+            signature=tuple(signature) if signature else None,
+            server_ipv4=server_ipv4,
+        )
+
+
+def allocate_ip(config_path=None, network=None, exclude=(), state_path=None, now=None, server_ipv4=None):
+    """
+    Allocates the address of a new peer. The caller holds the lock on the
+    configuration until the peer is written, so concurrent creations cannot
+    get the same address.
+    :param config_path: Server configuration; defaults to settings.SERVER_CONFIG_FILE.
+    :param network: Subnet; defaults to settings.DEFAULT_SUBNET.
+    :param exclude: Addresses already handed out but not yet written.
+    :param state_path: Allocator state file; defaults to settings.IP_ALLOCATOR_PATH.
+    :param server_ipv4: Server tunnel address (SERVER_WG_IPV4 of the params file).
+    :return: Address as a string.
+    :raises ValueError: If the subnet is full.
+    """
+    config_path = str(config_path or settings.SERVER_CONFIG_FILE)
+    state_path = str(state_path or settings.IP_ALLOCATOR_PATH)
+    with locked(state_path):
+        allocator = IpAllocator.from_dict(
+            read_json(state_path), network or settings.DEFAULT_SUBNET, server_ipv4=server_ipv4
+        )
+        signature = file_key(config_path)
+        if allocator.signature is None or allocator.signature != signature:
+            config = load_wg_config(config_path) if signature is not None else None
+            allocator.sync(config, signature, now)
+        allocator.expire(now)
+        address = allocator.allocate(exclude)
+        write_json(state_path, allocator.to_dict())
+        return address
+
+
+def reserve_ip(address, network=None, state_path=None, reserved=True):
+    """
+    Reserves an address (or returns it to the pool with reserved=False).
+    :raises ValueError: If the address is not in the subnet.
+    """
+    state_path = str(state_path or settings.IP_ALLOCATOR_PATH)
+    with locked(state_path):
+        allocator = IpAllocator.from_dict(read_json(state_path), network or settings.DEFAULT_SUBNET)
+        if reserved:
+            allocator.reserve(address)
+        else:
+            allocator.unreserve(address)
+        write_json(state_path, allocator.to_dict())
+
+
+def release_ips(addresses, state_path=None, now=None):
+    """
+    Puts the addresses of deleted peers into quarantine right away, instead of
+    waiting for the next allocation to notice they left wg0.conf.
+    Does nothing without a saved allocator state.
+    :param addresses: Addresses (prefix lengths allowed); ones outside the subnet are ignored.
+    """
+    state_path = str(state_path or settings.IP_ALLOCATOR_PATH)
+    with locked(state_path):
+        data = read_json(state_path)
+        if not data or data.get("version") != STATE_VERSION:
+            return
+        allocator = IpAllocator.from_dict(data, data["network"])
+        for address in addresses:
+            allocator.release(address, now)
+        write_json(state_path, allocator.to_dict())
+
+
+def free_ips(addresses, state_path=None):
+    """
+    Returns addresses allocated for peers that were never written (the user
+    creation failed) to the pool, without quarantine.
+    Does nothing without a saved allocator state.
+    :param addresses: Addresses (prefix lengths allowed); ones outside the subnet are ignored.
+    """
+    state_path = str(state_path or settings.IP_ALLOCATOR_PATH)
+    with locked(state_path):
+        data = read_json(state_path)
+        if not data or data.get("version") != STATE_VERSION:
+            return
+        allocator = IpAllocator.from_dict(data, data["network"])
+        for address in addresses:
+            allocator.free(address)
+        write_json(state_path, allocator.to_dict())
+
+
+def confirm_allocations(config_path=None, previous=None, state_path=None):
+    """
+    Records that the peers allocated since the configuration version `previous`
+    were written, so the next allocation does not compare the whole file again.
+    Must be called under the same lock of the configuration as the allocations.
+    :param previous: file_key() of the configuration before the write.
+    """
+    config_path = str(config_path or settings.SERVER_CONFIG_FILE)
+    state_path = str(state_path or settings.IP_ALLOCATOR_PATH)
+    with locked(state_path):
+        data = read_json(state_path)
+        if data and previous is not None and data.get("signature") == list(previous):
+            data["signature"] = list(file_key(config_path) or ()) or None
+            write_json(state_path, data)
+
+
+def client_networks(config_path=None, server_ipv4=None):
+    """
+    Returns the client networks of the server.
+    :param config_path: Server configuration; defaults to settings.SERVER_CONFIG_FILE.
+    :param server_ipv4: Server address used if wg0.conf has no IPv4 Address
+                        (with the prefix length of settings.USER_SET_SUBNET).
+    :return: (IPv4 network, IPv6 network or None).
+    """
+    try:
+        networks = load_wg_config(config_path).interface_networks()
+    except FileNotFoundError:
+        networks = []
+    ipv4 = next((network for network in networks if network.version == 4), None)
+    if ipv4 is None:
+        default = ipaddress.ip_network(settings.USER_SET_SUBNET, strict=False)
+        ipv4 = ipaddress.ip_interface(f"{server_ipv4 or default.network_address + 1}/{default.prefixlen}").network
+    ipv6 = next((network for network in networks if network.version == 6), None)
+    return ipv4, ipv6 if settings.WG_DUAL_STACK else None
+
+
+def ipv6_address(ipv4, ipv4_network, ipv6_network):
+    """
+    Returns the IPv6 address at the offset of an IPv4 address in its network.
+    :return: Address as a string, or None without an IPv6 network.
+    :raises ValueError: If the IPv6 network is smaller than the offset.
+    """
+    if ipv6_network is None:
+        return None
+    ipv4_network = ipaddress.ip_network(ipv4_network, strict=False)
+    ipv6_network = ipaddress.ip_network(ipv6_network, strict=False)
+    offset = int(ipaddress.ip_address(ipv4)) - int(ipv4_network.network_address)
+    if not 0 <= offset < ipv6_network.num_addresses:
+        raise ValueError(f"{ipv4} has no counterpart in {ipv6_network}")
+    return str(ipv6_network.network_address + offset)
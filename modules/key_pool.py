@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# modules/key_pool.py
+# ===========================================
+# Pool of pre-generated WireGuard key sets
+# ===========================================
+# Creating many users in a short time (a promotion, an onboarding wave)
+# should not wait for key generation. The pool keeps up to
+# settings.KEY_POOL_SIZE key sets (private key, public key, preshared key)
+# ready in settings.KEY_POOL_PATH:
+# - the file is a 16-byte header followed by fixed-size records; a record
+#   is a key set encrypted with AES-GCM under a random 256-bit key kept in
+#   settings.KEY_POOL_KEY_PATH (both files are created with mode 0600);
+# - take() removes the last record: one read and one truncate under the
+#   file lock, O(1) whatever the size of the pool. The truncate is flushed
+#   to disk before the keys are returned (with settings.FSYNC_WRITES), so a
+#   key set is never handed out twice;
+# - refill() generates key sets outside the lock and appends them in
+#   batches, so users created meanwhile do not wait for it;
+# - below settings.KEY_POOL_LOW_WATER key sets, take_keys() starts a refill
+#   in a detached process (at most one refill runs at a time); the admin
+#   panel also checks the pool periodically (start_key_pool_refiller).
+# Without the `cryptography` package, or with an empty pool, take_keys()
+# generates the keys directly (modules/keygen.py).
+#
+# Example usage:
+# ---------------------
+# from modules.key_pool import take_keys
+#
+# private_key, public_key, preshared_key = take_keys()   # base64 bytes, as keygen returns them
+#
+# Command line:
+#   python3 -m modules.key_pool --status
+#   python3 -m modules.key_pool --refill
+#   python3 -m modules.key_pool --watch 60
+
+import base64
+import fcntl
+import os
+import struct
+import subprocess
+import sys
+import threading
+from pathlib import Path
+
+import settings
+from modules.atomic_io import locked
+from modules.keygen import generate_preshared_key, generate_private_key, generate_public_key
+
+try:
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+except ImportError:  # Optional: keys are generated per user instead
+    AESGCM = None
+
+MAGIC = b"WGKP"
+VERSION = 1
+HEADER = struct.Struct("<4sI8x")  # Magic, version, reserved
+KEY_SIZE = 32
+NONCE_SIZE = 12
+PLAIN_SIZE = 3 * KEY_SIZE                      # Private, public and preshared key (raw)
+RECORD_SIZE = NONCE_SIZE + PLAIN_SIZE + 16     # Nonce, ciphertext, GCM tag
+ASSOCIATED_DATA = MAGIC + struct.pack("<I", VERSION)
+REFILL_BATCH = 50
+
+
+def _create_private(path, data):
+    """Creates a file readable only by its owner; returns False if it exists."""
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        return False
+    try:
+        os.write(fd, data)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    return True
+
+
+class KeyPool:
+    """Encrypted file of ready key sets."""
+
+    def __init__(self, path=None, key_path=None):
+        """
+        :param path: Pool file; defaults to settings.KEY_POOL_PATH.
+        :param key_path: Encryption key file; defaults to settings.KEY_POOL_KEY_PATH.
+        :raises RuntimeError: If the `cryptography` package is not installed.
+        """
+        if AESGCM is None:
+            raise RuntimeError("the key pool needs the 'cryptography' package")
+        self.path = str(path or settings.KEY_POOL_PATH)
+        self.key_path = str(key_path or settings.KEY_POOL_KEY_PATH)
+        self._cipher = None
+
+    def _aead(self):
+        if self._cipher is None:
+            _create_private(self.key_path, AESGCM.generate_key(bit_length=256))
+            with open(self.key_path, "rb") as f:
+                self._cipher = AESGCM(f.read())
+        return self._cipher
+
+    def _open(self):
+        """Opens the pool file (created if missing) and drops a partly written last record."""
+        _create_private(self.path, HEADER.pack(MAGIC, VERSION))
+        f = open(self.path, "r+b")
+        header = f.read(HEADER.size)
+        if len(header) != HEADER.size or HEADER.unpack(header) != (MAGIC, VERSION):
+            # Unknown layout or a damaged header: start over
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, VERSION))
+            f.truncate(HEADER.size)
+        excess = (os.fstat(f.fileno()).st_size - HEADER.size) % RECORD_SIZE
+        if excess:
+            f.truncate(os.fstat(f.fileno()).st_size - excess)
+        return f
+
+    def __len__(self):
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            return 0
+        return max(0, size - HEADER.size) // RECORD_SIZE
+
+    def _seal(self, private_key, public_key, preshared_key):
+        plain = b"".join(base64.b64decode(key) for key in (private_key, public_key, preshared_key))
+        nonce = os.urandom(NONCE_SIZE)
+        return nonce + self._aead().encrypt(nonce, plain, ASSOCIATED_DATA)
+
+    def _open_record(self, record):
+        plain = self._aead().decrypt(record[:NONCE_SIZE], record[NONCE_SIZE:], ASSOCIATED_DATA)
+        return tuple(base64.b64encode(plain[i:i + KEY_SIZE]) for i in range(0, PLAIN_SIZE, KEY_SIZE))
+
+    def take(self):
+        """
+        Removes one key set from the pool.
+        :return: (private key, public key, preshared key) as base64 bytes, or None if the pool is empty.
+        :raises cryptography.exceptions.InvalidTag: If the record does not decrypt (wrong key file).
+        """
+        with locked(self.path):
+            with self._open() as f:
+                size = os.fstat(f.fileno()).st_size
+                if size < HEADER.size + RECORD_SIZE:
+                    return None
+                f.seek(size - RECORD_SIZE)
+                record = f.read(RECORD_SIZE)
+                f.truncate(size - RECORD_SIZE)
+                if settings.FSYNC_WRITES:
+                    os.fsync(f.fileno())
+        return self._open_record(record)
+
+    def add(self, key_sets):
+        """Appends key sets [(private, public, preshared)] to the pool."""
+        records = b"".join(self._seal(*keys) for keys in key_sets)
+        with locked(self.path):
+            with self._open() as f:
+                f.seek(0, os.SEEK_END)
+                f.write(records)
+                f.flush()
+                if settings.FSYNC_WRITES:
+                    os.fsync(f.fileno())
+
+    def refill(self, target=None, batch=REFILL_BATCH):
+        """
+        Tops the pool up to `target` key sets, generating them outside the lock.
+        Only one refill runs at a time; a concurrent call returns at once.
+        :param target: Key sets to keep; defaults to settings.KEY_POOL_SIZE.
+        :return: Number of key sets added.
+        """
+        target = settings.KEY_POOL_SIZE if target is None else target
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(f"{self.path}.refill", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return 0
+            added = 0
+            while len(self) < target:
+                count = min(batch, target - len(self))
+                key_sets = []
+                for _ in range(count):
+                    private_key = generate_private_key()
+                    key_sets.append((private_key, generate_public_key(private_key), generate_preshared_key()))
+                self.add(key_sets)
+                added += count
+            return added
+        finally:
+            os.close(fd)
+
+    def refill_running(self):
+        """Returns True if a refill holds the refill lock."""
+        try:
+            fd = os.open(f"{self.path}.refill", os.O_RDWR | os.O_CREAT, 0o600)
+        except OSError:
+            return False
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+        finally:
+            os.close(fd)
+        return False
+
+
+def get_key_pool():
+    """Returns the configured key pool, or None if it is disabled or unavailable."""
+    if not settings.KEY_POOL_SIZE or AESGCM is None:
+        return None
+    return KeyPool()
+
+
+def request_refill(pool):
+    """Starts a refill in a detached process if the pool is low and none is running."""
+    if len(pool) >= settings.KEY_POOL_LOW_WATER or pool.refill_running():
+        return False
+    subprocess.Popen(
+        [sys.executable, "-m", "modules.key_pool", "--refill"],
+        cwd=str(settings.BASE_DIR),
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+    return True
+
+
+def take_keys():
+    """
+    Returns the keys of a new user: from the pool if it has any, generated otherwise.
+    :return: (private key, public key, preshared key) as base64 bytes.
+    """
+    pool = get_key_pool()
+    keys = None
+    if pool is not None:
+        try:
+            keys = pool.take()
+            request_refill(pool)
+        except Exception as e:
+            print(f"⚠️ Key pool unavailable, generating keys directly: {e}")
+    if keys is None:
+        private_key = generate_private_key()
+        keys = (private_key, generate_public_key(private_key), generate_preshared_key())
+    return keys
+
+
+def start_key_pool_refiller(interval=None):
+    """
+    Checks the pool periodically in a daemon thread and refills it below the low-water mark.
+    :param interval: Seconds between checks; defaults to settings.KEY_POOL_REFILL_INTERVAL (0 disables it).
+    :return: threading.Event that stops the loop when set, or None if disabled.
+    """
+    interval = settings.KEY_POOL_REFILL_INTERVAL if interval is None else interval
+    pool = get_key_pool()
+    if not interval or pool is None:
+        return None
+    stop = threading.Event()
+
+    def loop():
+        while not stop.is_set():
+            try:
+                if len(pool) < settings.KEY_POOL_LOW_WATER:
+                    pool.refill()
+            except Exception as e:
+                print(f"[ERROR] Key pool refill failed: {e}")
+            stop.wait(interval)
+
+    threading.Thread(target=loop, name="wg-key-pool", daemon=True).start()
+    return stop
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    pool = get_key_pool()
+    if pool is None:
+        print("⚠️ Key pool is disabled (KEY_POOL_SIZE = 0 or 'cryptography' is not installed).")
+        sys.exit(1)
+    if args == ["--status"]:
+        print(f"🔑 Key pool: {len(pool)} of {settings.KEY_POOL_SIZE} key sets ready"
+              f"{' (refill running)' if pool.refill_running() else ''}")
+    elif args == ["--refill"]:
+        print(f"🔑 Added {pool.refill()} key sets ({len(pool)} ready).")
+    elif len(args) == 2 and args[0] == "--watch" and args[1].isdigit():
+        start_key_pool_refiller(int(args[1]))
+        threading.Event().wait()
+    else:
+        print("Usage: python3 -m modules.key_pool [--status | --refill | --watch SECONDS]")
+        sys.exit(1)
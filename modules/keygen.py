@@ -1,13 +1,214 @@
+#!/usr/bin/env python3
+# modules/keygen.py
+# ===========================================
+# WireGuard key generation
+# ===========================================
+# Keys are generated in-process: a private key is 32 random bytes clamped
+# as X25519 requires (as `wg genkey` does), the public key is derived with
+# X25519 from the `cryptography` package, the preshared key is 32 random
+# bytes. All keys are returned base64-encoded as bytes, exactly as the `wg`
+# binary prints them, so they can be used in its place. This avoids three
+# `wg` processes per user.
+#
+# settings.KEYGEN_BACKEND selects the backend: "native", "wg" (one `wg`
+# process per key, the previous behaviour) or "auto". With "auto" the
+# native backend is used if `cryptography` is installed and passes
+# self_test() (RFC 7748 test vector, and a cross-check against `wg pubkey`
+# when the binary is present); otherwise `wg` is used.
+#
+# Example usage:
+# ---------------------
+# from modules.keygen import generate_private_key, generate_public_key, generate_preshared_key
+#
+# private_key = generate_private_key()            # b"yAnz5TF+lXXJte14tji3zlMNq+hd2rYUIgJBgB3fBmk="
+# public_key = generate_public_key(private_key)
+# preshared_key = generate_preshared_key()
+#
+# Command line:
+#   python3 -m modules.keygen --self-test
+#   python3 -m modules.keygen --benchmark 1000
+
+import base64
+import os
+import shutil
 import subprocess
+import sys
+import threading
+import time
+
+import settings
+
+try:
+    from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey
+    from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
+except ImportError:  # Optional: the `wg` binary is used instead
+    X25519PrivateKey = None
+
+KEY_SIZE = 32
+
+# RFC 7748, section 6.1: Alice's private and public key
+RFC7748_PRIVATE = bytes.fromhex("77076d0a7318a57d3c16c17251b26645df4c2f87ebc0992ab177fba51db92c2a")
+RFC7748_PUBLIC = bytes.fromhex("8520f0098930a754748b7ddcb43ef75a0dbf3a0d26381af4eba4a98eaa9b4e6a")
+
+
+def _decode_key(key):
+    """Decodes a base64 key as `wg` accepts it (44 characters, 32 bytes)."""
+    key = key.strip()
+    try:
+        raw = base64.b64decode(key, validate=True)
+    except ValueError:
+        raw = b""
+    if len(key) != 44 or len(raw) != KEY_SIZE:
+        raise ValueError("Key is not the correct length or format")
+    return raw
+
+
+def _clamp(raw):
+    raw = bytearray(raw)
+    raw[0] &= 248
+    raw[31] = (raw[31] & 127) | 64
+    return bytes(raw)
+
+
+def _native_public_key(raw_private):
+    return X25519PrivateKey.from_private_bytes(raw_private).public_key().public_bytes(Encoding.Raw, PublicFormat.Raw)
+
+
+class NativeBackend:
+    """Keys generated in-process (os.urandom and X25519 from `cryptography`)."""
+
+    name = "native"
+
+    def private_key(self):
+        return base64.b64encode(_clamp(os.urandom(KEY_SIZE)))
+
+    def public_key(self, private_key):
+        return base64.b64encode(_native_public_key(_decode_key(private_key)))
+
+    def preshared_key(self):
+        return base64.b64encode(os.urandom(KEY_SIZE))
+
+
+class WgBackend:
+    """Keys generated by the `wg` binary, one process per key."""
+
+    name = "wg"
+
+    def private_key(self):
+        return subprocess.check_output(['wg', 'genkey']).strip()
+
+    def public_key(self, private_key):
+        try:
+            return subprocess.check_output(['wg', 'pubkey'], input=private_key, stderr=subprocess.PIPE).strip()
+        except subprocess.CalledProcessError as e:
+            raise ValueError(e.stderr.decode(errors="replace").strip() or "wg pubkey failed") from e
+
+    def preshared_key(self):
+        return subprocess.check_output(['wg', 'genpsk']).strip()
+
+
+def self_test(samples=4):
+    """
+    Checks the native backend: the RFC 7748 test vector, the format of the
+    generated keys and, if `wg` is installed, the public keys of `samples`
+    new private keys against `wg pubkey`.
+    :return: List of problems (empty if the native backend can be used).
+    """
+    if X25519PrivateKey is None:
+        return ["the 'cryptography' package is not installed"]
+    problems = []
+    if _native_public_key(RFC7748_PRIVATE) != RFC7748_PUBLIC:
+        problems.append("X25519 does not match the RFC 7748 test vector")
+    native = NativeBackend()
+    if len(native.preshared_key()) != 44:
+        problems.append("preshared key has a wrong length")
+    if shutil.which("wg"):
+        wg = WgBackend()
+        for _ in range(samples):
+            private_key = native.private_key()
+            if native.public_key(private_key) != wg.public_key(private_key):
+                problems.append(f"public key of {private_key.decode()} differs from `wg pubkey`")
+                break
+    return problems
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Returns the key backend selected by settings.KEYGEN_BACKEND (checked once per process)."""
+    global _backend
+    if _backend is not None:
+        return _backend
+    with _backend_lock:
+        if _backend is None:
+            choice = settings.KEYGEN_BACKEND
+            if choice == "wg":
+                _backend = WgBackend()
+            elif choice == "native":
+                if X25519PrivateKey is None:
+                    raise RuntimeError("KEYGEN_BACKEND is 'native' but the 'cryptography' package is not installed")
+                _backend = NativeBackend()
+            else:
+                problems = self_test(samples=1)
+                if problems and X25519PrivateKey is not None:
+                    print(f"⚠️ Native key generation disabled: {'; '.join(problems)}")
+                _backend = WgBackend() if problems else NativeBackend()
+        return _backend
+
 
 def generate_private_key():
-    private_key = subprocess.check_output(['wg', 'genkey']).strip()
-    return private_key
+    return get_backend().private_key()
+
 
 def generate_public_key(private_key):
-    public_key = subprocess.check_output(['wg', 'pubkey'], input=private_key).strip()
-    return public_key
+    """
+    :param private_key: Base64 private key (bytes).
+    :raises ValueError: If the key is not a valid WireGuard key.
+    """
+    return get_backend().public_key(private_key)
+
 
 def generate_preshared_key():
-    preshared_key = subprocess.check_output(['wg', 'genpsk']).strip()
-    return preshared_key
+    return get_backend().preshared_key()
+
+
+def benchmark(count=200):
+    """
+    Measures the key sets (private, public and preshared key) per second of each available backend.
+    :return: {backend name: key sets per second}.
+    """
+    backends = []
+    if X25519PrivateKey is not None:
+        backends.append(NativeBackend())
+    if shutil.which("wg"):
+        backends.append(WgBackend())
+    results = {}
+    for backend in backends:
+        start = time.perf_counter()
+        for _ in range(count):
+            backend.public_key(backend.private_key())
+            backend.preshared_key()
+        results[backend.name] = count / (time.perf_counter() - start)
+    return results
+
+
+if __name__ == "__main__":
+    if "--self-test" in sys.argv:
+        problems = self_test(samples=32)
+        for problem in problems:
+            print(f"❌ {problem}")
+        if not problems:
+            print(f"✅ Native key generation matches {'`wg`' if shutil.which('wg') else 'RFC 7748'}.")
+        sys.exit(1 if problems else 0)
+    elif "--benchmark" in sys.argv:
+        position = sys.argv.index("--benchmark") + 1
+        count = int(sys.argv[position]) if position < len(sys.argv) else 200
+        results = benchmark(count)
+        if not results:
+            print("⚠️ No key backend available (install 'cryptography' or WireGuard tools).")
+        for name, rate in results.items():
+            print(f"  {name:>6}: {rate:10.1f} key sets/s ({count} sets)")
+    else:
+        print("Usage: python3 -m modules.keygen --self-test | --benchmark [count]")
@@ -1,10 +1,249 @@
 #!/usr/bin/env python3
 # modules/main_registration_fields.py
 ## Main module for generating user fields
+##
+## User records are stored in a compact, versioned form: only fields that
+## differ from the schema defaults are written to the user database, and
+## the defaults are filled back in when a record is read. Records written
+## before the schema existed (all fields literal) are read as they are.
 
+import copy
 import uuid
+from collections.abc import Mapping
 from datetime import datetime, timedelta
 
+USER_RECORD_SCHEMA_VERSION = 2  # Version 1: every field stored literally
+
+# All schema fields in their canonical order
+USER_RECORD_FIELDS = (
+    "username", "user_id", "group", "tags", "priority",
+    "created_at", "expires_at", "auto_suspend_date", "auto_delete_date", "last_config_update",
+    "status", "blocked_reason", "renewal_requested",
+    "allowed_ips", "allowed_ips_custom", "dns_custom", "public_key", "preshared_key",
+    "endpoint", "last_handshake", "uploaded", "downloaded",
+    "transfer", "total_transfer", "data_limit", "data_used",
+    "rx_bytes", "tx_bytes", "rx_baseline", "tx_baseline",
+    "period_start", "period_rx_bytes", "period_tx_bytes",
+    "qr_code_path", "email", "telegram_id", "contact_method",
+    "referral_id", "coupon_id", "referral_earnings", "referral_count", "referral_bonus",
+    "subscription_plan", "subscription_price", "payment_method",
+    "last_payment_date", "next_payment_date", "payment_status", "total_spent", "auto_renew",
+    "transaction_history", "preferred_language", "admin_notes", "user_notes", "ip_history",
+)
+
+# Fields with a constant default; they are stored only when they differ from it
+USER_RECORD_DEFAULTS = {
+    "group": "guest",
+    "tags": ["default-user"],
+    "priority": 1,
+    "status": "active",
+    "blocked_reason": "N/A",
+    "renewal_requested": False,
+    "dns_custom": "1.1.1.1,8.8.8.8",
+    "endpoint": "N/A",
+    "last_handshake": "N/A",
+    "uploaded": "N/A",
+    "downloaded": "N/A",
+    "transfer": "0.0 KiB received, 0.0 KiB sent",
+    "total_transfer": "0.0 KiB",
+    "data_limit": "100.0 GB",
+    "data_used": "0.0 KiB",
+    "rx_bytes": 0,          # Lifetime bytes received from the peer
+    "tx_bytes": 0,          # Lifetime bytes sent to the peer
+    "rx_baseline": 0,       # Kernel counters at the last accounting
+    "tx_baseline": 0,
+    "period_start": "N/A",  # Accounting period of the period_* counters ("YYYY-MM")
+    "period_rx_bytes": 0,
+    "period_tx_bytes": 0,
+    "email": "N/A",
+    "telegram_id": "N/A",
+    "contact_method": "telegram",
+    "referral_id": None,
+    "coupon_id": None,
+    "referral_earnings": "0.00 USD",
+    "referral_count": 0,
+    "referral_bonus": "0%",
+    "subscription_plan": "free",
+    "subscription_price": "0.00 USD",
+    "payment_method": "N/A",
+    "last_payment_date": "N/A",
+    "next_payment_date": "N/A",
+    "payment_status": "inactive",
+    "total_spent": "0.00 USD",
+    "auto_renew": False,
+    "transaction_history": [],
+    "preferred_language": "en",
+    "admin_notes": "N/A",
+    "user_notes": "N/A",
+    "ip_history": [],
+}
+
+# Fields that default to the value of another field of the same record
+USER_RECORD_DERIVED = {
+    "allowed_ips_custom": "allowed_ips",
+    "auto_suspend_date": "expires_at",
+    "auto_delete_date": "expires_at",
+    "last_config_update": "created_at",
+}
+
+_MISSING = object()
+_FIELD_SET = frozenset(USER_RECORD_FIELDS)
+
+
+class UserRecord(Mapping):
+    """
+    Compact in-memory user record.
+
+    Schema fields live in slots and are left unset while they hold their
+    default value; fields outside the schema go to a small extra dict.
+    Reading a record (rec["status"], rec.get(...), dict(rec)) returns the
+    materialized values, defaults included.
+    """
+
+    __slots__ = USER_RECORD_FIELDS + ("_extra",)
+
+    def __init__(self, fields=None):
+        self._extra = None
+        if fields:
+            self.update(fields)
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Builds a record from a stored dictionary of any schema version.
+        :param data: Compact (version 2) or full legacy (version 1) record.
+        :return: UserRecord instance.
+        """
+        if isinstance(data, UserRecord):
+            return data.copy()
+        if data.get("schema_version") == USER_RECORD_SCHEMA_VERSION:
+            # Already compact (e.g. read back from the store): no normalization needed
+            record = cls()
+            for key, value in data.items():
+                if key in _FIELD_SET:
+                    setattr(record, key, value)
+                elif key != "schema_version":
+                    if record._extra is None:
+                        record._extra = {}
+                    record._extra[key] = value
+            return record
+        fields = dict(data)
+        fields.pop("schema_version", None)
+        return cls(fields)
+
+    def _default(self, key):
+        if key in USER_RECORD_DEFAULTS:
+            return copy.copy(USER_RECORD_DEFAULTS[key])
+        source = USER_RECORD_DERIVED.get(key)
+        if source is not None:
+            return self._raw(source)
+        return _MISSING
+
+    def _raw(self, key):
+        if key in USER_RECORD_DEFAULTS or key in USER_RECORD_DERIVED or key in USER_RECORD_FIELDS:
+            value = getattr(self, key, _MISSING)
+            if value is _MISSING:
+                value = self._default(key)
+            return value
+        if self._extra is None:
+            return _MISSING
+        return self._extra.get(key, _MISSING)
+
+    def __getitem__(self, key):
+        value = self._raw(key)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __iter__(self):
+        for key in USER_RECORD_FIELDS:
+            if self._raw(key) is not _MISSING:
+                yield key
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __setitem__(self, key, value):
+        if key not in USER_RECORD_FIELDS:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+            return
+        # Derived fields that follow this one keep their current value
+        for derived, source in USER_RECORD_DERIVED.items():
+            if source == key and not hasattr(self, derived):
+                current = self._raw(key)
+                if current is not _MISSING and current != value:
+                    setattr(self, derived, current)
+        default = USER_RECORD_DEFAULTS.get(key, _MISSING)
+        if default is _MISSING and key in USER_RECORD_DERIVED:
+            default = self._raw(USER_RECORD_DERIVED[key])
+        if default is not _MISSING and value == default:
+            if hasattr(self, key):
+                delattr(self, key)
+        else:
+            setattr(self, key, value)
+
+    def __delitem__(self, key):
+        if key in USER_RECORD_FIELDS:
+            if not hasattr(self, key):
+                raise KeyError(key)
+            delattr(self, key)
+        elif self._extra and key in self._extra:
+            del self._extra[key]
+        else:
+            raise KeyError(key)
+
+    def update(self, fields):
+        """Sets several fields at once."""
+        # Sources first, so derived fields are compared against their final value
+        for key in USER_RECORD_DERIVED.values():
+            if key in fields:
+                self[key] = fields[key]
+        for key, value in fields.items():
+            self[key] = value
+
+    def copy(self):
+        """Returns a shallow copy of the record."""
+        other = UserRecord()
+        for key in USER_RECORD_FIELDS:
+            value = getattr(self, key, _MISSING)
+            if value is not _MISSING:
+                setattr(other, key, value)
+        if self._extra:
+            other._extra = dict(self._extra)
+        return other
+
+    def to_dict(self):
+        """Returns the materialized record as a plain dictionary (defaults included)."""
+        return {key: copy.copy(self[key]) for key in self}
+
+    def to_compact(self):
+        """Returns the stored form: only non-default fields plus the schema version."""
+        data = {"schema_version": USER_RECORD_SCHEMA_VERSION}
+        for key in USER_RECORD_FIELDS:
+            value = getattr(self, key, _MISSING)
+            if value is not _MISSING:
+                data[key] = value
+        if self._extra:
+            data.update(self._extra)
+        return data
+
+    def __repr__(self):
+        return f"UserRecord({self.to_compact()!r})"
+
+
+def compact_user_record(record):
+    """Converts a user record (dict or UserRecord) to its stored compact form."""
+    return UserRecord.from_dict(record).to_compact()
+
+
+def expand_user_record(data):
+    """Converts a stored record of any schema version to a full dictionary."""
+    return UserRecord.from_dict(data).to_dict()
+
 def create_user_record(
     username,
     address,
@@ -23,6 +262,9 @@ def create_user_record(
     """
     Creates and returns a user data structure.
 
+    The returned dictionary contains every schema field; the user store
+    keeps only the fields that differ from USER_RECORD_DEFAULTS.
+
     Args:
         username (str): The username of the user.
         address (str): The user's allowed IP address.
@@ -69,6 +311,13 @@ def create_user_record(
         "total_transfer": "0.0 KiB",
         "data_limit": "100.0 GB",
         "data_used": "0.0 KiB",
+        "rx_bytes": 0,
+        "tx_bytes": 0,
+        "rx_baseline": 0,
+        "tx_baseline": 0,
+        "period_start": "N/A",
+        "period_rx_bytes": 0,
+        "period_tx_bytes": 0,
         "qr_code_path": qr_code_path,
         "email": email,
         "telegram_id": telegram_id,
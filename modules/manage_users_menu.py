@@ -4,13 +4,13 @@
 # Updated 01/14/25
 
 import os
-import json
-import sys
 import subprocess
-from modules.utils import get_wireguard_subnet, read_json, write_json
-from settings import USER_DB_PATH, SERVER_CONFIG_FILE, WG_CONFIG_DIR, QR_CODE_DIR, SERVER_WG_NIC
-from modules.traffic_updater import update_traffic_data
-from modules.handshake_updater import update_handshakes
+from modules.user_store import get_user_store
+from settings import SERVER_CONFIG_FILE, SERVER_WG_NIC
+from modules.traffic_updater import format_transfer, traffic_totals, update_user_telemetry
+from modules.user_cleanup import forget_user
+from modules.wg_config import load_wg_config, remove_peer
+from modules.wg_sync import request_sync
 
 def ensure_directory_exists(filepath):
     """Ensures that the directory for the file exists."""
@@ -19,8 +19,8 @@ def ensure_directory_exists(filepath):
         os.makedirs(directory)
 
 def load_user_records():
-    """Loads user data from a JSON file."""
-    return read_json(USER_DB_PATH)
+    """Loads user data from the user database."""
+    return get_user_store().all()
 
 def create_user():
     """Creates a new user by invoking main.py."""
@@ -59,15 +59,16 @@ def show_traffic():
     """Retrieves and displays user traffic."""
     try:
         print("\n🔄 Updating user traffic...")
-        update_traffic_data(USER_DB_PATH)
+        update_user_telemetry(SERVER_WG_NIC)
         print("✅ User traffic updated.")
 
         records = load_user_records()
         print("\n📊 User Traffic:")
         for username, data in records.items():
-            transfer = data.get("transfer", "N/A")
-            total_transfer = data.get("total_transfer", "N/A")
-            print(f"  - {username}: {transfer} | Total: {total_transfer}")
+            totals = traffic_totals(data)
+            period = format_transfer(totals["period_rx_bytes"], totals["period_tx_bytes"])
+            total = format_transfer(totals["rx_bytes"], totals["tx_bytes"])
+            print(f"  - {username}: {period} this month | Total: {total}")
     except Exception as e:
         print(f"⚠️ Error retrieving user traffic: {e}")
 
@@ -75,7 +76,7 @@ def show_handshakes():
     """Retrieves and displays information about the last handshakes."""
     try:
         print("\n🔄 Updating last handshake information...")
-        update_handshakes(USER_DB_PATH, SERVER_WG_NIC)
+        update_user_telemetry(SERVER_WG_NIC)
         print("✅ Last handshake information updated.")
 
         records = load_user_records()
@@ -97,33 +98,17 @@ def delete_user():
 
     print(f"➡️ Starting deletion of user: '{username}'.")
 
-    if not os.path.exists(USER_DB_PATH):
-        print(f"❌ User data file not found: {USER_DB_PATH}")
-        return
-
     try:
-        # Load user data
-        user_data = read_json(USER_DB_PATH)
-        if username not in user_data:
+        # Remove user record
+        user_info = get_user_store().delete(username)
+        if user_info is None:
             print(f"❌ User '{username}' does not exist.")
             return
-
-        # Remove user record
-        user_data.pop(username)
-        write_json(USER_DB_PATH, user_data)
         print(f"📝 User record '{username}' removed from data.")
 
-        # Delete user's configuration file
-        wg_config_path = WG_CONFIG_DIR / f"{username}.conf"
-        if wg_config_path.exists():
-            wg_config_path.unlink()
-            print(f"🗑️ Configuration '{wg_config_path}' deleted.")
-
-        # Delete user's QR code
-        qr_code_path = QR_CODE_DIR / f"{username}.png"
-        if qr_code_path.exists():
-            qr_code_path.unlink()
-            print(f"🗑️ QR code '{qr_code_path}' deleted.")
+        # Delete user's configuration file and QR code, release the addresses
+        for kind, path in forget_user(username, user_info):
+            print(f"🗑️ {'Configuration' if kind == 'config' else 'QR code'} '{path}' deleted.")
 
         # Extract user's public key
         public_key = extract_public_key(username, SERVER_CONFIG_FILE)
@@ -131,18 +116,14 @@ def delete_user():
             print(f"❌ Public key for user '{username}' not found in WireGuard configuration.")
             return
 
-        # Remove user from WireGuard
-        subprocess.run(["sudo", "wg", "set", "wg0", "peer", public_key, "remove"], check=True)
-        print(f"🔐 User '{username}' removed from WireGuard.")
-
         # Update WireGuard configuration
         remove_peer_from_config(public_key, SERVER_CONFIG_FILE, username)
         print(f"✅ WireGuard configuration updated.")
 
-        # Synchronize WireGuard
-        sync_command = f'wg syncconf "{SERVER_WG_NIC}" <(wg-quick strip "{SERVER_WG_NIC}")'
-        subprocess.run(sync_command, shell=True, check=True, executable='/bin/bash')
-        print(f"WireGuard synchronized for interface {SERVER_WG_NIC}")
+        # Remove user from WireGuard (the sync compares the configuration with the
+        # kernel state and issues `wg set <nic> peer <key> remove` for this peer)
+        request_sync(SERVER_WG_NIC, wait=True)
+        print(f"🔐 User '{username}' removed from WireGuard.")
 
         print(f"✅ User '{username}' successfully deleted.")
     except Exception as e:
@@ -160,16 +141,8 @@ def extract_public_key(username, config_path):
         str: The user's public key.
     """
     try:
-        with open(config_path, "r") as f:
-            lines = f.readlines()
-
-        found_username = False
-        for line in lines:
-            if username in line:
-                found_username = True
-            elif found_username and line.strip().startswith("PublicKey"):
-                return line.split("=", 1)[1].strip()
-        return None
+        peer = load_wg_config(config_path).peer_by_name(username)
+        return peer.public_key if peer is not None else None
     except Exception as e:
         print(f"⚠️ Error finding public key: {e}")
         return None
@@ -184,29 +157,7 @@ def remove_peer_from_config(public_key, config_path, client_name):
         client_name (str): The client name.
     """
     try:
-        with open(config_path, "r") as f:
-            lines = f.readlines()
-
-        updated_lines = []
-        skip_lines = 0
-
-        for line in lines:
-            # If the client's comment is found
-            if line.strip() == f"### Client {client_name}":
-                skip_lines = 5  # Remove 5 lines starting from here
-                continue
-
-            # Skip lines related to the removed block
-            if skip_lines > 0:
-                skip_lines -= 1
-                continue
-
-            # Keep other lines
-            updated_lines.append(line)
-
-        # Write updated configuration
-        with open(config_path, "w") as f:
-            f.writelines(updated_lines)
+        remove_peer(config_path, name=client_name, public_key=public_key)
     except Exception as e:
         print(f"⚠️ Error updating configuration: {e}")
 
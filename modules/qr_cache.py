@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+# modules/qr_cache.py
+# ===========================================
+# Cache of rendered QR codes
+# ===========================================
+# A QR code depends only on the client configuration text and the render
+# parameters, so it is cached under the SHA-256 of both:
+# - encoded PNG bytes are kept in memory in an LRU bounded by their total
+#   size (settings.QR_CACHE_MAX_BYTES);
+# - with settings.QR_CACHE_DIR set, every PNG is also written to
+#   <dir>/<2 hex>/<digest>.png, so other processes (main.py creating a user,
+#   the admin panel showing it) and restarts reuse it. The directory is
+#   bounded by settings.QR_CACHE_DISK_MAX_BYTES: once a process's estimate
+#   goes over it, the directory is scanned and the least recently used files
+#   (by mtime, refreshed on every disk hit) are deleted down to 3/4 of it;
+# - a PNG holds the client's private key: remove() drops the entry of a
+#   deleted or rekeyed user from both tiers, clear(disk=True) all of them;
+# - concurrent requests for the same configuration wait for one render.
+# A configuration is therefore rendered once; changing the parameters in
+# RENDER_PARAMS gives new keys instead of stale images.
+#
+# Example usage:
+# ---------------------
+# from modules.qr_cache import get_qr_cache, qr_image
+#
+# png = get_qr_cache().get(config_text)    # PNG bytes
+# get_qr_cache().remove(config_text)       # User deleted or rekeyed
+# gr.Image(value=qr_image(config_text))    # PIL image for Gradio
+
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import settings
+from modules.atomic_io import write_bytes
+
+# Parameters of render_qr_png(); part of the cache key
+RENDER_PARAMS = {"renderer": "qrcode", "error_correction": "L", "box_size": 10, "border": 4}
+
+
+def render_qr_png(text, params=RENDER_PARAMS):
+    """Renders text as a QR code and returns the PNG bytes."""
+    import qrcode  # type: ignore  # Only needed on a cache miss
+
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=getattr(qrcode.constants, f"ERROR_CORRECT_{params['error_correction']}"),
+        box_size=params["box_size"],
+        border=params["border"],
+    )
+    qr.add_data(text)
+    qr.make(fit=True)
+    output = io.BytesIO()
+    qr.make_image(fill_color="black", back_color="white").save(output)
+    return output.getvalue()
+
+
+def qr_key(text, params=RENDER_PARAMS):
+    """Returns the cache key of a configuration text rendered with params."""
+    digest = hashlib.sha256(json.dumps(params, sort_keys=True).encode())
+    digest.update(b"\n")
+    digest.update(text.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class QrCache:
+    """Size-bounded LRU of rendered QR codes with an optional disk tier."""
+
+    def __init__(self, max_bytes=None, directory=None, render=render_qr_png, params=RENDER_PARAMS,
+                 disk_max_bytes=None):
+        """
+        :param max_bytes: Memory bound in bytes; defaults to settings.QR_CACHE_MAX_BYTES.
+        :param directory: Disk tier directory, or None to keep the cache in memory only.
+        :param disk_max_bytes: Disk tier bound in bytes; defaults to settings.QR_CACHE_DISK_MAX_BYTES.
+        :param render: Function (text, params) -> PNG bytes.
+        :param params: Render parameters (part of the key).
+        """
+        self.max_bytes = settings.QR_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self.disk_max_bytes = settings.QR_CACHE_DISK_MAX_BYTES if disk_max_bytes is None else disk_max_bytes
+        self.directory = Path(directory) if directory else None
+        self.params = params
+        self._render = render
+        self._entries = OrderedDict()  # {key: PNG bytes}, least recently used first
+        self._pending = {}             # {key: threading.Event} of renders in progress
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        self._disk_size = None         # Estimated bytes in the directory, scanned on the first store
+        self.size = 0
+        self.hits = self.disk_hits = self.renders = 0
+
+    def _disk_path(self, key):
+        return self.directory / key[:2] / f"{key}.png"
+
+    def _remember(self, key, png):
+        """Adds an entry and evicts the least recently used ones beyond max_bytes. Caller holds the lock."""
+        if key in self._entries:
+            self.size -= len(self._entries.pop(key))
+        if len(png) > self.max_bytes:
+            return
+        self._entries[key] = png
+        self.size += len(png)
+        while self.size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+
+    def get(self, text):
+        """
+        Returns the PNG of a configuration, rendering it only if no tier has it.
+        :param text: Client configuration text.
+        :return: PNG bytes.
+        """
+        key = qr_key(text, self.params)
+        while True:
+            with self._lock:
+                png = self._entries.get(key)
+                if png is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return png
+                pending = self._pending.get(key)
+                if pending is None:
+                    pending = self._pending[key] = threading.Event()
+                    break
+            pending.wait()  # Rendered by another thread: read it from memory
+
+        try:
+            png = self._load(key)
+            if png is None:
+                png = self._render(text, self.params)
+                self.renders += 1
+                self._store(key, png)
+            else:
+                self.disk_hits += 1
+            with self._lock:
+                self._remember(key, png)
+            return png
+        finally:
+            with self._lock:
+                del self._pending[key]
+            pending.set()
+
+    def _load(self, key):
+        if self.directory is None:
+            return None
+        path = self._disk_path(key)
+        try:
+            png = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)  # Recently used: evicted last
+        except OSError:
+            pass
+        return png
+
+    def _store(self, key, png):
+        if self.directory is None:
+            return
+        path = self._disk_path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Entries never change once written: temp file + rename, no lock needed
+            fd, tmp_path = tempfile.mkstemp(prefix=".qr.", dir=path.parent)
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(png)
+                os.chmod(tmp_path, 0o600)  # The QR code holds the client's private key
+                os.replace(tmp_path, path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+                raise
+            self._trim_disk(len(png))
+        except OSError as e:
+            print(f"⚠️ Failed to store QR code in the cache: {e}")
+
+    def _disk_files(self):
+        """Returns [(mtime, size, path)] of the files of the disk tier."""
+        files = []
+        for path in self.directory.glob("*/*.png"):
+            try:
+                info = path.stat()
+            except FileNotFoundError:
+                continue  # Removed by another process
+            files.append((info.st_mtime, info.st_size, path))
+        return files
+
+    def _trim_disk(self, added):
+        """Accounts for a stored file and evicts the least recently used files beyond disk_max_bytes."""
+        with self._disk_lock:
+            if self._disk_size is not None:
+                self._disk_size += added
+                if self._disk_size <= self.disk_max_bytes:
+                    return
+            # Other processes write to the directory too: count what is really there
+            files = self._disk_files()
+            size = sum(file_size for _, file_size, _ in files)
+            if size > self.disk_max_bytes:
+                target = self.disk_max_bytes * 3 // 4
+                for _, file_size, path in sorted(files):
+                    if size <= target:
+                        break
+                    path.unlink(missing_ok=True)
+                    size -= file_size
+            self._disk_size = size
+
+    def remove(self, text):
+        """
+        Drops the QR code of a configuration from both tiers (user deleted or rekeyed).
+        :param text: Client configuration text.
+        :return: True if an entry was removed.
+        """
+        key = qr_key(text, self.params)
+        with self._lock:
+            png = self._entries.pop(key, None)
+            if png is not None:
+                self.size -= len(png)
+        removed = png is not None
+        if self.directory is not None:
+            path = self._disk_path(key)
+            try:
+                file_size = path.stat().st_size
+                path.unlink()
+            except FileNotFoundError:
+                return removed
+            with self._disk_lock:
+                if self._disk_size is not None:
+                    self._disk_size -= file_size
+            removed = True
+        return removed
+
+    def write(self, text, output):
+        """Writes the PNG of a configuration to a path or a binary stream."""
+        png = self.get(text)
+        if hasattr(output, "write"):
+            output.write(png)
+        else:
+            write_bytes(output, png)
+
+    def clear(self, disk=False):
+        """
+        Empties the memory tier.
+        :param disk: Also delete the files of the disk tier.
+        :return: Number of deleted files.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+        removed = 0
+        if disk and self.directory is not None:
+            with self._disk_lock:
+                for _, _, path in self._disk_files():
+                    path.unlink(missing_ok=True)
+                    removed += 1
+                self._disk_size = 0
+        return removed
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_qr_cache():
+    """Returns the process-wide QR cache configured in settings."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = QrCache(directory=settings.QR_CACHE_DIR)
+    return _cache
+
+
+def qr_image(text):
+    """Returns the QR code of a configuration as a PIL image (for gr.Image), or None without text."""
+    if not text:
+        return None
+    from PIL import Image  # type: ignore
+
+    return Image.open(io.BytesIO(get_qr_cache().get(text)))
@@ -1,5 +1,5 @@
-import pyqrcode # type: ignore
+from modules.qr_cache import get_qr_cache
 
 def generate_qr_code(data, qr_path):
-    qr = pyqrcode.create(data)
-    qr.png(qr_path, scale=6)
+    """Writes the QR code of a configuration to a path or binary stream (rendered once per configuration)."""
+    get_qr_cache().write(data, qr_path)
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# modules/reconciler.py
+# ===========================================
+# Desired-state reconciler: user database -> wg0.conf -> WireGuard interface
+# ===========================================
+# The user database, wg0.conf and the running interface can drift apart
+# (a failed sync leaves a blocked user in the kernel, a peer is added by
+# hand, a user record is restored from a backup...). The reconciler brings
+# them back in line with a minimal plan:
+#
+# 1. wg0.conf follows the user database: users blocked in the database are
+#    blocked (commented out) in wg0.conf and vice versa; active users that
+#    have keys in their record but no block in wg0.conf get one. Peers of
+#    wg0.conf without a user record are left alone and reported.
+# 2. The interface follows wg0.conf: the actual peers are read with one
+#    `wg show <nic> dump` and compared with the active peers of the (planned)
+#    wg0.conf; only the differing peers are removed or updated with `wg set`,
+#    settings.WG_SET_BATCH peers per call, with settings.RECONCILE_PAUSE
+#    seconds between calls.
+#
+# Differences the reconciler cannot decide (e.g. a public key that differs
+# between the user record and wg0.conf) are listed as notes; wg0.conf wins.
+#
+# Example usage:
+# ---------------------
+# from modules.reconciler import build_plan, reconcile, start_reconciler
+#
+# print(build_plan().summary())   # Dry run
+# reconcile()                     # Builds and applies the plan
+# start_reconciler(300)           # Periodic job in a daemon thread
+#
+# Command line:
+#   python3 -m modules.reconciler --dry-run
+#   python3 -m modules.reconciler --watch 300
+
+import subprocess
+import sys
+import threading
+import time
+
+import settings
+from modules.user_store import file_key, get_user_store
+from modules.wg_changeset import ChangeSet, ChangeSetError
+from modules.wg_config import WgConfig, load_wg_config
+from modules.wg_dump import read_wg_dump
+from modules.wg_sync import desired_state, peer_delta, record_applied_state, set_peers
+
+
+def _normalize_ips(allowed_ips):
+    return ",".join(sorted(address.strip() for address in allowed_ips.split(",") if address.strip()))
+
+
+def _normalize_peers(peers):
+    return {key: (psk, _normalize_ips(ips)) for key, (psk, ips) in peers.items()}
+
+
+def read_kernel_peers(interface):
+    """
+    Reads the peers of a running interface with `wg show <interface> dump`.
+    :param interface: Interface name.
+    :return: {public key: (preshared key, AllowedIPs)} in the format of desired_state().
+    :raises subprocess.CalledProcessError: If the interface cannot be read.
+    """
+    _, peers = read_wg_dump(interface)
+    return {
+        public_key: (peer.preshared_key or "", ",".join(peer.allowed_ips))
+        for public_key, peer in peers.items()
+    }
+
+
+class ReconcilePlan:
+    """Changes needed to bring wg0.conf and the interface in line with the user database."""
+
+    def __init__(self, changes, kernel, state, notes, signature=None):
+        """
+        :param changes: ChangeSet for wg0.conf.
+        :param kernel: Peer changes for the interface (see peer_delta), None if it could not be read.
+        :param state: Kernel state after the plan is applied (see desired_state).
+        :param notes: Differences that are reported but not changed.
+        :param signature: file_key() of the wg0.conf the plan was built from.
+        """
+        self.changes = changes
+        self.kernel = kernel
+        self.state = state
+        self.notes = notes
+        self.signature = signature
+
+    def __len__(self):
+        return len(self.changes) + len(self.kernel or ())
+
+    def summary(self):
+        """Returns the plan as human-readable text."""
+        lines = []
+        for add in self.changes.adds:
+            lines.append(f"wg0.conf: add peer '{add['name']}' ({add['allowed_ips']})")
+        for name, block in sorted(self.changes.blocks.items()):
+            lines.append(f"wg0.conf: {'block' if block else 'unblock'} '{name}'")
+        for public_key, changes in self.kernel or ():
+            if changes is None:
+                lines.append(f"{self.changes.interface}: remove peer {public_key}")
+            else:
+                fields = ", ".join(
+                    "preshared key" if key == "preshared_key" else f"allowed ips {value}"
+                    for key, value in changes.items()
+                )
+                lines.append(f"{self.changes.interface}: set peer {public_key} ({fields})")
+        if not lines:
+            lines.append("Nothing to change.")
+        lines.extend(f"note: {note}" for note in self.notes)
+        return "\n".join(lines)
+
+
+def build_plan(store=None, path=None, interface=None):
+    """
+    Compares the user database, wg0.conf and the running interface.
+    :param store: UserStore; defaults to get_user_store().
+    :param path: Configuration file; defaults to settings.SERVER_CONFIG_FILE.
+    :param interface: Interface name; defaults to settings.SERVER_WG_NIC.
+    :return: ReconcilePlan.
+    """
+    store = store or get_user_store()
+    interface = interface or settings.SERVER_WG_NIC
+    signature = file_key(path or settings.SERVER_CONFIG_FILE)
+    config = load_wg_config(path)
+    changes = ChangeSet(path, interface)
+    notes = []
+
+    known = set()
+    fields = ["public_key", "preshared_key", "allowed_ips", "status"]
+    for username, record in store.iter_users(fields=fields):
+        blocked = record.get("status") == "blocked"
+        public_key = record.get("public_key")
+        peer = config.peer_by_name(username)
+        if peer is None:
+            if blocked:
+                continue
+            if public_key and record.get("preshared_key") and record.get("allowed_ips"):
+                changes.add_peer(username, public_key, record["preshared_key"], record["allowed_ips"])
+            else:
+                notes.append(f"user '{username}' has no peer in wg0.conf and no keys in the user record")
+            continue
+        known.add(id(peer))
+        if peer.blocked and not blocked:
+            changes.unblock(username)
+        elif blocked and not peer.blocked:
+            changes.block(username)
+        if public_key and public_key not in ("N/A", peer.public_key):
+            notes.append(f"public key of '{username}' differs between the user record and wg0.conf")
+    for peer in config.peers:
+        if id(peer) not in known and not peer.blocked:
+            notes.append(f"peer '{peer.name or peer.public_key}' in wg0.conf has no user record")
+
+    if changes.adds and changes.validate(config):
+        # Only the new peers that conflict (name, address or key in use) are skipped:
+        # they are queued again one by one and each is kept if it adds no problem
+        adds, changes.adds = changes.adds, []
+        known_problems = set(changes.validate(config))
+        for add in adds:
+            changes.adds.append(add)
+            problems = [problem for problem in changes.validate(config) if problem not in known_problems]
+            if problems:
+                changes.adds.pop()
+                notes.extend(f"new peer '{add['name']}' skipped: {problem}" for problem in problems)
+
+    planned = WgConfig.parse(changes.preview(config)) if len(changes) else config
+    state = desired_state(planned)
+    try:
+        actual = _normalize_peers(read_kernel_peers(interface))
+        kernel = peer_delta(actual, _normalize_peers(state[1]))
+        # Changed peers are set to their wg0.conf values (AllowedIPs in file order)
+        kernel = [
+            (key, None if delta is None else {
+                field: state[1][key][0 if field == "preshared_key" else 1] for field in delta
+            })
+            for key, delta in kernel
+        ]
+    except (OSError, subprocess.CalledProcessError, ValueError) as e:
+        kernel = None
+        notes.append(f"interface {interface} could not be read: {e}")
+    return ReconcilePlan(changes, kernel, state, notes, signature)
+
+
+def apply_plan(plan):
+    """
+    Applies a plan: wg0.conf first, then the interface in rate-limited batches.
+    :param plan: ReconcilePlan from build_plan().
+    :return: Number of changed wg0.conf blocks and interface peers.
+    :raises ChangeSetError: If wg0.conf changed meanwhile so that the plan no longer fits.
+    """
+    interface = plan.changes.interface
+    changed = changed_file = plan.changes.apply(sync=False) if len(plan.changes) else 0
+    if plan.kernel:
+        batch = settings.WG_SET_BATCH
+        for first in range(0, len(plan.kernel), batch):
+            if first:
+                time.sleep(settings.RECONCILE_PAUSE)
+            set_peers(interface, plan.kernel[first:first + batch])
+        changed += len(plan.kernel)
+    if plan.kernel is not None:
+        # After a write of wg0.conf the version is unknown: the next sync reads the kernel again
+        record_applied_state(interface, plan.state, None if changed_file else plan.signature)
+    return changed
+
+
+def reconcile(dry_run=False, store=None, path=None, interface=None):
+    """
+    Builds a plan and applies it unless dry_run is set.
+    :return: ReconcilePlan.
+    """
+    plan = build_plan(store, path, interface)
+    print(plan.summary())
+    if not dry_run and len(plan):
+        changed = apply_plan(plan)
+        print(f"✅ Reconciled {changed} change(s).")
+    return plan
+
+
+def start_reconciler(interval=None):
+    """
+    Starts the periodic reconciler in a daemon thread.
+    :param interval: Seconds between runs; defaults to settings.RECONCILE_INTERVAL (0 disables it).
+    :return: threading.Event that stops the loop when set, or None if disabled.
+    """
+    interval = settings.RECONCILE_INTERVAL if interval is None else interval
+    if not interval:
+        return None
+    stop = threading.Event()
+
+    def loop():
+        while not stop.is_set():
+            try:
+                plan = build_plan()
+                if len(plan):
+                    print(plan.summary())
+                    apply_plan(plan)
+            except (ChangeSetError, OSError, subprocess.CalledProcessError) as e:
+                print(f"[ERROR] Reconciliation failed: {e}")
+            stop.wait(interval)
+
+    threading.Thread(target=loop, name="wg-reconciler", daemon=True).start()
+    return stop
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if args == ["--dry-run"]:
+        reconcile(dry_run=True)
+    elif not args:
+        reconcile()
+    elif len(args) == 2 and args[0] == "--watch" and args[1].isdigit():
+        start_reconciler(int(args[1]))
+        threading.Event().wait()
+    else:
+        print("Usage: python3 -m modules.reconciler [--dry-run | --watch SECONDS]")
+        sys.exit(1)
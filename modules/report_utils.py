@@ -10,7 +10,6 @@
 # Updated: 2024-12-10
 
 import os
-import json
 import subprocess
 import platform
 import psutil
@@ -21,6 +20,7 @@ from pathlib import Path
 from modules.firewall_utils import get_external_ip
 from settings import SUMMARY_REPORT_PATH, TEST_REPORT_PATH
 from modules.test_report_generator import generate_report
+from modules.user_store import get_user_store
 
 # Path to the script for creating summary_report
 SUMMARY_SCRIPT = Path(__file__).resolve().parent.parent / "ai_diagnostics" / "ai_diagnostics_summary.py"
@@ -85,16 +85,17 @@ def get_wireguard_peers():
     except subprocess.CalledProcessError:
         return colored("Error retrieving data ❌", "red")
 
-def get_users_data():
-    """Retrieves user information from user_records.json."""
-    user_records_path = os.path.join("user", "data", "user_records.json")
+def get_users_data(fields=None):
+    """
+    Retrieves user information from the user database.
+    :param fields: Field names to return; None returns whole records.
+    :return: Dictionary {username: record}, or an error message if the database cannot be read.
+    """
     try:
-        with open(user_records_path, "r") as file:
-            return json.load(file)
-    except FileNotFoundError:
-        return colored("File user_records.json is missing ❌", "red")
-    except json.JSONDecodeError:
-        return colored("File user_records.json is corrupted ❌", "red")
+        # Read inside the try: iter_users() is lazy and fails only when consumed
+        return dict(get_user_store().iter_users(fields))
+    except Exception as e:
+        return colored(f"User database is unavailable: {e} ❌", "red")
 
 def get_gradio_status(port=7860):
     """Checks the status of Gradio."""
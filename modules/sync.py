@@ -1,10 +1,13 @@
 #!/usr/bin/env python3
-import json
-import shutil
+import io
+import os
 from pathlib import Path
-from settings import USER_DB_PATH, SERVER_CONFIG_FILE
+from settings import SERVER_CONFIG_FILE
+from modules.user_store import get_user_store
+from modules.artifact_store import get_artifact_store
 from modules.main_registration_fields import create_user_record
 from modules.qr_generator import generate_qr_code
+from modules.wg_config import load_wg_config
 
 def get_valid_path(prompt):
     while True:
@@ -14,18 +17,29 @@ def get_valid_path(prompt):
             return path
         print(f"Error: Directory '{path_str}' does not exist. Please try again.\n")
 
-def find_user_files(username, config_dir, qr_dir):
-    config_path = next(
-        (f for ext in ['.conf', '.txt'] 
-         if (f := config_dir / f"{username}{ext}").exists()),
-        None
-    )
-    qr_path = next(
-        (f for ext in ['.png', '.jpg', '.svg']
-         if (f := qr_dir / f"{username}{ext}").exists()),
-        None
-    )
-    return config_path, qr_path
+def index_user_files(directory, extensions):
+    """
+    Lists a directory once and maps usernames to files.
+    :param extensions: Accepted extensions, most preferred first.
+    :return: {username: Path}.
+    """
+    found = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            username, ext = os.path.splitext(entry.name)
+            if ext not in extensions or not entry.is_file():
+                continue
+            current = found.get(username)
+            if current is None or extensions.index(ext) < extensions.index(current.suffix):
+                found[username] = Path(entry.path)
+    return found
+
+def pad_base64(value):
+    """Restores '=' padding of a base64 key if it was lost."""
+    missing_padding = len(value) % 4
+    if missing_padding:
+        value += '=' * (4 - missing_padding)
+    return value
 
 def sync_users_from_config_paths(config_dir_str: str, qr_dir_str: str):
     logs = []
@@ -42,68 +56,41 @@ def sync_users_from_config_paths(config_dir_str: str, qr_dir_str: str):
         logs.append(f"Config dir: {config_dir}\nQR dir: {qr_dir}\n")
 
         # Parse server config
-        with open(SERVER_CONFIG_FILE, "r") as f:
-            config_content = f.read()
-
         users = []
-        current_user = {}
-        for line in config_content.split('\n'):
-            line = line.strip()
-            if line.startswith("### Client"):
-                if current_user:
-                    users.append(current_user)
-                current_user = {"username": line.split("### Client")[1].strip()}
-            elif line.startswith("PublicKey ="):
-                _, value = line.split('=', 1)
-                public_key = value.strip()
-                missing_padding = len(public_key) % 4
-                if missing_padding:
-                    public_key += '=' * (4 - missing_padding)
-                current_user["public_key"] = public_key
-            elif line.startswith("PresharedKey ="):
-                _, value = line.split('=', 1)
-                preshared_key = value.strip()
-                missing_padding = len(preshared_key) % 4
-                if missing_padding:
-                    preshared_key += '=' * (4 - missing_padding)
-                current_user["preshared_key"] = preshared_key
-            elif line.startswith("AllowedIPs ="):
-                current_user["allowed_ips"] = line.split('=', 1)[1].strip()
-            elif line == "" and current_user:
-                users.append(current_user)
-                current_user = {}
-        if current_user:
-            users.append(current_user)
-
-        # Load existing records
-        user_records = {}
-        if USER_DB_PATH.exists():
-            with open(USER_DB_PATH, "r") as f:
-                user_records = json.load(f)
+        for peer in load_wg_config(SERVER_CONFIG_FILE).peers:
+            if peer.name is None:
+                continue
+            users.append({
+                "username": peer.name,
+                "public_key": pad_base64(peer.public_key or ""),
+                "preshared_key": pad_base64(peer.preshared_key or ""),
+                "allowed_ips": peer.get("AllowedIPs", ""),
+            })
+
+        # User database and artifact store
+        store = get_user_store()
+        artifacts = get_artifact_store()
+        config_files = index_user_files(config_dir, ['.conf', '.txt'])
+        qr_files = index_user_files(qr_dir, ['.png', '.jpg', '.svg'])
 
         new_users = 0
         for user in users:
             username = user["username"]
             logs.append(f"Processing: {username}")
 
-            config_path, qr_path = find_user_files(username, config_dir, qr_dir)
+            config_path, qr_path = config_files.get(username), qr_files.get(username)
             
             # Skip if no files found
             if not config_path and not qr_path:
                 logs.append(f"  ❗ Skipping - no config/QR found")
                 continue
 
-            target_config = Path(f"user/data/wg_configs/{username}.conf")
-            target_qr = Path(f"user/data/qrcodes/{username}.png")
-            
-            # Create directories if needed
-            target_config.parent.mkdir(parents=True, exist_ok=True)
-            target_qr.parent.mkdir(parents=True, exist_ok=True)
+            target_config = target_qr = None
 
             # Handle config file
             config_processed = False
             if config_path:
-                shutil.copy(config_path, target_config)
+                target_config = artifacts.put(username, "config", config_path.read_bytes())
                 logs.append(f"  ✅ Copied config: {config_path.name}")
                 config_processed = True
             else:
@@ -112,12 +99,14 @@ def sync_users_from_config_paths(config_dir_str: str, qr_dir_str: str):
             # Handle QR code
             qr_processed = False
             if qr_path:
-                shutil.copy(qr_path, target_qr)
+                target_qr = artifacts.put_file(username, "qr", qr_path)
                 logs.append(f"  ✅ Copied QR: {qr_path.name}")
                 qr_processed = True
             elif config_processed:
                 try:
-                    generate_qr_code(target_config.read_text(), str(target_qr))
+                    qr_image = io.BytesIO()
+                    generate_qr_code(config_path.read_text(), qr_image)
+                    target_qr = artifacts.put(username, "qr", qr_image.getvalue())
                     logs.append("  🔄 Generated QR from config")
                     qr_processed = True
                 except Exception as e:
@@ -129,7 +118,7 @@ def sync_users_from_config_paths(config_dir_str: str, qr_dir_str: str):
                 continue
 
             # Update user records
-            if username not in user_records:
+            if username not in store:
                 user_record = create_user_record(
                     username=username,
                     address=user.get("allowed_ips", ""),
@@ -138,13 +127,9 @@ def sync_users_from_config_paths(config_dir_str: str, qr_dir_str: str):
                     qr_code_path=str(target_qr) if qr_processed else None
                 )
                 user_record["config_path"] = str(target_config) if config_processed else None
-                user_records[username] = user_record
+                store.put(username, user_record)
                 new_users += 1
 
-        # Save updated database
-        with open(USER_DB_PATH, "w") as f:
-            json.dump(user_records, f, indent=4)
-
         logs.append(f"\n✅ Sync complete! New users: {new_users}")
         return True, "\n".join(logs)
 
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# modules/telemetry_poller.py
+# ===========================================
+# Resident WireGuard telemetry poller
+# ===========================================
+# The admin panel used to run `wg show` and rewrite the user database on
+# every page build and refresh, so page latency grew with the runtime of
+# `wg` and the number of users. The poller samples the interface in a
+# background thread instead:
+# - every settings.TELEMETRY_INTERVAL seconds it reads `wg show <nic> dump`
+#   (modules/wg_dump.py) into an immutable TelemetrySnapshot with the time
+#   of the sample;
+# - every sample is added to the traffic history (modules/traffic_history.py);
+# - every settings.TELEMETRY_PERSIST_INTERVAL seconds it writes the changed
+#   traffic and handshake values to the user database (one batch);
+# - UI handlers only read the latest snapshot, which never blocks.
+# A failed sample keeps the previous peers and records the error.
+#
+# Example usage:
+# ---------------------
+# from modules.telemetry_poller import get_telemetry_snapshot
+#
+# snapshot = get_telemetry_snapshot()   # Starts the poller on first use
+# peer = snapshot.peers.get(public_key)
+# print(snapshot.age, peer.transfer_rx if peer else 0)
+
+import subprocess
+import threading
+import time
+from types import MappingProxyType
+
+import settings
+from modules.traffic_history import get_traffic_history
+from modules.traffic_updater import update_user_telemetry
+from modules.wg_dump import read_wg_dump
+
+
+class TelemetrySnapshot:
+    """Peers of the interface at one point in time (read-only)."""
+
+    __slots__ = ("peers", "sampled_at", "duration", "error")
+
+    def __init__(self, peers, sampled_at, duration=0.0, error=None):
+        self.peers = peers              # Read-only {public_key: WgPeerStatus}
+        self.sampled_at = sampled_at    # Unix time of the sample, None before the first one
+        self.duration = duration        # Seconds taken by `wg show dump`
+        self.error = error              # Error of the last sample, if it failed
+
+    @property
+    def age(self):
+        """Seconds since the sample, or None if there was none yet."""
+        return None if self.sampled_at is None else max(0.0, time.time() - self.sampled_at)
+
+    def describe(self):
+        """Returns a short freshness text for the UI."""
+        if self.sampled_at is None:
+            return "⏳ Waiting for the first WireGuard sample..."
+        text = f"📡 WireGuard data from {self.age:.0f} s ago ({len(self.peers)} peers)"
+        if self.error:
+            text += f" — last sample failed: {self.error}"
+        return text
+
+
+EMPTY_SNAPSHOT = TelemetrySnapshot(MappingProxyType({}), None)
+
+
+class TelemetryPoller:
+    """Samples an interface periodically in a daemon thread."""
+
+    def __init__(self, interface=None, interval=None, persist_interval=None, reader=read_wg_dump, history=None):
+        """
+        :param interface: Interface name; defaults to settings.SERVER_WG_NIC.
+        :param interval: Seconds between samples; defaults to settings.TELEMETRY_INTERVAL.
+        :param persist_interval: Seconds between user database writes; defaults to
+                                 settings.TELEMETRY_PERSIST_INTERVAL (0 disables them).
+        :param reader: Function (interface) -> (status, peers); defaults to read_wg_dump.
+        :param history: TrafficHistory receiving every sample, or None.
+        """
+        self.interface = interface or settings.SERVER_WG_NIC
+        self.interval = settings.TELEMETRY_INTERVAL if interval is None else interval
+        self.persist_interval = (settings.TELEMETRY_PERSIST_INTERVAL
+                                 if persist_interval is None else persist_interval)
+        self._reader = reader
+        self._history = history
+        self._snapshot = EMPTY_SNAPSHOT
+        self._last_persist = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def snapshot(self):
+        """The latest TelemetrySnapshot (never blocks)."""
+        return self._snapshot
+
+    def poll_once(self):
+        """Takes one sample and persists it if the persist interval has passed."""
+        start = time.perf_counter()
+        try:
+            _, peers = self._reader(self.interface)
+        except (OSError, subprocess.CalledProcessError, ValueError) as e:
+            previous = self._snapshot
+            self._snapshot = TelemetrySnapshot(previous.peers, previous.sampled_at, previous.duration, str(e))
+            return self._snapshot
+        self._snapshot = TelemetrySnapshot(MappingProxyType(peers), time.time(), time.perf_counter() - start)
+        if self._history is not None:
+            try:
+                self._history.record(peers, self._snapshot.sampled_at)
+            except OSError as e:
+                print(f"[ERROR] Failed to record traffic history: {e}")
+
+        now = time.monotonic()
+        if self.persist_interval and (self._last_persist is None or now - self._last_persist >= self.persist_interval):
+            self._last_persist = now
+            try:
+                update_user_telemetry(self.interface, peers=peers)
+            except Exception as e:
+                print(f"[ERROR] Failed to save WireGuard telemetry: {e}")
+        return self._snapshot
+
+    def start(self):
+        """Starts the sampling thread (no-op if it is running)."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="wg-telemetry", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stops the sampling thread after the current sample."""
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.poll_once()
+            self._stop.wait(self.interval)
+
+
+_poller = None
+_poller_lock = threading.Lock()
+
+
+def get_telemetry_poller():
+    """Returns the process-wide poller of settings.SERVER_WG_NIC, started."""
+    global _poller
+    with _poller_lock:
+        if _poller is None:
+            _poller = TelemetryPoller(history=get_traffic_history())
+        _poller.start()
+        return _poller
+
+
+def get_telemetry_snapshot():
+    """Returns the latest telemetry snapshot, starting the poller on first use."""
+    return get_telemetry_poller().snapshot
@@ -18,7 +18,8 @@ PROJECT_ROOT = Path(__file__).resolve().parent.parent
 sys.path.append(str(PROJECT_ROOT))
 
 # Import settings
-from settings import TEST_REPORT_PATH, USER_DB_PATH, WG_CONFIG_DIR, GRADIO_PORT
+from settings import TEST_REPORT_PATH, USER_DB_PATH, USER_DB_SQLITE_PATH, USER_DB_BACKEND, WG_CONFIG_DIR, GRADIO_PORT
+from modules.user_store import get_user_store
 
 def load_json(filepath):
     """Loads data from a JSON file."""
@@ -53,7 +54,6 @@ def get_gradio_status():
 def generate_report():
     """Generates a complete report on the project's state."""
     timestamp = datetime.utcnow().isoformat()
-    user_records = load_json(USER_DB_PATH)
 
     report_lines = [
         f"\n === 📝  Project _generator Status Report  ===",
@@ -64,6 +64,7 @@ def generate_report():
     report_lines.append(" === 📂  Project Structure Check  ===")
     required_files = {
         "user_records.json": USER_DB_PATH,
+        "user_records.sqlite3": USER_DB_SQLITE_PATH,
         "wg_configs": WG_CONFIG_DIR,
     }
     for name, path in required_files.items():
@@ -74,14 +75,14 @@ def generate_report():
         report_lines.append(f"- {folder}: {' 🟢  Exists' if os.path.exists(folder) else ' ❌  Missing'}")
 
     # Data from JSON
-    report_lines.append("\n === 📄  Data from user_records.json  ===")
-    if isinstance(user_records, dict):
+    report_lines.append(f"\n === 📄  Data from user database ({USER_DB_BACKEND})  ===")
+    try:
         table = PrettyTable(["User", "peer", "telegram_id"])
-        for username, data in user_records.items():
+        for username, data in get_user_store().iter_users(fields=["peer", "telegram_id"]):
             table.add_row([username, data.get('peer', 'N/A'), data.get('telegram_id', 'N/A')])
         report_lines.append(str(table))
-    else:
-        report_lines.append(f"{user_records}\n")
+    except Exception as e:
+        report_lines.append(f" ❌  User database is unavailable: {e}\n")
 
     # WireGuard check
     report_lines.append("\n === 🔒  WireGuard Results (wg show)  ===")
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+# modules/traffic_history.py
+# ===========================================
+# Per-peer traffic history in fixed-size ring buffers
+# ===========================================
+# Every peer has one memory-mapped file of a fixed size under
+# settings.TRAFFIC_HISTORY_DIR; a "_fleet" file holds the sum of all peers.
+# A file is a 64-byte header followed by one ring buffer per tier of
+# settings.TRAFFIC_HISTORY_TIERS, e.g. 10-second samples for an hour,
+# minutes for a day, hours for a month and days for two years. Each sample
+# is written into the current bucket of every tier at once, so the rollups
+# are always up to date and old buckets are overwritten in place: disk and
+# memory use depend only on the number of peers.
+#
+# Slots hold cumulative byte counters (received, sent) at the end of their
+# bucket instead of per-bucket amounts; skipped buckets are filled with the
+# previous total. The traffic between two moments is therefore the
+# difference of two slots, whatever the length of the range:
+# bytes_since() and user_bytes() read two slots, fleet_series() one slot per
+# returned bucket. Results are exact up to the bucket width of the finest
+# tier that still covers the start of the range.
+#
+# The kernel counters are converted to deltas against the previous sample;
+# a counter that went down (interface restarted) counts from zero.
+# Files are written under a lock, so several processes can record.
+# The series of the peers in the latest sample stay mapped (each sample
+# writes all of them); settings.TRAFFIC_HISTORY_MAX_OPEN bounds the other,
+# least recently read series. forget() deletes the series of a removed or
+# rekeyed peer, clear() all of them.
+# Built on mmap/struct from the standard library (no numpy).
+#
+# Example usage:
+# ---------------------
+# from modules.traffic_history import get_traffic_history
+#
+# history = get_traffic_history()
+# history.record(peers)                          # {public_key: WgPeerStatus}, once per sample
+# rx, tx = history.user_bytes("alice", hours=24)
+# history.forget(public_key)                     # User deleted or rekeyed
+# for start, rx, tx in history.fleet_series(3600, since=time.time() - 86400):
+#     print(start, rx, tx)
+
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+
+import settings
+from modules.atomic_io import locked
+from modules.wg_dump import counter_delta
+
+MAGIC = b"WGTS"
+VERSION = 1
+FLEET = "_fleet"
+
+# magic, version, tiers checksum, first sample, last sample,
+# last kernel rx/tx counters, cumulative rx/tx
+HEADER = struct.Struct("<4sIIqqQQQQ")
+HEADER_SIZE = 64
+SLOT = struct.Struct("<qQQ")  # Bucket start (Unix time), cumulative rx, cumulative tx
+
+
+def _file_name(public_key):
+    # Base64 keys may contain "/" and "+"
+    return public_key.replace("/", "_").replace("+", "-") + ".ts"
+
+
+class _Series:
+    """One memory-mapped series file."""
+
+    def __init__(self, path, tiers):
+        self.tiers = tiers
+        self.checksum = zlib.crc32(repr(tiers).encode())
+        self.offsets = []
+        offset = HEADER_SIZE
+        for width, slots in tiers:
+            self.offsets.append(offset)
+            offset += slots * SLOT.size
+        size = offset
+
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            current = os.fstat(fd).st_size
+            if current != size:
+                if current:
+                    print(f"⚠️ Traffic history {path} has another layout, starting it over.")
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, size)
+            self.map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        magic, version, checksum = HEADER.unpack_from(self.map, 0)[:3]
+        if (magic, version, checksum) != (MAGIC, VERSION, self.checksum):
+            self.map[:] = bytes(size)
+            self._write_header(0, 0, 0, 0, 0, 0)
+
+    def header(self):
+        return HEADER.unpack_from(self.map, 0)[3:]
+
+    def _write_header(self, first, last, raw_rx, raw_tx, total_rx, total_tx):
+        HEADER.pack_into(self.map, 0, MAGIC, VERSION, self.checksum, first, last, raw_rx, raw_tx, total_rx, total_tx)
+
+    def _slot(self, tier, bucket):
+        width, slots = self.tiers[tier]
+        return self.offsets[tier] + (bucket // width) % slots * SLOT.size
+
+    def add(self, timestamp, delta_rx, delta_tx, raw_rx=0, raw_tx=0):
+        """Adds traffic at a moment (not before the previous sample)."""
+        first, last, _, _, total_rx, total_tx = self.header()
+        if not first:
+            first = last = timestamp
+        timestamp = max(timestamp, last)
+        new_rx, new_tx = total_rx + delta_rx, total_tx + delta_tx
+        for tier, (width, slots) in enumerate(self.tiers):
+            bucket = timestamp - timestamp % width
+            # Buckets without samples keep the total reached before them
+            gap_start = max(last - last % width + width, bucket - (slots - 1) * width)
+            for skipped in range(gap_start, bucket, width):
+                SLOT.pack_into(self.map, self._slot(tier, skipped), skipped, total_rx, total_tx)
+            SLOT.pack_into(self.map, self._slot(tier, bucket), bucket, new_rx, new_tx)
+        self._write_header(first, timestamp, raw_rx, raw_tx, new_rx, new_tx)
+
+    def cumulative_at(self, moment):
+        """Returns the cumulative (rx, tx) at a moment, to the precision of the finest covering tier."""
+        first, last, _, _, total_rx, total_tx = self.header()
+        if not first or moment < first:
+            return 0, 0
+        if moment > last:
+            return total_rx, total_tx
+        for tier, (width, slots) in enumerate(self.tiers):
+            bucket = moment - moment % width - width  # Last bucket that ended by this moment
+            if bucket < first - first % width:
+                return 0, 0
+            if bucket <= last - last % width - slots * width:
+                continue  # Already overwritten in this tier
+            start, rx, tx = SLOT.unpack_from(self.map, self._slot(tier, bucket))
+            if start == bucket:
+                return rx, tx
+        return 0, 0
+
+    def close(self):
+        self.map.close()
+
+
+class TrafficHistory:
+    """Traffic time series of all peers (see the module description)."""
+
+    def __init__(self, directory=None, tiers=None, max_open=None):
+        """
+        :param directory: Directory of the series files; defaults to settings.TRAFFIC_HISTORY_DIR.
+        :param tiers: ((bucket seconds, buckets kept), ...) from fine to coarse;
+                      defaults to settings.TRAFFIC_HISTORY_TIERS.
+        :param max_open: Series of peers missing from the latest sample kept mapped at once;
+                         defaults to settings.TRAFFIC_HISTORY_MAX_OPEN.
+        """
+        self.directory = Path(directory or settings.TRAFFIC_HISTORY_DIR)
+        self.tiers = tuple(tuple(tier) for tier in (tiers or settings.TRAFFIC_HISTORY_TIERS))
+        self.max_open = max_open or settings.TRAFFIC_HISTORY_MAX_OPEN
+        self._open = OrderedDict()  # {name: _Series}, least recently used first
+        self._active = set()        # Names recorded in the latest sample (always mapped)
+        self._lock = threading.RLock()
+
+    def file_size(self):
+        """Size in bytes of one series file."""
+        return HEADER_SIZE + sum(slots for _, slots in self.tiers) * SLOT.size
+
+    def _series(self, name, create=False):
+        series = self._open.get(name)
+        if series is not None:
+            self._open.move_to_end(name)
+            return series
+        path = self.directory / _file_name(name)
+        if not create and not path.exists():
+            return None
+        self.directory.mkdir(parents=True, exist_ok=True)
+        series = self._open[name] = _Series(path, self.tiers)
+        if name not in self._active:
+            self._trim()
+        return series
+
+    def _trim(self):
+        """Unmaps the least recently used series beyond max_open, except the active ones."""
+        excess = len(self._open) - len(self._active) - self.max_open
+        if excess <= 0:
+            return
+        idle = []
+        for name in self._open:
+            if name not in self._active:
+                idle.append(name)
+                if len(idle) == excess:
+                    break
+        for name in idle:
+            self._open.pop(name).close()
+
+    def record(self, peers, timestamp=None):
+        """
+        Adds one sample of the interface.
+        :param peers: {public_key: WgPeerStatus} (e.g. from read_wg_dump()).
+        :param timestamp: Unix time of the sample; defaults to now.
+        """
+        timestamp = int(time.time() if timestamp is None else timestamp)
+        fleet_rx = fleet_tx = 0
+        with self._lock, locked(self.directory / FLEET):
+            self._active = set(peers) | {FLEET}
+            for public_key, peer in peers.items():
+                series = self._series(public_key, create=True)
+                first, _, raw_rx, raw_tx, _, _ = series.header()
+                if not first:
+                    delta_rx = delta_tx = 0  # The first sample is the baseline
+                else:
+                    delta_rx = counter_delta(peer.transfer_rx, raw_rx)
+                    delta_tx = counter_delta(peer.transfer_tx, raw_tx)
+                series.add(timestamp, delta_rx, delta_tx, peer.transfer_rx, peer.transfer_tx)
+                fleet_rx += delta_rx
+                fleet_tx += delta_tx
+            self._series(FLEET, create=True).add(timestamp, fleet_rx, fleet_tx)
+            self._trim()  # Peers gone since the previous sample are idle now
+
+    def forget(self, public_key):
+        """
+        Deletes the series of a peer (user deleted or rekeyed).
+        :param public_key: Peer public key.
+        :return: True if a series file was deleted.
+        """
+        if not self.directory.exists():
+            return False
+        with self._lock, locked(self.directory / FLEET):
+            self._active.discard(public_key)
+            series = self._open.pop(public_key, None)
+            if series is not None:
+                series.close()
+            try:
+                (self.directory / _file_name(public_key)).unlink()
+                return True
+            except FileNotFoundError:
+                return False
+
+    def clear(self):
+        """
+        Deletes the series of all peers and the fleet.
+        :return: Number of deleted files.
+        """
+        if not self.directory.exists():
+            return 0
+        with self._lock, locked(self.directory / FLEET):
+            self.close()
+            removed = 0
+            for path in self.directory.glob("*.ts"):
+                path.unlink(missing_ok=True)
+                removed += 1
+            return removed
+
+    def bytes_between(self, public_key, since, until=None):
+        """
+        Returns the traffic of a peer in the time range [since, until).
+        :param public_key: Peer public key (or FLEET for all peers).
+        :param since: Start of the range (Unix time).
+        :param until: End of the range; defaults to now.
+        :return: (received, sent) bytes.
+        """
+        until = time.time() if until is None else until
+        with self._lock:
+            series = self._series(public_key)
+            if series is None:
+                return 0, 0
+            start_rx, start_tx = series.cumulative_at(int(since))
+            end_rx, end_tx = series.cumulative_at(int(until))
+        return end_rx - start_rx, end_tx - start_tx
+
+    def bytes_since(self, public_key, seconds):
+        """Returns the (received, sent) bytes of a peer in the last `seconds`."""
+        return self.bytes_between(public_key, time.time() - seconds)
+
+    def user_bytes(self, username, hours):
+        """
+        Returns the (received, sent) bytes of a user in the last `hours` hours.
+        :param username: Username (resolved to its public key through the user store).
+        """
+        from modules.user_store import get_user_store
+        record = get_user_store().get(username)
+        if not record or not record.get("public_key"):
+            return 0, 0
+        return self.bytes_since(record["public_key"], hours * 3600)
+
+    def fleet_series(self, width, since, until=None, public_key=FLEET):
+        """
+        Returns the traffic per bucket of one tier.
+        :param width: Bucket width in seconds (one of the tier widths).
+        :param since: Start of the range (Unix time).
+        :param until: End of the range; defaults to now.
+        :param public_key: Peer to report instead of the whole fleet.
+        :return: [(bucket start, received, sent)] in time order.
+        """
+        if width not in dict(self.tiers):
+            raise ValueError(f"no traffic history tier with {width}-second buckets")
+        until = int(time.time() if until is None else until)
+        result = []
+        with self._lock:
+            series = self._series(public_key)
+            if series is None:
+                return result
+            bucket = int(since) - int(since) % width
+            previous = series.cumulative_at(bucket)
+            while bucket < until:
+                current = series.cumulative_at(min(bucket + width, until))
+                result.append((bucket, current[0] - previous[0], current[1] - previous[1]))
+                previous = current
+                bucket += width
+        return result
+
+    def close(self):
+        """Unmaps all open series."""
+        with self._lock:
+            for series in self._open.values():
+                series.close()
+            self._open.clear()
+            self._active = set()
+
+
+_history = None
+_history_lock = threading.Lock()
+
+
+def get_traffic_history():
+    """Returns the process-wide TrafficHistory."""
+    global _history
+    with _history_lock:
+        if _history is None:
+            _history = TrafficHistory()
+        return _history
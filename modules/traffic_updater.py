@@ -1,49 +1,123 @@
 #!/usr/bin/env python3
 # modules/traffic_updater.py
 
-import json
-import os
 import subprocess
+from datetime import datetime, timezone
 from settings import SERVER_WG_NIC  # Import WireGuard interface from settings
-from settings import USER_DB_PATH
+from modules.user_store import get_user_store
+from modules.handshake_updater import update_handshakes
+from modules.wg_dump import counter_delta, format_bytes, read_wg_dump
 
-def update_traffic_data(user_records_path):
+# Traffic is accounted in integer bytes: rx_bytes/tx_bytes are lifetime totals,
+# period_rx_bytes/period_tx_bytes the totals of the current calendar month (UTC),
+# and rx_baseline/tx_baseline the kernel counters seen at the last accounting.
+# Kernel counters restart from zero when the interface or the peer is recreated;
+# a counter below its baseline is counted as new traffic (see counter_delta).
+# Sizes are formatted only for display (format_transfer, traffic_totals).
+
+def current_period(now=None):
+    """Returns the accounting period ("YYYY-MM", UTC) of a moment."""
+    return (now or datetime.now(timezone.utc)).strftime("%Y-%m")
+
+def traffic_totals(record, peer=None, now=None):
     """
-    Updates user traffic data, recording the same values for transfer and total_transfer in user_records.json.
+    Returns the traffic totals of a user, including the traffic a newer kernel
+    sample shows beyond the stored baseline (nothing is written).
+    :param record: User record.
+    :param peer: WgPeerStatus of the user's peer, or None to use the stored values only.
+    :return: {"rx_bytes", "tx_bytes", "period_rx_bytes", "period_tx_bytes", "period_start"}.
     """
-    if not os.path.exists(USER_DB_PATH):
-        print(f"File {USER_DB_PATH} not found.")
-        return
+    period = current_period(now)
+    same_period = record.get("period_start") == period
+    totals = {
+        "rx_bytes": record.get("rx_bytes", 0),
+        "tx_bytes": record.get("tx_bytes", 0),
+        "period_rx_bytes": record.get("period_rx_bytes", 0) if same_period else 0,
+        "period_tx_bytes": record.get("period_tx_bytes", 0) if same_period else 0,
+        "period_start": period,
+    }
+    if peer is not None:
+        delta_rx = counter_delta(peer.transfer_rx, record.get("rx_baseline", 0))
+        delta_tx = counter_delta(peer.transfer_tx, record.get("tx_baseline", 0))
+        totals["rx_bytes"] += delta_rx
+        totals["tx_bytes"] += delta_tx
+        totals["period_rx_bytes"] += delta_rx
+        totals["period_tx_bytes"] += delta_tx
+    return totals
 
-    # Load user data
-    with open(USER_DB_PATH, "r") as f:
-        user_records = json.load(f)
+def account_traffic(record, peer, now=None):
+    """
+    Computes the traffic fields of a user after a kernel sample.
+    :param record: User record.
+    :param peer: WgPeerStatus of the user's peer.
+    :return: Fields to update (empty if nothing changed).
+    """
+    fields = traffic_totals(record, peer, now)
+    fields["rx_baseline"] = peer.transfer_rx
+    fields["tx_baseline"] = peer.transfer_tx
+    return {key: value for key, value in fields.items() if record.get(key) != value}
+
+def format_transfer(received, sent):
+    """Formats byte counters for display."""
+    return f"{format_bytes(received)} received, {format_bytes(sent)} sent"
+
+def update_traffic_data(user_records_path=None, batch=None, peers=None, user_records=None, users_by_key=None):
+    """
+    Accounts user traffic from the kernel counters into the integer traffic fields of the user database.
+    :param user_records_path: Kept for compatibility; the configured user store is used.
+    :param batch: UserBatch to queue the changes in; by default they are written at the end of the call.
+    :param peers: {public_key: WgPeerStatus} already read with read_wg_dump(); read here if omitted.
+    :param user_records: All user records already read with store.all(); read here if omitted.
+    :param users_by_key: store.index_map("public_key") already read; read here if omitted.
+    """
+    store = get_user_store()
+    if batch is None:
+        with store.batch() as batch:
+            return update_traffic_data(user_records_path, batch, peers, user_records, users_by_key)
+
+    if user_records is None:
+        user_records = store.all()
+    if users_by_key is None:
+        users_by_key = store.index_map("public_key")
 
     try:
         # Retrieve traffic data from WireGuard
-        output = subprocess.check_output(["wg", "show", SERVER_WG_NIC, "transfer"], text=True)
-        lines = output.strip().split("\n")
-
-        for line in lines:
-            parts = line.split()
-            if len(parts) >= 3:
-                public_key = parts[0]
-                received = int(parts[1])  # Current received data
-                sent = int(parts[2])
-
-                # Find the user by public_key
-                for username, user_data in user_records.items():
-                    if user_data.get("public_key") == public_key:
-                        # Update the transfer field
-                        transfer_str = f"{received / (1024 ** 2):.2f} MiB received, {sent / (1024 ** 2):.2f} MiB sent"
-                        user_data["transfer"] = transfer_str
-                        user_data["total_transfer"] = transfer_str  # Duplicate the value
-                        break
+        if peers is None:
+            _, peers = read_wg_dump(SERVER_WG_NIC)
+
+        now = datetime.now(timezone.utc)
+        for public_key, peer in peers.items():
+            # Find the user by public_key
+            username = users_by_key.get(public_key)
+            if username in user_records:
+                # Update only the changed user
+                fields = account_traffic(user_records[username], peer, now)
+                if fields:
+                    batch.update(username, fields)
 
     except Exception as e:
         print(f"Error updating traffic data: {e}")
         return
 
-    # Save updated data
-    with open(USER_DB_PATH, "w") as f:
-        json.dump(user_records, f, indent=4)
+def update_user_telemetry(interface=SERVER_WG_NIC, peers=None):
+    """
+    Refreshes traffic and handshake data of all users with a single `wg show dump`
+    call, a single read of the user records and a single database write.
+    :param interface: Name of the WireGuard interface.
+    :param peers: {public_key: WgPeerStatus} already read with read_wg_dump(); read here if omitted.
+    """
+    if peers is None:
+        try:
+            _, peers = read_wg_dump(interface)
+        except (OSError, subprocess.CalledProcessError, ValueError) as e:
+            print(f"Error reading WireGuard data: {e}")
+            return 0
+    store = get_user_store()
+    with store.batch() as batch:
+        # Both producers work from the same records and key index
+        user_records = store.all()
+        users_by_key = store.index_map("public_key")
+        update_traffic_data(batch=batch, peers=peers, user_records=user_records, users_by_key=users_by_key)
+        update_handshakes(None, interface, batch=batch, peers=peers,
+                          user_records=user_records, users_by_key=users_by_key)
+    return batch.updated
@@ -18,6 +18,7 @@ try:
         SERVER_CONFIG_FILE,
         PARAMS_FILE,
         WG_CONFIG_DIR,
+        ARTIFACT_DIR,
         LOG_FILE_PATH,
         LOG_LEVEL,
         LOG_DIR,
@@ -100,6 +101,9 @@ def uninstall_wireguard():
                 logger.info(f"Removed WireGuard user config directory: {WG_CONFIG_DIR}")
             else:
                 print("⚠️ WireGuard config directory not found.")
+            if ARTIFACT_DIR.exists():
+                shutil.rmtree(ARTIFACT_DIR)
+                logger.info(f"Removed client config and QR code store: {ARTIFACT_DIR}")
             print("✅ Configuration files removed.")
         except Exception as e:
             logger.error("Failed to remove configuration files: %s", e)
@@ -5,77 +5,66 @@ modules/update_wg_data.py
 Updates WireGuard data:
 - Removes duplicate entries.
 - Cleans up usernames.
+- Accumulates integer byte totals per user, surviving kernel counter resets.
+- Records a traffic sample in the per-peer history (modules/traffic_history.py).
 """
 
 import os
 import subprocess
 import json
-from datetime import datetime
+from settings import SERVER_WG_NIC
+from modules.handshake_updater import convert_handshake_timestamp
+from modules.wg_config import load_wg_config
+from modules.traffic_history import get_traffic_history
+from modules.wg_dump import counter_delta, read_wg_dump
 
 # File paths
 WG_CONFIG_PATH = "/etc/wireguard/wg0.conf"
 JSON_LOG_PATH = "/root/pyWGgenerator/pyWGgen/logs/wg_users.json"
-TEXT_LOG_PATH = "/root/pyWGgenerator/pyWGgen/logs/wg_activity.log"
 
-def parse_wg_show():
-    """Reads and parses the output of the `wg show` command."""
-    try:
-        output = subprocess.check_output(["wg"], text=True)
-    except subprocess.CalledProcessError as e:
-        print(f"Error running `wg`: {e}")
-        return None
-
-    peers = {}
-    current_peer = None
-
-    for line in output.splitlines():
-        if line.startswith("peer:"):
-            current_peer = line.split(":")[1].strip()
-            peers[current_peer] = {"transfer": {"received": 0, "sent": 0}, "latest_handshake": None}
-        elif line.strip().startswith("transfer:"):
-            parts = line.strip().split(",")
-            received = parts[0].split()[1]
-            sent = parts[1].split()[1]
-            peers[current_peer]["transfer"] = {"received": received, "sent": sent}
-        elif line.strip().startswith("latest handshake:"):
-            handshake = line.split(":")[1].strip()
-            peers[current_peer]["latest_handshake"] = handshake
-
-    return peers
+def parse_wg_show(peers=None):
+    """
+    Reads the peers of the interface with `wg show <nic> dump`.
+    :param peers: {public_key: WgPeerStatus} already read with read_wg_dump(); read here if omitted.
+    """
+    if peers is None:
+        try:
+            _, peers = read_wg_dump(SERVER_WG_NIC)
+        except (OSError, subprocess.CalledProcessError, ValueError) as e:
+            print(f"Error running `wg show {SERVER_WG_NIC} dump`: {e}")
+            return None
+
+    return {
+        public_key: {
+            "transfer": {"received": peer.transfer_rx, "sent": peer.transfer_tx},
+            "latest_handshake": convert_handshake_timestamp(peer.latest_handshake) if peer.latest_handshake else None,
+            "endpoint": peer.endpoint,
+        }
+        for public_key, peer in peers.items()
+    }
 
 def parse_wg_conf():
     """Reads the WireGuard configuration to map users."""
     try:
-        with open(WG_CONFIG_PATH, "r") as f:
-            config = f.read()
+        config = load_wg_config(WG_CONFIG_PATH)
     except FileNotFoundError:
         print(f"File {WG_CONFIG_PATH} not found.")
         return None
 
-    users = {}
-    current_peer = None
-
-    for line in config.splitlines():
-        if line.strip().startswith("[Peer]"):
-            current_peer = None
-        elif line.strip().startswith("PublicKey ="):
-            current_peer = line.split("=")[1].strip()
-            users[current_peer] = {"username": None, "allowed_ips": None}
-        elif line.strip().startswith("#"):
-            if current_peer:
-                username = line.strip("#").strip()
-                if username.startswith("Client "):
-                    username = username.replace("Client ", "", 1)
-                users[current_peer]["username"] = username
-        elif line.strip().startswith("AllowedIPs ="):
-            if current_peer:
-                users[current_peer]["allowed_ips"] = line.split("=")[1].strip()
-
-    return users
+    return {
+        peer.public_key: {"username": peer.name, "allowed_ips": peer.get("AllowedIPs")}
+        for peer in config.peers
+        if peer.public_key and not peer.blocked
+    }
 
 def update_data():
     """Updates JSON and text logs based on current `wg` data."""
-    wg_show = parse_wg_show()
+    try:
+        _, wg_peers = read_wg_dump(SERVER_WG_NIC)
+    except (OSError, subprocess.CalledProcessError, ValueError) as e:
+        print(f"Error running `wg show {SERVER_WG_NIC} dump`: {e}")
+        return
+    wg_show = parse_wg_show(wg_peers)
     wg_conf = parse_wg_conf()
 
     if not wg_show or not wg_conf:
@@ -91,7 +80,7 @@ def update_data():
     for peer, data in wg_conf.items():
         username = data["username"]
         allowed_ips = data["allowed_ips"]
-        transfer = wg_show.get(peer, {}).get("transfer", {"received": "0 B", "sent": "0 B"})
+        transfer = wg_show.get(peer, {}).get("transfer", {"received": 0, "sent": 0})
         latest_handshake = wg_show.get(peer, {}).get("latest_handshake", None)
 
         # Update user data
@@ -99,7 +88,8 @@ def update_data():
             "peer": peer,
             "endpoints": [],
             "allowed_ips": allowed_ips,
-            "total_transfer": {"received": "0 B", "sent": "0 B"},
+            "total_transfer": {"received": 0, "sent": 0},  # Bytes
+            "baseline": {"received": 0, "sent": 0},        # Kernel counters at the last pass
             "last_handshake": None,
             "status": "inactive"
         })
@@ -111,21 +101,18 @@ def update_data():
         else:
             user_data["status"] = "inactive"
 
-        # Update transfer data
-        new_received = parse_size(transfer["received"])
-        new_sent = parse_size(transfer["sent"])
-        old_received = parse_size(user_data["total_transfer"]["received"])
-        old_sent = parse_size(user_data["total_transfer"]["sent"])
-
-        # Reset if data was cleared
-        if new_received < old_received or new_sent < old_sent:
-            new_received += old_received
-            new_sent += old_sent
-
+        # Update transfer data: integer lifetime totals, kernel counters as the baseline
+        totals = user_data["total_transfer"]
+        baseline = user_data.get("baseline", {"received": 0, "sent": 0})
+        if isinstance(totals["received"], str):
+            # Written by an older version as formatted sizes; the counters were the baseline
+            totals = {key: parse_size(value) for key, value in totals.items()}
+            baseline = dict(totals)
         user_data["total_transfer"] = {
-            "received": format_size(new_received),
-            "sent": format_size(new_sent)
+            key: totals[key] + counter_delta(transfer[key], baseline[key])
+            for key in ("received", "sent")
         }
+        user_data["baseline"] = {"received": transfer["received"], "sent": transfer["sent"]}
 
         # Update endpoint
         endpoint = wg_show.get(peer, {}).get("endpoint", None)
@@ -144,12 +131,8 @@ def update_data():
     with open(JSON_LOG_PATH, "w") as f:
         json.dump(history, f, indent=4)
 
-    # Log to the text file
-    with open(TEXT_LOG_PATH, "a") as f:
-        for username, user_data in history["users"].items():
-            status = user_data["status"]
-            transfer = user_data["total_transfer"]
-            f.write(f"{datetime.now()}: {username} — {status}. Traffic: {transfer['received']} / {transfer['sent']}\n")
+    # Traffic over time goes to the bounded per-peer history (replaces the text activity log)
+    get_traffic_history().record(wg_peers)
 
 def parse_size(size_str):
     """Parses a size string (e.g., '4.88 KiB') into bytes."""
@@ -164,13 +147,5 @@ def parse_size(size_str):
     }
     return int(size * multiplier.get(unit, 1))
 
-def format_size(size_bytes):
-    """Formats a size in bytes into a human-readable format."""
-    for unit in ["B", "KiB", "MiB", "GiB"]:
-        if size_bytes < 1024:
-            return f"{size_bytes:.2f} {unit}"
-        size_bytes /= 1024
-    return f"{size_bytes:.2f} GiB"
-
 if __name__ == "__main__":
     update_data()
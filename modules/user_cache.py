@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# modules/user_cache.py
+# ===========================================
+# Process-wide cache of user records
+# ===========================================
+# The Gradio tabs read the whole user list on every dropdown change,
+# search keystroke and refresh. This cache keeps one decoded copy of the
+# user database per process and reloads it only when:
+# - the files behind the store change on disk (inode, mtime, size), e.g.
+#   after main.py created a user in a separate process;
+# - a write was made through the store in this process;
+# - invalidate_user_records() is called explicitly.
+#
+# Readers receive read-only snapshots. A snapshot is never modified: a
+# change produces a new snapshot, so a reader holding an old one keeps a
+# consistent view. Copy a record with dict(record) before modifying it.
+#
+# Example usage:
+# ---------------------
+# from modules.user_cache import get_user_records
+#
+# records = get_user_records()
+# print(records["alice"]["status"])
+
+import threading
+from types import MappingProxyType
+
+from modules.user_store import get_user_store
+
+
+class UserRecordsCache:
+    """Keeps the latest read-only snapshot of the user database."""
+
+    def __init__(self, store_getter=get_user_store):
+        self._store_getter = store_getter
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._key = None
+
+    def _current_key(self, store):
+        return (id(store), store.generation, store.version_key())
+
+    def snapshot(self):
+        """
+        Returns the current snapshot, reloading it only if the database changed.
+        :return: Read-only mapping {username: read-only record}.
+        """
+        store = self._store_getter()
+        key = self._current_key(store)
+        snapshot = self._snapshot
+        if snapshot is not None and key == self._key:
+            return snapshot
+
+        with self._lock:
+            # Another thread may have reloaded while we were waiting
+            key = self._current_key(store)
+            if self._snapshot is not None and key == self._key:
+                return self._snapshot
+            # Compact UserRecord objects: defaults are materialized on access
+            records = store.records()
+            self._snapshot = MappingProxyType({
+                username: MappingProxyType(record) for username, record in records.items()
+            })
+            self._key = key
+            return self._snapshot
+
+    def invalidate(self):
+        """Forces the next snapshot() call to reload the database."""
+        with self._lock:
+            self._snapshot = None
+            self._key = None
+
+
+_cache = UserRecordsCache()
+
+
+def get_user_records():
+    """Returns the read-only snapshot of all user records."""
+    return _cache.snapshot()
+
+
+def invalidate_user_records():
+    """Drops the cached snapshot (e.g. after the database was changed by another tool)."""
+    _cache.invalidate()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# modules/user_cleanup.py
+# ===========================================
+# Data left behind by a deleted user
+# ===========================================
+# Besides the user record and the [Peer] block, a user leaves data in
+# several stores. forget_user() removes it in one place, so the single and
+# bulk delete paths of the admin panel and the CLI menu clean up the same way:
+# - an entry in settings.DELETED_USERS_LOG, the only place where the time
+#   of deletion (removed_at) is kept once the record is gone;
+# - the client configuration and QR code in the artifact store;
+# - the tunnel addresses, which go into the allocator's quarantine at once;
+# - the cached QR code of the client configuration (it holds the private
+#   key) and the traffic history of the public key.
+# forget_keys() drops what is tied to old keys only; ChangeSet.apply() calls
+# it for clients whose keys changed.
+# Each step is independent: a failing one is reported and the others still run.
+#
+# Example usage:
+# ---------------------
+# from modules.user_cleanup import forget_user
+#
+# record = get_user_store().delete("alice")
+# for kind, path in forget_user("alice", record):
+#     print(f"{kind} artifact {path} deleted")
+# print(record["removed_at"])
+
+import json
+from datetime import datetime
+
+import settings
+from modules.artifact_store import get_artifact_store
+from modules.ip_allocator import release_ips
+from modules.qr_cache import get_qr_cache
+from modules.traffic_history import get_traffic_history
+
+# Fields of a deleted record kept in the deletion log (keys and secrets are left out)
+DELETION_LOG_FIELDS = ("created_at", "email", "telegram_id", "allowed_ips", "public_key")
+
+
+def record_deletion(username, record):
+    """
+    Stamps removed_at on a deleted record and appends it to settings.DELETED_USERS_LOG.
+    :param username: Username.
+    :param record: The deleted user record; removed_at is set on it.
+    """
+    record["removed_at"] = datetime.now().isoformat()
+    entry = {"username": username, "removed_at": record["removed_at"]}
+    entry.update({field: record[field] for field in DELETION_LOG_FIELDS if field in record})
+    try:
+        settings.DELETED_USERS_LOG.parent.mkdir(parents=True, exist_ok=True)
+        with open(settings.DELETED_USERS_LOG, "a", encoding="utf-8") as file:
+            file.write(json.dumps(entry) + "\n")
+    except Exception as e:
+        print(f"[ERROR] Failed to record the deletion of '{username}': {e}")
+
+
+def forget_keys(username, public_key=None):
+    """
+    Removes the data tied to keys a user no longer has: the cached QR code of
+    the client configuration still in the artifact store, and the traffic history.
+    :param username: Username.
+    :param public_key: Previous public key, whose traffic history is deleted (None keeps it).
+    """
+    try:
+        config = get_artifact_store().read(username, "config")
+        if config:
+            get_qr_cache().remove(config.decode("utf-8"))
+    except Exception as e:
+        print(f"[ERROR] Failed to remove the cached QR code of '{username}': {e}")
+
+    if public_key:
+        try:
+            get_traffic_history().forget(public_key)
+        except Exception as e:
+            print(f"[ERROR] Failed to remove the traffic history of '{username}': {e}")
+
+
+def forget_user(username, record):
+    """
+    Removes the data of a deleted user outside the user database and wg0.conf.
+    :param username: Username.
+    :param record: The deleted user record (for its addresses and keys); removed_at is set on it.
+    :return: Removed artifacts as [(kind, path)].
+    """
+    record_deletion(username, record)
+    forget_keys(username, record.get("public_key"))  # Reads the configuration before it is removed
+
+    removed = []
+    try:
+        removed = get_artifact_store().remove(username)
+    except Exception as e:
+        print(f"[ERROR] Failed to remove artifacts of '{username}': {e}")
+
+    try:
+        release_ips(str(record.get("allowed_ips") or "").split(","))
+    except Exception as e:
+        print(f"[ERROR] Failed to release the addresses of '{username}': {e}")
+    return removed
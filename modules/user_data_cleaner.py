@@ -4,12 +4,18 @@
 
 import os
 import shutil
-import subprocess
 from settings import SERVER_WG_NIC  # SERVER_WG_NIC from the params file
 from settings import USER_DB_PATH  # User database
+from modules.user_store import get_user_store
+from modules.atomic_io import locked, write_text
+from modules.wg_config import load_wg_config
+from modules.wg_sync import request_sync
 from settings import SERVER_CONFIG_FILE
 from settings import SERVER_BACKUP_CONFIG_FILE
-from settings import WG_CONFIG_DIR, QR_CODE_DIR
+from settings import WG_CONFIG_DIR, QR_CODE_DIR, ARTIFACT_DIR, QR_CACHE_DIR, TRAFFIC_HISTORY_DIR
+from modules.artifact_store import get_artifact_store
+from modules.traffic_history import get_traffic_history
+from modules.qr_cache import get_qr_cache
 
 WG_USERS_JSON = "logs/wg_users.json"
 
@@ -24,10 +30,12 @@ def confirm_action(message):
 def clean_user_data():
     """Selective cleaning of user data with confirmation."""
     try:
-        # Clean user_records.json
-        if os.path.exists(USER_DB_PATH) and confirm_action("🧹 Clean the user_records.json file?"):
-            os.remove(USER_DB_PATH)
-            print(f"✅ {USER_DB_PATH} cleaned.")
+        # Clean the user database
+        if confirm_action("🧹 Clean the user database?"):
+            get_user_store().clear()
+            if os.path.exists(USER_DB_PATH):
+                os.remove(USER_DB_PATH)
+            print(f"✅ User database cleaned.")
 
         # Clean wg_users.json
         if os.path.exists(WG_USERS_JSON) and confirm_action("🧹 Clean the wg_users.json file?"):
@@ -36,30 +44,21 @@ def clean_user_data():
 
         # Clean WireGuard configuration
         if os.path.exists(SERVER_CONFIG_FILE) and confirm_action("🧹 Clean the WireGuard configuration file (remove all ### Client and [Peer])?"):
-            # Create a backup
-            shutil.copy2(SERVER_CONFIG_FILE, SERVER_BACKUP_CONFIG_FILE)
-            print(f"✅ Backup created: {SERVER_BACKUP_CONFIG_FILE}")
+            with locked(SERVER_CONFIG_FILE):
+                # Create a backup
+                shutil.copy2(SERVER_CONFIG_FILE, SERVER_BACKUP_CONFIG_FILE)
+                print(f"✅ Backup created: {SERVER_BACKUP_CONFIG_FILE}")
 
-            # Clean the configuration
-            with open(SERVER_CONFIG_FILE, "r") as wg_file:
-                lines = wg_file.readlines()
+                # Clean the configuration
+                config = load_wg_config(SERVER_CONFIG_FILE)
 
-            # New content without ### Client blocks and associated [Peer]
-            cleaned_lines = []
-            inside_client_block = False
+                # New content without ### Client blocks and associated [Peer]
+                peer_lines = set()
+                for line_start, line_end, _, _ in config.spans:
+                    peer_lines.update(range(line_start, line_end))
+                cleaned_lines = [line for idx, line in enumerate(config.lines) if idx not in peer_lines]
 
-            for line in lines:
-                stripped_line = line.strip()
-                if stripped_line.startswith("### Client"):
-                    inside_client_block = True
-                elif inside_client_block and stripped_line == "":
-                    # End of block, toggle flag
-                    inside_client_block = False
-                elif not inside_client_block:
-                    cleaned_lines.append(line)
-
-            with open(SERVER_CONFIG_FILE, "w") as wg_file:
-                wg_file.writelines(cleaned_lines)
+                write_text(SERVER_CONFIG_FILE, "".join(cleaned_lines))
             print(f"✅ WireGuard configuration cleaned.")
 
         # Clean user configuration files
@@ -68,7 +67,8 @@ def clean_user_data():
                 file_path = os.path.join(WG_CONFIG_DIR, config_file)
                 if os.path.isfile(file_path):
                     os.remove(file_path)
-            print(f"✅ User configuration files in {WG_CONFIG_DIR} cleaned.")
+            get_artifact_store().clear("config")
+            print(f"✅ User configuration files in {WG_CONFIG_DIR} and {ARTIFACT_DIR} cleaned.")
 
         # Clean user QR codes
         if os.path.exists(QR_CODE_DIR) and confirm_action("🧹 Clean all user QR codes?"):
@@ -76,12 +76,17 @@ def clean_user_data():
                 file_path = os.path.join(QR_CODE_DIR, qr_code_file)
                 if os.path.isfile(file_path):
                     os.remove(file_path)
-            print(f"✅ User QR codes in {QR_CODE_DIR} cleaned.")
+            get_artifact_store().clear("qr")
+            get_qr_cache().clear(disk=True)
+            print(f"✅ User QR codes in {QR_CODE_DIR}, {ARTIFACT_DIR} and {QR_CACHE_DIR} cleaned.")
+
+        # Clean the traffic history
+        if os.path.exists(TRAFFIC_HISTORY_DIR) and confirm_action("🧹 Clean the traffic history of all users?"):
+            removed = get_traffic_history().clear()
+            print(f"✅ Traffic history in {TRAFFIC_HISTORY_DIR} cleaned ({removed} file(s)).")
 
         # Sync WireGuard
-        sync_command = f'wg syncconf "{SERVER_WG_NIC}" <(wg-quick strip "{SERVER_WG_NIC}")'
-        subprocess.run(sync_command, shell=True, check=True, executable='/bin/bash')
-        print(f"WireGuard synchronized for interface {SERVER_WG_NIC}")
+        request_sync(SERVER_WG_NIC, wait=True)
 
         print("🎉 Cleaning complete. All data processed.")
 
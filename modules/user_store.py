@@ -0,0 +1,936 @@
+#!/usr/bin/env python3
+# modules/user_store.py
+# ===========================================
+# Storage layer for user records
+# ===========================================
+# All code that reads or modifies users goes through a UserStore instead of
+# opening user_records.json directly. Two backends are available:
+# - "sqlite" (default): one row per user in a WAL-mode SQLite database,
+#   so reading or updating a user touches only that user's row.
+# - "journal": user_records.json is kept as a snapshot and changes are
+#   appended to user_records.json.journal as small per-user patches; a
+#   background compactor folds the journal into the snapshot.
+# - "json" (legacy): the historical user_records.json file, read and
+#   rewritten as a whole on every change.
+# Both JSON backends also keep user_records.snapshot, a binary copy of the
+# JSON file (marshal, loaded via mmap) regenerated on every write; it is used
+# only while it matches the current JSON file (inode, mtime, size).
+#
+# The backend is selected with settings.USER_DB_BACKEND. When the SQLite
+# database does not exist yet, it is created and populated from
+# user_records.json (one-shot migration); the JSON file is left untouched
+# as a backup.
+#
+# Users can be looked up by username (case-insensitive), public key,
+# allowed IP or user_id with store.find(); the indexes are kept up to date
+# on every write (a user_index table in SQLite, hash maps otherwise).
+#
+# Example usage:
+# ---------------------
+# from modules.user_store import get_user_store
+#
+# store = get_user_store()
+# store.update("alice", {"status": "blocked"})
+# print(store.get("alice"))
+# print(store.find("public_key", "q6B...="))
+#
+# for username, record in store.iter_users(fields=["status"]):  # Streams users
+#     print(username, record["status"])
+#
+# with store.batch() as batch:  # One write for all queued updates
+#     batch.update("alice", {"last_handshake": "Never"})
+#     batch.update("bob", {"status": "blocked"})
+#
+# Manual migration:
+#   python3 -m modules.user_store migrate
+
+import abc
+import json
+import marshal
+import mmap
+import os
+import sqlite3
+import struct
+import sys
+import threading
+from pathlib import Path
+
+import settings
+from modules.atomic_io import locked, read_text, write_bytes, write_json
+from modules.main_registration_fields import UserRecord, compact_user_record, expand_user_record
+
+
+def file_key(path):
+    """
+    Identifies a version of a file by (inode, mtime, size).
+    :return: Tuple or None if the file does not exist.
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+# Binary snapshot of user_records.json: header + marshal-encoded compact records.
+# The header records which version of the JSON file the snapshot was made from.
+SNAPSHOT_MAGIC = b"WGUS"
+SNAPSHOT_FORMAT = 1
+_SNAPSHOT_HEADER = struct.Struct("<4sHBBBqqq")  # magic, format, marshal, python major/minor, inode, mtime_ns, size
+
+
+def write_binary_snapshot(path, records, source_key):
+    """
+    Writes compact records as a binary snapshot of a JSON file.
+    :param path: Snapshot file.
+    :param records: {username: compact record} dictionary.
+    :param source_key: file_key() of the JSON file the records were written to.
+    """
+    header = _SNAPSHOT_HEADER.pack(
+        SNAPSHOT_MAGIC, SNAPSHOT_FORMAT, marshal.version, *sys.version_info[:2], *source_key
+    )
+    # The snapshot is a cache of the JSON file: a lost write only costs one JSON parse
+    write_bytes(path, header + marshal.dumps(records), fsync=False)
+
+
+def load_binary_snapshot(path, source_key):
+    """
+    Loads a binary snapshot if it was made from the given version of the JSON file.
+    :return: {username: compact record} or None if the snapshot is missing or stale.
+    """
+    if source_key is None:
+        return None
+    try:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if len(mm) < _SNAPSHOT_HEADER.size:
+                return None
+            magic, fmt, marshal_version, major, minor, *key = _SNAPSHOT_HEADER.unpack_from(mm)
+            if (magic, fmt, marshal_version, (major, minor)) != (
+                SNAPSHOT_MAGIC, SNAPSHOT_FORMAT, marshal.version, sys.version_info[:2]
+            ) or tuple(key) != tuple(source_key):
+                return None
+            with memoryview(mm) as view:
+                return marshal.loads(view[_SNAPSHOT_HEADER.size:])
+    except (FileNotFoundError, ValueError, EOFError, TypeError) as e:
+        if not isinstance(e, FileNotFoundError):
+            print(f"[ERROR] Ignoring damaged snapshot {path}: {e}")
+        return None
+
+
+# Secondary indexes kept by every backend
+INDEXES = ("username", "public_key", "allowed_ips", "user_id")
+INDEXED_FIELDS = frozenset(("public_key", "allowed_ips", "user_id"))
+
+
+def normalize_index_value(index, value):
+    """
+    Brings a lookup value to the form used in the indexes:
+    usernames are casefolded, addresses lose their prefix length.
+    """
+    value = str(value).strip()
+    if index == "username":
+        return value.casefold()
+    if index == "allowed_ips":
+        return value.split("/", 1)[0]
+    return value
+
+
+def index_entries(username, record):
+    """Returns the (index, value) pairs under which a user is indexed."""
+    entries = [("username", normalize_index_value("username", username))]
+    for index in ("public_key", "user_id"):
+        value = record.get(index)
+        if value and value != "N/A":
+            entries.append((index, normalize_index_value(index, value)))
+    allowed_ips = record.get("allowed_ips")
+    if allowed_ips and allowed_ips != "N/A":
+        for address in str(allowed_ips).split(","):
+            address = normalize_index_value("allowed_ips", address)
+            if address:
+                entries.append(("allowed_ips", address))
+    return entries
+
+
+class UserIndex:
+    """In-memory hash indexes {index: {value: username}}, updated per user."""
+
+    def __init__(self):
+        self.maps = {index: {} for index in INDEXES}
+        self._entries = {}
+
+    def add(self, username, record):
+        self.remove(username)
+        entries = index_entries(username, record)
+        for index, value in entries:
+            self.maps[index][value] = username
+        self._entries[username] = entries
+
+    def remove(self, username):
+        for index, value in self._entries.pop(username, ()):
+            if self.maps[index].get(value) == username:
+                del self.maps[index][value]
+
+    def find(self, index, value):
+        return self.maps[index].get(normalize_index_value(index, value))
+
+
+def project_record(record, fields=None):
+    """
+    Returns a plain dict with the requested fields of a record.
+    :param record: UserRecord or dict.
+    :param fields: Field names to keep; None keeps the whole record.
+    """
+    if not isinstance(record, UserRecord):
+        record = UserRecord.from_dict(record)
+    if fields is None:
+        return record.to_dict()
+    return {field: record[field] for field in fields if field in record}
+
+
+class UserBatch:
+    """
+    Collects field updates for several users and commits them with a single
+    write when the `with store.batch()` block ends. Updates of the same user
+    are merged; later values win.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.pending = {}
+        self.updated = 0
+
+    def update(self, username, fields):
+        """Queues fields to merge into the record of a user."""
+        self.pending.setdefault(username, {}).update(fields)
+
+    def __len__(self):
+        return len(self.pending)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None and self.pending:
+            self.updated = self.store.update_many(self.pending)
+        self.pending = {}
+        return False
+
+
+class UserStore(abc.ABC):
+    """Common interface of all user record backends."""
+
+    # Incremented on every write made through this object
+    generation = 0
+
+    def _changed(self):
+        self.generation += 1
+
+    @abc.abstractmethod
+    def version_key(self):
+        """
+        Returns a value that changes whenever the underlying files change,
+        including writes made by other processes.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get(self, username):
+        """Returns the record of a user or None if the user does not exist."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def all(self):
+        """Returns all records as a {username: record} dictionary."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def put(self, username, record):
+        """Creates or replaces the record of a user."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def update(self, username, fields):
+        """
+        Merges fields into an existing record.
+        :return: True if the user exists and was updated, False otherwise.
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def delete(self, username):
+        """
+        Removes a user.
+        :return: The removed record or None if the user did not exist.
+        """
+        raise NotImplementedError
+
+    def update_many(self, updates):
+        """
+        Merges fields into several existing records at once.
+        :param updates: {username: fields}; unknown users are skipped.
+        :return: Number of updated users.
+        """
+        return sum(1 for username, fields in updates.items() if self.update(username, fields))
+
+    def batch(self):
+        """
+        Returns a UserBatch: updates queued inside the `with` block are
+        written together (one lock, one write) when the block ends.
+        """
+        return UserBatch(self)
+
+    @abc.abstractmethod
+    def replace_all(self, records):
+        """Replaces the whole database with the given {username: record} dictionary."""
+        raise NotImplementedError
+
+    def records(self):
+        """
+        Returns all records as compact UserRecord objects (defaults are not
+        materialized), e.g. for long-lived in-memory caches.
+        """
+        return {username: UserRecord.from_dict(record) for username, record in self.all().items()}
+
+    def iter_users(self, fields=None):
+        """
+        Iterates over users one by one as (username, record) pairs, e.g. for
+        reports that only count or summarize users.
+        :param fields: Field names to return; None returns whole records.
+        """
+        for username, record in self.records().items():
+            yield username, project_record(record, fields)
+
+    def count(self):
+        """Returns the number of users."""
+        return len(self.all())
+
+    def usernames(self):
+        """Returns the list of usernames."""
+        return list(self.all().keys())
+
+    def clear(self):
+        """Removes all users."""
+        self.replace_all({})
+
+    def _user_index(self):
+        """Returns an up-to-date UserIndex (rebuilt only when the database changed)."""
+        key = (self.generation, self.version_key())
+        cached = getattr(self, "_index_cache", None)
+        if cached is None or cached[0] != key:
+            index = UserIndex()
+            for username, record in self.records().items():
+                index.add(username, record)
+            cached = (key, index)
+            self._index_cache = cached
+        return cached[1]
+
+    def find(self, index, value):
+        """
+        Looks a user up by a secondary index in O(1).
+        :param index: "username" (case-insensitive), "public_key", "allowed_ips" or "user_id".
+        :param value: Value to look for; addresses may include a prefix length.
+        :return: Username or None.
+        """
+        return self._user_index().find(index, value)
+
+    def index_map(self, index):
+        """Returns a copy of one index as {normalized value: username}, for bulk lookups."""
+        return dict(self._user_index().maps[index])
+
+    def __contains__(self, username):
+        return self.get(username) is not None
+
+    def __len__(self):
+        return self.count()
+
+
+class JsonUserStore(UserStore):
+    """Legacy backend: the whole database lives in a single JSON file."""
+
+    def __init__(self, path, binary_snapshot=None):
+        self.path = Path(path)
+        self._lock = threading.RLock()
+        if binary_snapshot is None:
+            binary_snapshot = settings.USER_DB_BINARY_SNAPSHOT
+        self.snapshot_path = self.path.with_suffix(".snapshot") if binary_snapshot else None
+
+    def _load(self):
+        with locked(self.path, exclusive=False):
+            source_key = file_key(self.path)
+            if self.snapshot_path is not None:
+                records = load_binary_snapshot(self.snapshot_path, source_key)
+                if records is not None:
+                    return records
+            try:
+                records = json.loads(read_text(self.path))
+            except FileNotFoundError:
+                return {}
+            except json.JSONDecodeError as e:
+                print(f"[ERROR] Failed to parse {self.path}: {e}")
+                return {}
+            if self.snapshot_path is not None:
+                # Snapshot missing or older than the JSON file (e.g. edited by hand)
+                try:
+                    write_binary_snapshot(self.snapshot_path, records, source_key)
+                except OSError as e:
+                    print(f"[ERROR] Failed to write snapshot {self.snapshot_path}: {e}")
+            return records
+
+    def _write_records(self, compact):
+        """Writes compact records to the JSON file and refreshes the binary snapshot."""
+        with locked(self.path):
+            write_json(self.path, compact)
+            if self.snapshot_path is not None:
+                write_binary_snapshot(self.snapshot_path, compact, file_key(self.path))
+
+    def _save(self, records):
+        self._write_records({username: compact_user_record(record) for username, record in records.items()})
+        self._changed()
+
+    def version_key(self):
+        return (file_key(self.path),)
+
+    def get(self, username):
+        record = self._load().get(username)
+        return expand_user_record(record) if record is not None else None
+
+    def all(self):
+        return {username: expand_user_record(record) for username, record in self._load().items()}
+
+    def records(self):
+        return {username: UserRecord.from_dict(record) for username, record in self._load().items()}
+
+    def put(self, username, record):
+        with self._lock, locked(self.path):
+            records = self._load()
+            records[username] = record
+            self._save(records)
+
+    def update(self, username, fields):
+        return self.update_many({username: fields}) == 1
+
+    def update_many(self, updates):
+        with self._lock, locked(self.path):
+            records = self._load()
+            updated = 0
+            for username, fields in updates.items():
+                if username not in records:
+                    continue
+                record = UserRecord.from_dict(records[username])
+                record.update(fields)
+                records[username] = record
+                updated += 1
+            if updated:
+                self._save(records)
+            return updated
+
+    def delete(self, username):
+        with self._lock, locked(self.path):
+            records = self._load()
+            record = records.pop(username, None)
+            if record is None:
+                return None
+            self._save(records)
+            return expand_user_record(record)
+
+    def replace_all(self, records):
+        with self._lock:
+            self._save(dict(records))
+
+
+class JournalJsonUserStore(JsonUserStore):
+    """
+    JSON backend with an append-only journal.
+
+    user_records.json holds a snapshot and every change is appended to
+    user_records.json.journal as one small JSON line:
+        {"op": "put", "user": "alice", "data": {...}}
+        {"op": "update", "user": "alice", "data": {"status": "blocked"}}
+        {"op": "delete", "user": "alice"}
+    The current state is the snapshot with the journal replayed on top, so
+    a write costs O(changed users) and crash recovery is a journal replay.
+    Once the journal grows past compact_threshold bytes, a background
+    thread folds it into a new snapshot. Entries are idempotent: replaying
+    one twice (e.g. after a crash between writing the snapshot and
+    truncating the journal) gives the same state.
+    """
+
+    def __init__(self, path, compact_threshold=None, binary_snapshot=None):
+        super().__init__(path, binary_snapshot)
+        self.journal_path = Path(f"{self.path}.journal")
+        if compact_threshold is None:
+            compact_threshold = settings.USER_DB_JOURNAL_MAX_BYTES
+        self.compact_threshold = compact_threshold
+        self._records = None
+        self._index = UserIndex()
+        self._snapshot_key = None
+        self._journal_offset = 0
+        self._compactor = None
+
+    def _apply(self, records, entry):
+        """Applies one journal entry to the in-memory UserRecord objects and indexes."""
+        op = entry.get("op")
+        username = entry.get("user")
+        if op == "put":
+            records[username] = UserRecord.from_dict(entry["data"])
+            self._index.add(username, records[username])
+        elif op == "update":
+            if username in records:
+                records[username].update(entry["data"])
+                if INDEXED_FIELDS.intersection(entry["data"]):
+                    self._index.add(username, records[username])
+        elif op == "delete":
+            records.pop(username, None)
+            self._index.remove(username)
+
+    def _replay(self, records, offset):
+        """
+        Applies journal entries starting at the given byte offset.
+        :return: Offset of the first entry that was not applied.
+        """
+        try:
+            f = open(self.journal_path, "rb")
+        except FileNotFoundError:
+            return 0
+        with f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # Entry is still being written (or was torn by a crash)
+                offset += len(line)
+                try:
+                    self._apply(records, json.loads(line))
+                except (ValueError, KeyError, TypeError, AttributeError) as e:
+                    print(f"[ERROR] Skipping damaged journal entry in {self.journal_path}: {e}")
+        return offset
+
+    def _refresh(self):
+        """Brings the in-memory state up to date with the snapshot and the journal."""
+        # The shared lock keeps compaction from swapping the snapshot and
+        # truncating the journal between the two reads
+        with locked(self.path, exclusive=False):
+            return self._refresh_locked()
+
+    def _refresh_locked(self):
+        snapshot_key = file_key(self.path)
+        journal_key = file_key(self.journal_path)
+        journal_size = journal_key[2] if journal_key else 0
+
+        if self._records is None or snapshot_key != self._snapshot_key or journal_size < self._journal_offset:
+            self._records = {
+                username: UserRecord.from_dict(record) for username, record in super()._load().items()
+            }
+            self._reindex()
+            self._snapshot_key = snapshot_key
+            self._journal_offset = 0
+        if journal_size > self._journal_offset:
+            self._journal_offset = self._replay(self._records, self._journal_offset)
+        return self._records
+
+    def _append(self, *entries):
+        """Appends entries to the journal with one write and applies them to the in-memory state."""
+        data = "".join(
+            json.dumps(entry, ensure_ascii=False, separators=(",", ":")) + "\n" for entry in entries
+        )
+        with locked(self.path):
+            with open(self.journal_path, "ab") as f:
+                f.write(data.encode("utf-8"))
+                f.flush()
+                if settings.FSYNC_WRITES:
+                    os.fsync(f.fileno())
+            # Replaying from the last known offset also picks up entries of other writers
+            self._refresh()
+        self._changed()
+        self._maybe_compact()
+
+    def _write_snapshot(self, records):
+        """Writes a new snapshot atomically (temporary file + rename) and empties the journal."""
+        with locked(self.path):
+            self._write_records({username: record.to_compact() for username, record in records.items()})
+            with open(self.journal_path, "wb"):
+                pass
+        self._records = records
+        self._reindex()
+        self._snapshot_key = file_key(self.path)
+        self._journal_offset = 0
+        self._changed()
+
+    def _reindex(self):
+        self._index = UserIndex()
+        for username, record in self._records.items():
+            self._index.add(username, record)
+
+    def _user_index(self):
+        with self._lock:
+            self._refresh()
+            return self._index
+
+    def version_key(self):
+        return (file_key(self.path), file_key(self.journal_path))
+
+    def _maybe_compact(self):
+        """Starts the background compactor once the journal passes the threshold."""
+        if self._journal_offset < self.compact_threshold:
+            return
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+        self._compactor = threading.Thread(target=self.compact, name="user-journal-compactor", daemon=True)
+        self._compactor.start()
+
+    def compact(self):
+        """Folds the journal into the snapshot."""
+        with self._lock, locked(self.path):
+            self._write_snapshot(self._refresh())
+
+    def get(self, username):
+        with self._lock:
+            record = self._refresh().get(username)
+            return record.to_dict() if record is not None else None
+
+    def all(self):
+        with self._lock:
+            return {username: record.to_dict() for username, record in self._refresh().items()}
+
+    def records(self):
+        with self._lock:
+            # In-memory records are updated in place, hand out copies
+            return {username: record.copy() for username, record in self._refresh().items()}
+
+    def iter_users(self, fields=None):
+        # The records are already in memory: only the projected fields are copied
+        with self._lock:
+            items = list(self._refresh().items())
+        for username, record in items:
+            yield username, project_record(record, fields)
+
+    def count(self):
+        with self._lock:
+            return len(self._refresh())
+
+    def usernames(self):
+        with self._lock:
+            return list(self._refresh())
+
+    def __contains__(self, username):
+        with self._lock:
+            return username in self._refresh()
+
+    def put(self, username, record):
+        with self._lock:
+            self._append({"op": "put", "user": username, "data": compact_user_record(record)})
+
+    def update(self, username, fields):
+        return self.update_many({username: fields}) == 1
+
+    def update_many(self, updates):
+        with self._lock, locked(self.path):
+            records = self._refresh()
+            entries = [
+                {"op": "update", "user": username, "data": fields}
+                for username, fields in updates.items() if username in records
+            ]
+            if entries:
+                self._append(*entries)
+            return len(entries)
+
+    def delete(self, username):
+        with self._lock, locked(self.path):
+            record = self._refresh().get(username)
+            if record is None:
+                return None
+            record = record.to_dict()
+            self._append({"op": "delete", "user": username})
+            return record
+
+    def replace_all(self, records):
+        with self._lock:
+            self._write_snapshot({
+                username: UserRecord.from_dict(record) for username, record in records.items()
+            })
+
+
+class SqliteUserStore(UserStore):
+    """SQLite backend: one row per user, WAL journal, per-row reads and writes."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            username TEXT PRIMARY KEY,
+            data     TEXT NOT NULL
+        )
+    """
+
+    INDEX_SCHEMA = """
+        CREATE TABLE IF NOT EXISTS user_index (
+            kind     TEXT NOT NULL,
+            value    TEXT NOT NULL,
+            username TEXT NOT NULL,
+            PRIMARY KEY (kind, value)
+        ) WITHOUT ROWID
+    """
+
+    def __init__(self, path, timeout=30.0):
+        self.path = Path(path)
+        self.timeout = timeout
+        self._local = threading.local()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self._connect()
+        conn.execute(self.SCHEMA)
+        conn.execute(self.INDEX_SCHEMA)
+        conn.execute("CREATE INDEX IF NOT EXISTS user_index_username ON user_index (username)")
+        # Databases created before the index table existed are indexed once
+        indexed = conn.execute("SELECT COUNT(*) FROM user_index WHERE kind = 'username'").fetchone()[0]
+        if indexed != self.count():
+            conn = self._transaction()
+            try:
+                self._rebuild_index(conn)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _open(self):
+        conn = sqlite3.connect(str(self.path), timeout=self.timeout, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _connect(self):
+        """Returns the connection of the current thread (sqlite3 connections are not shared)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._open()
+        return conn
+
+    def _transaction(self):
+        """Starts a write transaction that locks out other writers until commit."""
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        return conn
+
+    def version_key(self):
+        # Commits land in the -wal file first and reach the main file on checkpoint
+        return (file_key(self.path), file_key(f"{self.path}-wal"))
+
+    @staticmethod
+    def _encode(record):
+        return json.dumps(compact_user_record(record), ensure_ascii=False, separators=(",", ":"))
+
+    @staticmethod
+    def _decode(data):
+        return expand_user_record(json.loads(data))
+
+    @staticmethod
+    def _reindex(conn, username, record):
+        """Replaces the index rows of one user; runs inside the caller's transaction."""
+        conn.execute("DELETE FROM user_index WHERE username = ?", (username,))
+        if record is not None:
+            conn.executemany(
+                "INSERT OR REPLACE INTO user_index (kind, value, username) VALUES (?, ?, ?)",
+                ((index, value, username) for index, value in index_entries(username, record)),
+            )
+
+    def _rebuild_index(self, conn):
+        conn.execute("DELETE FROM user_index")
+        for username, data in conn.execute("SELECT username, data FROM users ORDER BY rowid").fetchall():
+            self._reindex(conn, username, UserRecord.from_dict(json.loads(data)))
+
+    def find(self, index, value):
+        if index not in INDEXES:
+            raise KeyError(index)
+        row = self._connect().execute(
+            "SELECT username FROM user_index WHERE kind = ? AND value = ?",
+            (index, normalize_index_value(index, value)),
+        ).fetchone()
+        return row[0] if row else None
+
+    def index_map(self, index):
+        if index not in INDEXES:
+            raise KeyError(index)
+        rows = self._connect().execute(
+            "SELECT value, username FROM user_index WHERE kind = ?", (index,)
+        )
+        return dict(rows.fetchall())
+
+    def get(self, username):
+        row = self._connect().execute(
+            "SELECT data FROM users WHERE username = ?", (username,)
+        ).fetchone()
+        return self._decode(row[0]) if row else None
+
+    def all(self):
+        rows = self._connect().execute("SELECT username, data FROM users ORDER BY rowid")
+        return {username: self._decode(data) for username, data in rows}
+
+    def records(self):
+        rows = self._connect().execute("SELECT username, data FROM users ORDER BY rowid")
+        return {username: UserRecord.from_dict(json.loads(data)) for username, data in rows}
+
+    def iter_users(self, fields=None):
+        # A dedicated connection streams rows from the cursor, so memory stays
+        # flat and the caller may write through the store while iterating
+        conn = self._open()
+        try:
+            for username, data in conn.execute("SELECT username, data FROM users ORDER BY rowid"):
+                yield username, project_record(json.loads(data), fields)
+        finally:
+            conn.close()
+
+    def count(self):
+        return self._connect().execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+    def usernames(self):
+        rows = self._connect().execute("SELECT username FROM users ORDER BY rowid")
+        return [row[0] for row in rows]
+
+    def __contains__(self, username):
+        row = self._connect().execute(
+            "SELECT 1 FROM users WHERE username = ?", (username,)
+        ).fetchone()
+        return row is not None
+
+    def put(self, username, record):
+        conn = self._transaction()
+        try:
+            conn.execute(
+                "INSERT INTO users (username, data) VALUES (?, ?) "
+                "ON CONFLICT(username) DO UPDATE SET data = excluded.data",
+                (username, self._encode(record)),
+            )
+            self._reindex(conn, username, record)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self._changed()
+
+    def update(self, username, fields):
+        return self.update_many({username: fields}) == 1
+
+    def update_many(self, updates):
+        conn = self._transaction()
+        updated = 0
+        try:
+            for username, fields in updates.items():
+                row = conn.execute("SELECT data FROM users WHERE username = ?", (username,)).fetchone()
+                if row is None:
+                    continue
+                record = UserRecord.from_dict(json.loads(row[0]))
+                record.update(fields)
+                conn.execute(
+                    "UPDATE users SET data = ? WHERE username = ?", (self._encode(record), username)
+                )
+                if INDEXED_FIELDS.intersection(fields):
+                    self._reindex(conn, username, record)
+                updated += 1
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if updated:
+            self._changed()
+        return updated
+
+    def delete(self, username):
+        conn = self._transaction()
+        try:
+            row = conn.execute("SELECT data FROM users WHERE username = ?", (username,)).fetchone()
+            if row is not None:
+                conn.execute("DELETE FROM users WHERE username = ?", (username,))
+                self._reindex(conn, username, None)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if row is None:
+            return None
+        self._changed()
+        return self._decode(row[0])
+
+    def replace_all(self, records):
+        conn = self._transaction()
+        try:
+            conn.execute("DELETE FROM users")
+            conn.executemany(
+                "INSERT INTO users (username, data) VALUES (?, ?)",
+                ((username, self._encode(record)) for username, record in records.items()),
+            )
+            self._rebuild_index(conn)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self._changed()
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def migrate_json_to_sqlite(json_path, sqlite_path):
+    """
+    One-shot migration of user_records.json into the SQLite database.
+    Users already present in the database are kept; the JSON file is not modified.
+    :param json_path: Path to the legacy user_records.json file.
+    :param sqlite_path: Path to the SQLite database.
+    :return: Number of migrated users.
+    """
+    records = JsonUserStore(json_path).all()
+    store = SqliteUserStore(sqlite_path)
+    conn = store._transaction()
+    try:
+        conn.executemany(
+            "INSERT OR IGNORE INTO users (username, data) VALUES (?, ?)",
+            ((username, store._encode(record)) for username, record in records.items()),
+        )
+        store._rebuild_index(conn)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        store.close()
+    return len(records)
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_user_store(backend=None):
+    """
+    Returns the process-wide user store for the configured backend.
+    :param backend: "sqlite", "journal" or "json"; defaults to settings.USER_DB_BACKEND.
+    :return: UserStore instance.
+    """
+    backend = backend or settings.USER_DB_BACKEND
+    with _stores_lock:
+        store = _stores.get(backend)
+        if store is not None:
+            return store
+
+        if backend == "json":
+            store = JsonUserStore(settings.USER_DB_PATH)
+        elif backend == "journal":
+            store = JournalJsonUserStore(settings.USER_DB_PATH)
+        elif backend == "sqlite":
+            sqlite_path = Path(settings.USER_DB_SQLITE_PATH)
+            if not sqlite_path.exists() and Path(settings.USER_DB_PATH).exists():
+                migrated = migrate_json_to_sqlite(settings.USER_DB_PATH, sqlite_path)
+                print(f"✅ Migrated {migrated} users from {settings.USER_DB_PATH} to {sqlite_path}")
+            store = SqliteUserStore(sqlite_path)
+        else:
+            raise ValueError(f"Unknown user database backend: {backend}")
+
+        _stores[backend] = store
+        return store
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "migrate":
+        count = migrate_json_to_sqlite(settings.USER_DB_PATH, settings.USER_DB_SQLITE_PATH)
+        print(f"✅ Migrated {count} users to {settings.USER_DB_SQLITE_PATH}")
+    else:
+        print("Usage: python3 -m modules.user_store migrate")
+        sys.exit(1)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# modules/user_store_benchmark.py
+# ===========================================
+# Cold-start load benchmark for the user database
+# ===========================================
+# Generates synthetic user databases and measures how long a fresh process
+# needs to load them from:
+# - user_records.json (pretty-printed, as written by the "json" backend);
+# - user_records.snapshot (binary snapshot, loaded via mmap);
+# - user_records.sqlite3 (the default backend).
+#
+# Example usage:
+# ---------------------
+#   python3 -m modules.user_store_benchmark            # 10k and 100k users
+#   python3 -m modules.user_store_benchmark 5000 50000
+
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from modules.main_registration_fields import create_user_record, compact_user_record
+from modules.user_store import (
+    JsonUserStore,
+    SqliteUserStore,
+    file_key,
+    load_binary_snapshot,
+    write_binary_snapshot
+)
+
+DEFAULT_SIZES = (10_000, 100_000)
+REPEATS = 3
+
+
+def make_records(count):
+    """Builds count compact user records with realistic field values."""
+    records = {}
+    for i in range(count):
+        username = f"user{i:06d}"
+        record = create_user_record(
+            username=username,
+            address=f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}",
+            public_key=f"{i:043d}=",
+            preshared_key=f"{i:043d}=",
+            qr_code_path=f"/root/pyWGgen/user/data/qrcodes/{username}.png",
+            email=f"{username}@example.com",
+            telegram_id=str(100000 + i)
+        )
+        records[username] = compact_user_record(record)
+    return records
+
+
+def best_of(func, repeats=REPEATS):
+    """Returns the fastest of several runs, in seconds."""
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run(count, directory):
+    """
+    Benchmarks one database size.
+    :return: {format: (seconds, file size in bytes)}.
+    """
+    json_path = directory / f"users_{count}.json"
+    snapshot_path = json_path.with_suffix(".snapshot")
+    sqlite_path = directory / f"users_{count}.sqlite3"
+
+    records = make_records(count)
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(records, f, indent=4, ensure_ascii=False)
+    write_binary_snapshot(snapshot_path, records, file_key(json_path))
+    store = SqliteUserStore(sqlite_path)
+    store.replace_all(records)
+    store.close()
+
+    def load_json():
+        with open(json_path, "r", encoding="utf-8") as f:
+            json.load(f)
+
+    def load_snapshot():
+        assert load_binary_snapshot(snapshot_path, file_key(json_path)) is not None
+
+    def load_store_json():
+        JsonUserStore(json_path, binary_snapshot=False).records()
+
+    def load_store_snapshot():
+        JsonUserStore(json_path, binary_snapshot=True).records()
+
+    def load_sqlite():
+        store = SqliteUserStore(sqlite_path)
+        store.records()
+        store.close()
+
+    return {
+        "JSON (json.load)": (best_of(load_json), json_path.stat().st_size),
+        "Binary snapshot (mmap)": (best_of(load_snapshot), snapshot_path.stat().st_size),
+        "Store records(), JSON": (best_of(load_store_json), json_path.stat().st_size),
+        "Store records(), snapshot": (best_of(load_store_snapshot), snapshot_path.stat().st_size),
+        "Store records(), SQLite": (best_of(load_sqlite), sqlite_path.stat().st_size),
+    }
+
+
+def main(sizes=DEFAULT_SIZES):
+    with tempfile.TemporaryDirectory() as tmp:
+        for count in sizes:
+            results = run(count, Path(tmp))
+            baseline = results["JSON (json.load)"][0]
+            print(f"\n=== {count} users ===")
+            print(f"{'Format':<28}{'Load, ms':>10}{'Speedup':>10}{'Size, KiB':>12}")
+            for name, (seconds, size) in results.items():
+                print(f"{name:<28}{seconds * 1000:>10.1f}{baseline / seconds:>9.1f}x{size / 1024:>12.0f}")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
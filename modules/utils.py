@@ -2,29 +2,26 @@
 # utils.py
 # Utility functions for the wg_qr_generator project.
 
-import json
 import os
 import datetime
 
+from modules import atomic_io
+
 def read_json(file_path):
     """
-    Read data from a JSON file.
+    Read data from a JSON file (under a shared lock).
     :param file_path: Path to the JSON file.
     :return: File content as a dictionary.
     """
-    if not os.path.exists(file_path):
-        return {}
-    with open(file_path, 'r', encoding='utf-8') as file:
-        return json.load(file)
+    return atomic_io.read_json(file_path, default={})
 
 def write_json(file_path, data):
     """
-    Write data to a JSON file.
+    Write data to a JSON file atomically (exclusive lock, temporary file + rename).
     :param file_path: Path to the JSON file.
     :param data: Data to write.
     """
-    with open(file_path, 'w', encoding='utf-8') as file:
-        json.dump(data, file, indent=4, ensure_ascii=False)
+    atomic_io.write_json(file_path, data)
 
 def get_wireguard_config_path():
     """
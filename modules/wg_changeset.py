@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+# modules/wg_changeset.py
+# ===========================================
+# Batched changes of the WireGuard server configuration
+# ===========================================
+# Adding, removing or blocking users one by one rewrites wg0.conf and runs
+# `wg syncconf` for every user. A ChangeSet collects peer operations and
+# applies them together:
+# - all operations are validated against the current configuration before
+#   anything is written (unknown clients, duplicate names, addresses or
+#   public keys); if one is invalid, nothing is changed;
+# - the configuration is written once (a single block is spliced in place,
+#   several blocks give one atomic rewrite);
+# - one WireGuard sync is requested at the end (debounced, see wg_sync.py).
+#
+# A removed client cannot be changed in the same change set; a key change
+# and a block/unblock of one client are combined. New peers are appended
+# at the end of the file. Data tied to replaced keys (traffic history) is
+# dropped after the write (see modules/user_cleanup.py).
+#
+# Example usage:
+# ---------------------
+# from modules.wg_changeset import ChangeSet
+#
+# with ChangeSet() as changes:
+#     changes.add_peer("alice", public_key, preshared_key, "10.66.66.2/32")
+#     changes.block("bob")
+#     changes.remove_peer("carol")
+# # Applied and synced here (unless an exception left the block)
+
+import settings
+from modules.atomic_io import locked
+from modules.user_cleanup import forget_keys
+from modules.wg_config import (
+    load_wg_config,
+    peer_block,
+    replace_lines,
+    set_blocked_lines,
+    set_option_lines,
+    write_wg_config
+)
+from modules.wg_sync import request_sync
+
+
+class ChangeSetError(ValueError):
+    """Raised when queued operations do not fit the configuration."""
+
+    def __init__(self, problems):
+        self.problems = problems
+        super().__init__("; ".join(problems))
+
+
+def _addresses(allowed_ips):
+    return [address.strip().split("/", 1)[0] for address in allowed_ips.split(",") if address.strip()]
+
+
+def _render(config, edits):
+    parts = []
+    position = 0
+    for start, end, text in edits:
+        parts.extend(config.lines[position:start])
+        parts.append(text)
+        position = end
+    parts.extend(config.lines[position:])
+    return "".join(parts)
+
+
+class ChangeSet:
+    """Queue of peer operations applied to wg0.conf with one write and one sync."""
+
+    def __init__(self, path=None, interface=None):
+        """
+        :param path: Configuration file; defaults to settings.SERVER_CONFIG_FILE.
+        :param interface: Interface to sync; defaults to settings.SERVER_WG_NIC.
+        """
+        self.path = path or settings.SERVER_CONFIG_FILE
+        self.interface = interface
+        self.adds = []          # [{"name", "public_key", "preshared_key", "allowed_ips"}]
+        self.removes = set()    # Client names (case-folded)
+        self.blocks = {}        # {case-folded name: True to block / False to unblock}
+        self.keys = {}          # {case-folded name: {"PublicKey": ..., "PresharedKey": ...}}
+        self.applied = 0
+
+    def add_peer(self, name, public_key, preshared_key, allowed_ips):
+        self.adds.append({
+            "name": name,
+            "public_key": public_key,
+            "preshared_key": preshared_key,
+            "allowed_ips": allowed_ips,
+        })
+        return self
+
+    def remove_peer(self, name):
+        self.removes.add(name.casefold())
+        return self
+
+    def block(self, name):
+        self.blocks[name.casefold()] = True
+        return self
+
+    def unblock(self, name):
+        self.blocks[name.casefold()] = False
+        return self
+
+    def set_keys(self, name, public_key=None, preshared_key=None):
+        """Queues new keys for an existing client (None keeps the current key)."""
+        keys = self.keys.setdefault(name.casefold(), {})
+        if public_key is not None:
+            keys["PublicKey"] = public_key
+        if preshared_key is not None:
+            keys["PresharedKey"] = preshared_key
+        return self
+
+    def addresses(self):
+        """Returns the addresses of the queued new peers (for IP allocation)."""
+        return {address for add in self.adds for address in _addresses(add["allowed_ips"])}
+
+    def __len__(self):
+        return len(self.adds) + len(self.removes) + len(self.blocks) + len(self.keys)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None and len(self):
+            self.apply()
+        return False
+
+    def validate(self, config):
+        """
+        Checks the queued operations against a parsed configuration.
+        :return: List of problems (empty if the change set can be applied).
+        """
+        problems = []
+        for name in sorted(self.removes | set(self.blocks) | set(self.keys)):
+            if config.peer_by_name(name) is None:
+                problems.append(f"client '{name}' not found")
+        for name in sorted((set(self.blocks) | set(self.keys)) & self.removes):
+            problems.append(f"client '{name}' is removed and changed in the same change set")
+
+        # Names, addresses and keys of the peers that remain
+        names, addresses, public_keys = set(), {}, {}
+        for peer in config.peers:
+            name = (peer.name or "").casefold()
+            if name and name in self.removes:
+                continue
+            names.add(name)
+            for address in peer.addresses:
+                addresses.setdefault(address, peer.name)
+            if peer.public_key and "PublicKey" not in self.keys.get(name, {}):
+                public_keys.setdefault(peer.public_key, peer.name)
+        for name, keys in sorted(self.keys.items()):
+            public_key = keys.get("PublicKey")
+            if public_key is None:
+                continue
+            if public_key in public_keys:
+                problems.append(f"public key of '{name}' is already used by '{public_keys[public_key]}'")
+            public_keys[public_key] = name
+
+        for add in self.adds:
+            name = add["name"]
+            if not name or any(char.isspace() for char in name):
+                problems.append(f"invalid client name '{name}'")
+                continue
+            if name.casefold() in names:
+                problems.append(f"client '{name}' already exists")
+            names.add(name.casefold())
+            if not _addresses(add["allowed_ips"]):
+                problems.append(f"client '{name}' has no AllowedIPs")
+            for address in _addresses(add["allowed_ips"]):
+                if address in addresses:
+                    problems.append(f"address {address} of '{name}' is already used by '{addresses[address]}'")
+                addresses[address] = name
+            if add["public_key"] in public_keys:
+                problems.append(f"public key of '{name}' is already used by '{public_keys[add['public_key']]}'")
+            public_keys[add["public_key"]] = name
+        return problems
+
+    def _edits(self, config):
+        """Returns the edits as [(first line, line after the last, new text)] in file order."""
+        edits = []
+        for name in sorted(self.removes | set(self.blocks) | set(self.keys)):
+            peer = config.peer_by_name(name)
+            start, end, _, _ = config.span(config.position(peer))
+            if name in self.removes:
+                edits.append((start, end, ""))
+                continue
+            lines = config.lines[start:end]
+            for key, value in self.keys.get(name, {}).items():
+                lines = set_option_lines(lines, key, value)
+            if name in self.blocks:
+                lines = set_blocked_lines(lines, self.blocks[name])
+            text = "".join(lines)
+            if text != config.block_text(peer):
+                edits.append((start, end, text))
+        if self.adds:
+            end = len(config.lines)
+            text = "".join(
+                peer_block(add["name"], add["public_key"], add["preshared_key"], add["allowed_ips"])
+                for add in self.adds
+            )
+            edits.append((end, end, text))
+        return sorted(edits)
+
+    def preview(self, config):
+        """
+        Returns the configuration text the change set would produce, without writing it.
+        :param config: WgConfig instance.
+        :raises ChangeSetError: If an operation is invalid.
+        """
+        problems = self.validate(config)
+        if problems:
+            raise ChangeSetError(problems)
+        return _render(config, self._edits(config))
+
+    def apply(self, sync=True, wait=False):
+        """
+        Validates and applies the queued operations, then requests one WireGuard sync.
+        :param sync: Request a sync after writing.
+        :param wait: Return only after the sync has run (e.g. to report access as revoked).
+        :return: Number of changed blocks (the added peers count as one).
+        :raises ChangeSetError: If an operation is invalid; the file is not changed.
+        :raises Exception: With wait=True, the error of the sync; the file is already written then.
+        """
+        with locked(self.path):
+            config = load_wg_config(self.path)
+            problems = self.validate(config)
+            if problems:
+                raise ChangeSetError(problems)
+
+            edits = self._edits(config)
+            rekeyed = []
+            for name, keys in self.keys.items():
+                peer = config.peer_by_name(name)
+                old_key = peer.public_key if keys.get("PublicKey", peer.public_key) != peer.public_key else None
+                rekeyed.append((peer.name, old_key))
+            if len(edits) == 1:
+                replace_lines(self.path, config, *edits[0])
+            elif edits:
+                write_wg_config(self.path, _render(config, edits))
+
+        self.applied = len(edits)
+        self.adds, self.removes, self.blocks, self.keys = [], set(), {}, {}
+        for name, old_key in rekeyed:
+            forget_keys(name, old_key)
+        if sync and edits:
+            request_sync(self.interface, wait=wait)
+        return len(edits)
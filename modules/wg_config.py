@@ -0,0 +1,518 @@
+#!/usr/bin/env python3
+# modules/wg_config.py
+# ===========================================
+# Parser and cache for the WireGuard server configuration (wg0.conf)
+# ===========================================
+# wg0.conf is written by this project in the following layout:
+#
+#     [Interface]
+#     Address = 10.66.66.1/24,fd42:42:42::1/64
+#     ...
+#
+#     ### Client alice
+#     [Peer]
+#     PublicKey = ...
+#     PresharedKey = ...
+#     AllowedIPs = 10.66.66.2/32,fd42:42:42::2/128
+#
+# A blocked user has the lines of its [Peer] section commented out with
+# "# " (see gradio_admin/functions/block_user.py); such peers are parsed
+# too and marked as blocked.
+#
+# load_wg_config() parses the file once and keeps the result until the file
+# changes on disk (inode, mtime, size), so several lookups during one admin
+# action share one parse. Parsed objects are shared between callers and
+# must not be modified.
+#
+# add_peer(), remove_peer() and set_peer_blocked() edit one client block.
+# The parse keeps the line and byte range of every client block, so an edit
+# splices only the bytes of that block (atomic_io.splice_bytes) and reparses
+# only that block. The cached parse is rebuilt without reading the file or
+# parsing the other blocks: their peers are reused, while the line, peer,
+# span and lookup tables are rebuilt as new lists and dicts. That is still
+# O(n) per edit, but plain list and dict copies are more than ten times faster
+# than a full parse.
+#
+# Example usage:
+# ---------------------
+# from modules.wg_config import load_wg_config
+#
+# config = load_wg_config()
+# peer = config.peer_by_name("alice")
+# print(peer.public_key, peer.allowed_ips, peer.blocked)
+#
+# set_peer_blocked(settings.SERVER_CONFIG_FILE, "alice", True)
+
+
+import ipaddress
+import threading
+
+import settings
+from modules.atomic_io import locked, read_bytes, splice_bytes, write_bytes
+from modules.user_store import file_key
+
+CLIENT_MARKER = "### Client"
+
+
+class WgSection:
+    """One [Interface] or [Peer] section with its options in file order."""
+
+    def __init__(self, kind, name=None, disabled=False):
+        self.kind = kind
+        self.name = name            # Client name from the "### Client" comment
+        self.disabled = disabled    # Section lines are commented out
+        self.options = []           # [(key, value)] in file order
+        self._values = None
+
+    def get(self, key, default=None):
+        """Returns the last value of an option (keys are case-insensitive, as in wg-quick)."""
+        if self._values is None:
+            self._values = {option.lower(): value for option, value in self.options}
+        return self._values.get(key.lower(), default)
+
+    def as_dict(self):
+        return dict(self.options)
+
+
+class WgPeer(WgSection):
+    """[Peer] section of a client."""
+
+    def __init__(self, name=None, disabled=False):
+        super().__init__("Peer", name, disabled)
+
+    @property
+    def public_key(self):
+        return self.get("PublicKey")
+
+    @property
+    def preshared_key(self):
+        return self.get("PresharedKey")
+
+    @property
+    def allowed_ips(self):
+        """List of AllowedIPs entries, e.g. ["10.66.66.2/32", "fd42:42:42::2/128"]."""
+        value = self.get("AllowedIPs", "")
+        return [address.strip() for address in value.split(",") if address.strip()]
+
+    @property
+    def addresses(self):
+        """AllowedIPs without prefix lengths."""
+        return [address.split("/", 1)[0] for address in self.allowed_ips]
+
+    @property
+    def blocked(self):
+        return self.disabled
+
+
+def _peer_keys(peer):
+    """Returns the lookup keys of a peer as (index name, key) pairs."""
+    keys = []
+    if peer.name is not None:
+        keys.append(("name", peer.name.casefold()))
+    if peer.public_key:
+        keys.append(("key", peer.public_key))
+    keys.extend(("ip", address) for address in peer.addresses)
+    return keys
+
+
+class WgConfig:
+    """
+    Parsed wg0.conf: the [Interface] section and the list of peers.
+    The position of each peer block is a span:
+    (first line, line after the block, first byte, byte after the block).
+    A block starts at its "### Client" comment and includes the blank lines
+    that follow it.
+    """
+
+    def __init__(self, lines, interface, peers, spans, size, lookups=None):
+        self.lines = lines          # Original lines (with line endings)
+        self.interface = interface
+        self.peers = peers
+        self.spans = spans          # Span of each peer, in file order
+        self.size = size            # File size in bytes
+        self._positions = None      # {id(peer): index in peers}, built on first use
+        if lookups is None:
+            lookups = {"name": {}, "key": {}, "ip": {}}
+            for peer in peers:
+                for index, key in _peer_keys(peer):
+                    lookups[index].setdefault(key, peer)
+        self._lookups = lookups
+
+    @classmethod
+    def parse(cls, text):
+        """
+        Parses the text of a WireGuard configuration.
+        :param text: File content.
+        :return: WgConfig instance.
+        """
+        lines = text.splitlines(keepends=True)
+        interface = None
+        peers = []
+        spans = []
+        section = None
+        pending = None  # Position of a "### Client" line whose [Peer] header is not seen yet
+        pending_name = None
+        offset = 0
+
+        def close(index, offset):
+            if section is not None and section.kind == "Peer":
+                line_start, _, byte_start, _ = spans[-1]
+                spans[-1] = (line_start, index, byte_start, offset)
+
+        for index, raw in enumerate(lines):
+            line_offset = offset
+            offset += len(raw) if raw.isascii() else len(raw.encode("utf-8"))
+            line = raw.strip()
+            if not line:
+                continue
+
+            if line.startswith(CLIENT_MARKER):
+                close(index, line_offset)
+                section = None
+                pending_name = line[len(CLIENT_MARKER):].strip()
+                pending = (index, line_offset)
+                continue
+
+            disabled = False
+            content = line
+            if line.startswith("#"):
+                content = line.lstrip("#").strip()
+                disabled = True
+
+            header = content.lower()
+            if header in ("[peer]", "[interface]"):
+                close(index, line_offset)
+                if header == "[peer]":
+                    line_start, byte_start = pending if pending is not None else (index, line_offset)
+                    section = WgPeer(pending_name, disabled)
+                    peers.append(section)
+                    spans.append((line_start, index + 1, byte_start, offset))
+                elif not disabled:
+                    section = interface = WgSection("Interface")
+                else:
+                    section = None
+                pending = pending_name = None
+                continue
+
+            if section is None or "=" not in content:
+                continue
+            # Comments inside an active section are not options; inside a
+            # commented-out section every "# Key = Value" line is
+            if disabled and not section.disabled:
+                continue
+            key, _, value = content.partition("=")
+            section.options.append((key.strip(), value.strip()))
+
+        close(len(lines), offset)
+        if interface is None:
+            interface = WgSection("Interface")
+        return cls(lines, interface, peers, spans, offset)
+
+    def _lookup(self, index, key):
+        return self._lookups[index].get(key)
+
+    def peer_by_name(self, name):
+        """Finds a peer by client name (case-insensitive)."""
+        return self._lookup("name", str(name).casefold())
+
+    def peer_by_public_key(self, public_key):
+        return self._lookup("key", public_key)
+
+    def peer_by_ip(self, address):
+        """Finds a peer by one of its AllowedIPs (with or without prefix length)."""
+        return self._lookup("ip", str(address).split("/", 1)[0].strip())
+
+    def names(self):
+        """Returns the client names in file order."""
+        return [peer.name for peer in self.peers if peer.name is not None]
+
+    def used_addresses(self):
+        """Returns the set of addresses used by peers (blocked ones included)."""
+        return set(self._lookups["ip"])
+
+    def interface_networks(self):
+        """Returns the networks of the [Interface] Address option."""
+        networks = []
+        for address in (self.interface.get("Address") or "").split(","):
+            address = address.strip()
+            if address:
+                networks.append(ipaddress.ip_interface(address).network)
+        return networks
+
+    def text(self):
+        return "".join(self.lines)
+
+    def span(self, index):
+        """Returns the span of the peer with the given index."""
+        return self.spans[index]
+
+    def _find(self, line):
+        """Returns the index of the first peer block starting at or after a line."""
+        low, high = 0, len(self.peers)
+        while low < high:
+            middle = (low + high) // 2
+            if self.spans[middle][0] < line:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def position(self, peer):
+        """
+        Returns the index of a peer in peers.
+        :raises ValueError: If the peer is not part of this configuration.
+        """
+        if self._positions is None:
+            self._positions = {id(item): index for index, item in enumerate(self.peers)}
+        index = self._positions.get(id(peer))
+        if index is None or self.peers[index] is not peer:
+            raise ValueError(f"peer '{peer.name}' is not in this configuration")
+        return index
+
+    def line_range(self, peer):
+        """Returns (first line, line after the last line) of a peer block."""
+        line_start, line_end, _, _ = self.span(self.position(peer))
+        return line_start, line_end
+
+    def block_text(self, peer):
+        """Returns the lines of a peer block (from its ### Client comment)."""
+        line_start, line_end = self.line_range(peer)
+        return "".join(self.lines[line_start:line_end])
+
+    def byte_offset(self, line):
+        """Returns the byte offset of the start of a line."""
+        index = self._find(line)
+        if index < len(self.peers) and self.span(index)[0] == line:
+            return self.span(index)[2]
+        if index and self.span(index - 1)[1] == line:
+            return self.span(index - 1)[3]
+        if line == len(self.lines):
+            return self.size
+        return sum(len(raw.encode("utf-8")) for raw in self.lines[:line])
+
+    def spliced(self, start, end, text):
+        """
+        Returns the configuration with lines [start, end) replaced by text.
+        Only the new text and the block in front of it are parsed; the other
+        peers are reused and the spans behind the edit are shifted.
+        :param start: First replaced line.
+        :param end: Line after the last replaced line (start for an insert).
+        :param text: New lines; must start a new block (### Client or a header).
+        """
+        new_lines = text.splitlines(keepends=True)
+        if (start and not self.lines[start - 1].endswith("\n")) or (
+                new_lines and end < len(self.lines) and not new_lines[-1].endswith("\n")):
+            # The edit merges two lines: fall back to a full parse
+            return WgConfig.parse("".join(self.lines[:start]) + text + "".join(self.lines[end:]))
+
+        byte_start, byte_end = self.byte_offset(start), self.byte_offset(end)
+        lines = self.lines[:start] + new_lines + self.lines[end:]
+        delta = len(new_lines) - (end - start)
+        byte_delta = len(text.encode("utf-8")) - (byte_end - byte_start)
+
+        # Peers inside [start, end) are replaced, later ones are shifted.
+        # Blank lines at the start of the new text belong to the block in
+        # front of it, so that block is reparsed together with the new text
+        first = self._find(start)
+        last = self._find(end)
+        if first and self.spans[first - 1][1] >= start:
+            first -= 1
+        window_line, window_byte = start, byte_start
+        if first < last:
+            window_line, window_byte = self.spans[first][0], self.spans[first][2]
+        window = WgConfig.parse("".join(lines[window_line:start + len(new_lines)]))
+
+        peers = self.peers[:first] + window.peers + self.peers[last:]
+        later = self.spans[last:]
+        if delta or byte_delta:
+            later = [(a + delta, b + delta, c + byte_delta, d + byte_delta) for a, b, c, d in later]
+        spans = (
+            self.spans[:first]
+            + [(a + window_line, b + window_line, c + window_byte, d + window_byte)
+               for a, b, c, d in window.spans]
+            + later
+        )
+
+        # The lookup tables are copied and patched instead of rebuilt
+        lookups = {index: dict(table) for index, table in self._lookups.items()}
+        for peer in self.peers[first:last]:
+            for index, key in _peer_keys(peer):
+                if lookups[index].get(key) is peer:
+                    del lookups[index][key]
+        for peer in window.peers:
+            for index, key in _peer_keys(peer):
+                lookups[index].setdefault(key, peer)
+        return WgConfig(lines, self.interface, peers, spans, self.size + byte_delta, lookups)
+
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def load_wg_config(path=None):
+    """
+    Returns the parsed configuration, reparsing only when the file changed.
+    :param path: Configuration file; defaults to settings.SERVER_CONFIG_FILE.
+    :return: WgConfig instance (shared, read-only).
+    :raises FileNotFoundError: If the file does not exist.
+    """
+    path = str(path or settings.SERVER_CONFIG_FILE)
+    key = file_key(path)
+    cached = _cache.get(path)
+    if cached is not None and cached[0] == key and key is not None:
+        return cached[1]
+    with _cache_lock:
+        key = file_key(path)
+        cached = _cache.get(path)
+        if cached is not None and cached[0] == key and key is not None:
+            return cached[1]
+        # Bytes are decoded as is (no newline translation) so line offsets match the file
+        config = WgConfig.parse(read_bytes(path).decode("utf-8"))
+        _cache[path] = (key, config)
+        return config
+
+
+def replace_lines(path, config, start, end, text):
+    """
+    Replaces lines [start, end) of the file with text and caches the resulting parse.
+    Must be called with the file locked, with config loaded under that lock.
+    :return: Updated WgConfig.
+    """
+    path = str(path or settings.SERVER_CONFIG_FILE)
+    byte_start, byte_end = config.byte_offset(start), config.byte_offset(end)
+    splice_bytes(path, byte_start, byte_end, text.encode("utf-8"))
+    updated = config.spliced(start, end, text)
+    with _cache_lock:
+        _cache[path] = (file_key(path), updated)
+    return updated
+
+
+def write_wg_config(path, text):
+    """
+    Replaces the whole file atomically and caches its parse.
+    :return: WgConfig of the new content.
+    """
+    path = str(path or settings.SERVER_CONFIG_FILE)
+    with locked(path):
+        write_bytes(path, text.encode("utf-8"))
+        config = WgConfig.parse(text)
+        with _cache_lock:
+            _cache[path] = (file_key(path), config)
+    return config
+
+
+def set_blocked_lines(lines, blocked):
+    """
+    Comments out (blocked=True) or restores the lines of a client block.
+    The ### Client comment and blank lines stay as they are.
+    :return: New list of lines.
+    """
+    updated = []
+    for line in lines:
+        if line.startswith(CLIENT_MARKER) or not line.strip():
+            updated.append(line)
+        elif blocked and not line.startswith("#"):
+            updated.append(f"# {line}")  # Comment out the line
+        elif not blocked and line.startswith("# "):
+            updated.append(line[2:])  # Remove the comment
+        else:
+            updated.append(line)
+    return updated
+
+
+def set_option_lines(lines, key, value):
+    """
+    Sets an option in the lines of a client block, keeping a "# " prefix of a blocked peer.
+    A missing option is added after the last line of the section.
+    :return: New list of lines.
+    """
+    updated = []
+    found = False
+    last = None     # Index of the last non-blank line of the section
+    prefix = ""
+    for line in lines:
+        stripped = line.strip()
+        if stripped and not stripped.startswith(CLIENT_MARKER):
+            commented = stripped.startswith("#")
+            content = stripped.lstrip("#").strip()
+            if content.lower() == "[peer]":
+                prefix = "# " if commented else ""
+            option = content.partition("=")[0].strip()
+            # Comments inside an active section are left alone
+            if "=" in content and option.lower() == key.lower() and commented == bool(prefix):
+                ending = line[len(line.rstrip("\r\n")):]
+                line = f"{prefix}{option} = {value}{ending}"
+                found = True
+            last = len(updated)
+        updated.append(line)
+    if not found and last is not None:
+        if not updated[last].endswith("\n"):
+            updated[last] += "\n"
+        updated.insert(last + 1, f"{prefix}{key} = {value}\n")
+    return updated
+
+
+def peer_block(name, public_key, preshared_key, allowed_ips):
+    """Returns the wg0.conf block of a new client."""
+    return (
+        f"\n### Client {name}\n"
+        f"[Peer]\n"
+        f"PublicKey = {public_key}\n"
+        f"PresharedKey = {preshared_key}\n"
+        f"AllowedIPs = {allowed_ips}\n"
+    )
+
+
+def add_peer(path, name, public_key, preshared_key, allowed_ips):
+    """
+    Appends a client block to the configuration.
+    :param path: Configuration file; defaults to settings.SERVER_CONFIG_FILE.
+    :param name: Client name.
+    :param public_key: Client public key.
+    :param preshared_key: Preshared key.
+    :param allowed_ips: AllowedIPs value, e.g. "10.66.66.2/32".
+    """
+    path = path or settings.SERVER_CONFIG_FILE
+    with locked(path):
+        config = load_wg_config(path)
+        end = len(config.lines)
+        replace_lines(path, config, end, end, peer_block(name, public_key, preshared_key, allowed_ips))
+
+
+def remove_peer(path, name=None, public_key=None):
+    """
+    Removes a client block (### Client comment, [Peer] section and trailing blank lines).
+    :param path: Configuration file; defaults to settings.SERVER_CONFIG_FILE.
+    :param name: Client name.
+    :param public_key: Public key; takes precedence over the name.
+    :return: Removed WgPeer or None if the client was not found.
+    """
+    path = path or settings.SERVER_CONFIG_FILE
+    with locked(path):
+        config = load_wg_config(path)
+        peer = (public_key and config.peer_by_public_key(public_key)) or (name and config.peer_by_name(name))
+        if not peer:
+            return None
+        replace_lines(path, config, *config.line_range(peer), "")
+        return peer
+
+
+def set_peer_blocked(path, name, blocked):
+    """
+    Comments out (blocked=True) or restores (blocked=False) the [Peer] section of a client.
+    :param path: Configuration file; defaults to settings.SERVER_CONFIG_FILE.
+    :param name: Client name.
+    :param blocked: New state.
+    :return: True if the client was found.
+    """
+    path = path or settings.SERVER_CONFIG_FILE
+    with locked(path):
+        config = load_wg_config(path)
+        peer = config.peer_by_name(name)
+        if peer is None:
+            return False
+        start, end = config.line_range(peer)
+        text = "".join(set_blocked_lines(config.lines[start:end], blocked))
+        if text != config.block_text(peer):
+            replace_lines(path, config, start, end, text)
+        return True
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# modules/wg_dump.py
+# ===========================================
+# Parser of `wg show <interface> dump`
+# ===========================================
+# The human-readable `wg show` output ("4.88 KiB", "2 minutes ago",
+# "[fd00::2]:51820") is meant for people; `wg show <interface> dump` prints
+# the same state as tab-separated raw values, one line per peer:
+#
+#   private-key  public-key  listen-port  fwmark                     (interface)
+#   public-key  preshared-key  endpoint  allowed-ips  latest-handshake
+#   transfer-rx  transfer-tx  persistent-keepalive                   (each peer)
+#
+# The output is read line by line from a single `wg` process and turned
+# into typed records: byte counters and handshakes (Unix time, 0 = never)
+# are integers, allowed IPs a list, "(none)"/"off" become None.
+# The private key of the interface is not kept.
+#
+# Example usage:
+# ---------------------
+# from modules.wg_dump import read_wg_dump, format_bytes
+#
+# interface, peers = read_wg_dump("wg0")
+# for peer in peers.values():
+#     print(peer.public_key, format_bytes(peer.transfer_rx), peer.latest_handshake)
+
+import subprocess
+
+import settings
+
+
+def _none(value):
+    return None if value in ("(none)", "off") else value
+
+
+class WgInterfaceStatus:
+    """State of the interface (first line of the dump)."""
+
+    __slots__ = ("public_key", "listen_port", "fwmark")
+
+    def __init__(self, public_key, listen_port, fwmark):
+        self.public_key = public_key
+        self.listen_port = listen_port  # int
+        self.fwmark = fwmark            # str or None
+
+    def __repr__(self):
+        return f"WgInterfaceStatus({self.public_key!r}, {self.listen_port})"
+
+
+class WgPeerStatus:
+    """State of one peer as reported by the kernel."""
+
+    __slots__ = ("public_key", "preshared_key", "endpoint", "allowed_ips",
+                 "latest_handshake", "transfer_rx", "transfer_tx", "persistent_keepalive")
+
+    def __init__(self, public_key, preshared_key, endpoint, allowed_ips,
+                 latest_handshake, transfer_rx, transfer_tx, persistent_keepalive):
+        self.public_key = public_key
+        self.preshared_key = preshared_key                # str or None
+        self.endpoint = endpoint                          # "host:port", "[v6]:port" or None
+        self.allowed_ips = allowed_ips                    # ["10.66.66.2/32", ...]
+        self.latest_handshake = latest_handshake          # Unix time, 0 if never
+        self.transfer_rx = transfer_rx                    # Bytes received from the peer
+        self.transfer_tx = transfer_tx                    # Bytes sent to the peer
+        self.persistent_keepalive = persistent_keepalive  # Seconds or None
+
+    @property
+    def endpoint_host(self):
+        """Endpoint address without the port and IPv6 brackets, or None."""
+        if not self.endpoint:
+            return None
+        host = self.endpoint.rpartition(":")[0]
+        return host[1:-1] if host.startswith("[") else host
+
+    @property
+    def endpoint_port(self):
+        """Endpoint port as int, or None."""
+        if not self.endpoint:
+            return None
+        return int(self.endpoint.rpartition(":")[2])
+
+    def __repr__(self):
+        return f"WgPeerStatus({self.public_key!r}, rx={self.transfer_rx}, tx={self.transfer_tx})"
+
+
+def parse_dump_line(line, interface_line=False):
+    """
+    Parses one line of `wg show <interface> dump`.
+    :param line: Tab-separated line.
+    :param interface_line: The line is the first (interface) line.
+    :return: WgInterfaceStatus or WgPeerStatus.
+    :raises ValueError: If the line is malformed.
+    """
+    fields = line.rstrip("\n").split("\t")
+    if interface_line:
+        if len(fields) != 4:
+            raise ValueError(f"unexpected interface line in wg dump: {line!r}")
+        return WgInterfaceStatus(fields[1], int(fields[2]), _none(fields[3]))
+    if len(fields) != 8:
+        raise ValueError(f"unexpected peer line in wg dump: {line!r}")
+    allowed_ips = _none(fields[3])
+    keepalive = _none(fields[7])
+    return WgPeerStatus(
+        fields[0],
+        _none(fields[1]),
+        _none(fields[2]),
+        allowed_ips.split(",") if allowed_ips else [],
+        int(fields[4]),
+        int(fields[5]),
+        int(fields[6]),
+        int(keepalive) if keepalive else None,
+    )
+
+
+def iter_wg_dump(interface=None):
+    """
+    Streams the dump of an interface from one `wg` process.
+    :param interface: Interface name; defaults to settings.SERVER_WG_NIC.
+    :return: Iterator over a WgInterfaceStatus followed by WgPeerStatus records.
+    :raises subprocess.CalledProcessError: If `wg` fails.
+    """
+    interface = interface or settings.SERVER_WG_NIC
+    args = ["wg", "show", interface, "dump"]
+    with subprocess.Popen(args, stdout=subprocess.PIPE, text=True) as process:
+        for number, line in enumerate(process.stdout):
+            if line.strip():
+                yield parse_dump_line(line, interface_line=number == 0)
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, args)
+
+
+def read_wg_dump(interface=None):
+    """
+    Reads the whole dump of an interface.
+    :param interface: Interface name; defaults to settings.SERVER_WG_NIC.
+    :return: (WgInterfaceStatus or None, {public key: WgPeerStatus}).
+    :raises subprocess.CalledProcessError: If `wg` fails.
+    """
+    status = None
+    peers = {}
+    for record in iter_wg_dump(interface):
+        if isinstance(record, WgInterfaceStatus):
+            status = record
+        else:
+            peers[record.public_key] = record
+    return status, peers
+
+
+def counter_delta(current, baseline):
+    """
+    Returns the bytes counted by a kernel counter since a previous reading.
+    The counters restart from zero when the interface or the peer is
+    recreated, so a value below the baseline is all new traffic.
+    """
+    return current - baseline if current >= baseline else current
+
+
+def format_bytes(count):
+    """Formats a byte count the way `wg show` does (e.g. "4.88 KiB")."""
+    if count < 1024:
+        return f"{count} B"
+    for unit in ("KiB", "MiB", "GiB"):
+        count /= 1024
+        if count < 1024:
+            return f"{count:.2f} {unit}"
+    return f"{count / 1024:.2f} TiB"
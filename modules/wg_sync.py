@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+# modules/wg_sync.py
+# ===========================================
+# Applying wg0.conf to the running WireGuard interface
+# ===========================================
+# After the server configuration changes, the kernel interface is updated
+# with the exact per-peer difference:
+#
+# - The kernel state (interface options and, per public key, the preshared
+#   key and AllowedIPs) is read with `wg show <nic> dump` whenever wg0.conf
+#   differs from the version this process applied last: other processes
+#   (main.py creating a user, the CLI menu) and manual edits change the
+#   file and the interface too, and a peer this process never saw must
+#   still be removed when it is blocked or deleted. Only a sync of an
+#   unchanged file reuses the state kept in memory. A sync
+#   compares it with the configuration and issues targeted
+#   `wg set <nic> peer <key> remove | preshared-key <fd> allowed-ips <ips>`
+#   calls, several peers per call. Keys are passed through pipes, never
+#   through files or the command line.
+# - A full `wg syncconf` is the fallback: when the kernel state cannot be
+#   read, when [Interface] options changed, when more than
+#   settings.WG_SET_MAX_PEERS peers differ, or when `wg set` fails.
+#   render_stripped_config() produces what `wg-quick strip` would print,
+#   from the cached parse (modules/wg_config.py): the wg-quick-only
+#   [Interface] options (Address, DNS, MTU, ...) and blocked (commented
+#   out) peers are left out. It is piped to `wg syncconf` directly, so no
+#   bash or wg-quick process is started.
+# - SyncScheduler coalesces sync requests: a sync runs once no request came
+#   for settings.WG_SYNC_WINDOW seconds (at the latest WG_SYNC_MAX_DELAY
+#   after the first request), so a burst of changes costs one sync. Pending
+#   syncs are flushed when the process exits.
+#
+# Example usage:
+# ---------------------
+# from modules.wg_sync import request_sync, sync_wireguard
+#
+# request_sync()                    # Debounced, returns immediately
+# request_sync(wait=True)           # Returns after the sync covering this request
+# sync_wireguard("wg0")             # Immediate, returns the latency in seconds
+# sync_wireguard("wg0", full=True)  # Immediate `wg syncconf`
+
+import atexit
+import os
+import subprocess
+import threading
+import time
+from pathlib import Path
+
+import settings
+from modules.keygen import generate_public_key
+from modules.user_store import file_key
+from modules.wg_config import load_wg_config
+from modules.wg_dump import read_wg_dump
+
+# [Interface] options understood by wg-quick only (see wg-quick(8), "strip")
+WG_QUICK_OPTIONS = {"address", "dns", "mtu", "table", "preup", "predown", "postup", "postdown", "saveconfig"}
+
+_applied = {}                   # {interface: (file_key() of the applied wg0.conf, state applied to the kernel)}
+_applied_lock = threading.Lock()
+
+
+def interface_config_path(interface):
+    """Returns /etc/wireguard/<interface>.conf (next to settings.SERVER_CONFIG_FILE)."""
+    return Path(settings.SERVER_CONFIG_FILE).parent / f"{interface}.conf"
+
+
+def render_stripped_config(config):
+    """
+    Renders a parsed configuration in the format of `wg-quick strip`.
+    :param config: WgConfig instance.
+    :return: Configuration text for `wg setconf`/`wg syncconf`.
+    """
+    parts = ["[Interface]\n"]
+    parts.extend(
+        f"{key} = {value}\n" for key, value in config.interface.options
+        if key.lower() not in WG_QUICK_OPTIONS
+    )
+    for peer in config.peers:
+        if peer.disabled:
+            continue
+        parts.append("\n[Peer]\n")
+        parts.extend(f"{key} = {value}\n" for key, value in peer.options)
+    return "".join(parts)
+
+
+def desired_state(config):
+    """
+    Returns the kernel state described by a parsed configuration.
+    :param config: WgConfig instance.
+    :return: (interface options, {public key: (preshared key, AllowedIPs)}) for active peers.
+    """
+    interface = tuple(
+        (key.lower(), value) for key, value in config.interface.options
+        if key.lower() not in WG_QUICK_OPTIONS
+    )
+    peers = {}
+    for peer in config.peers:
+        if not peer.disabled and peer.public_key:
+            peers[peer.public_key] = (peer.preshared_key or "", ",".join(peer.allowed_ips))
+    return interface, peers
+
+
+def _fwmark(value):
+    return 0 if value in (None, "", "off") else int(value, 0)
+
+
+def kernel_state(interface, config):
+    """
+    Reads the state applied to the kernel with `wg show <nic> dump`, in the
+    form of desired_state(). [Interface] options cannot be read back (the
+    private key is not printed): they count as applied when the public key,
+    listen port and fwmark of the interface match the configuration.
+    :param interface: Interface name.
+    :param config: WgConfig the state is compared with.
+    :return: State, or None if the interface cannot be read.
+    """
+    try:
+        status, peers = read_wg_dump(interface)
+    except (OSError, ValueError, subprocess.CalledProcessError) as e:
+        print(f"[WARNING] Cannot read the state of {interface} ({e}), syncing the whole configuration.")
+        return None
+    if status is None:
+        return None
+
+    desired = desired_state(config)
+    options = config.interface
+    try:
+        applied = (
+            generate_public_key(options.get("PrivateKey", "").encode()).decode() == status.public_key
+            and int(options.get("ListenPort") or status.listen_port) == status.listen_port
+            and _fwmark(options.get("FwMark")) == _fwmark(status.fwmark)
+        )
+    except (OSError, ValueError, subprocess.CalledProcessError):
+        applied = False
+
+    state = {}
+    for public_key, peer in peers.items():
+        allowed_ips = ",".join(peer.allowed_ips)
+        wanted = desired[1].get(public_key)
+        if wanted is not None and set(wanted[1].split(",")) == set(peer.allowed_ips):
+            allowed_ips = wanted[1]  # Same addresses in another order
+        state[public_key] = (peer.preshared_key or "", allowed_ips)
+    return desired[0] if applied else None, state
+
+
+def peer_delta(previous, desired):
+    """
+    Computes the per-peer changes between two peer states (see desired_state).
+    :return: [(public key, changes)] where changes is None for a removal, or a dict
+             with the changed "preshared_key" and/or "allowed_ips".
+    """
+    delta = [(public_key, None) for public_key in previous if public_key not in desired]
+    for public_key, (preshared_key, allowed_ips) in desired.items():
+        old = previous.get(public_key)
+        changes = {}
+        if old is None or old[0] != preshared_key:
+            if preshared_key or old is not None:
+                changes["preshared_key"] = preshared_key
+        if old is None or old[1] != allowed_ips:
+            changes["allowed_ips"] = allowed_ips
+        if changes:
+            delta.append((public_key, changes))
+    return delta
+
+
+def set_peers(interface, delta):
+    """
+    Applies per-peer changes with `wg set`, settings.WG_SET_BATCH peers per call.
+    Preshared keys are written to pipes and passed as /dev/fd/<n>.
+    :param interface: Interface name.
+    :param delta: Output of peer_delta().
+    :raises subprocess.CalledProcessError: If `wg set` fails.
+    """
+    for first in range(0, len(delta), settings.WG_SET_BATCH):
+        args = ["wg", "set", interface]
+        fds = []
+        try:
+            for public_key, changes in delta[first:first + settings.WG_SET_BATCH]:
+                args += ["peer", public_key]
+                if changes is None:
+                    args.append("remove")
+                    continue
+                if "preshared_key" in changes:
+                    if changes["preshared_key"]:
+                        read_fd, write_fd = os.pipe()
+                        fds.append(read_fd)
+                        os.write(write_fd, changes["preshared_key"].encode() + b"\n")
+                        os.close(write_fd)
+                        args += ["preshared-key", f"/dev/fd/{read_fd}"]
+                    else:
+                        args += ["preshared-key", "/dev/null"]  # An empty key removes it
+                if "allowed_ips" in changes:
+                    args += ["allowed-ips", changes["allowed_ips"]]
+            subprocess.run(args, pass_fds=fds, check=True)
+        finally:
+            for fd in fds:
+                os.close(fd)
+
+
+def sync_wireguard(interface=None, config_path=None, full=False):
+    """
+    Applies the configuration file of an interface to the kernel: with targeted
+    `wg set` calls when possible, otherwise with `wg syncconf`.
+    :param interface: Interface name; defaults to settings.SERVER_WG_NIC.
+    :param config_path: Configuration file; defaults to /etc/wireguard/<interface>.conf.
+    :param full: Always run `wg syncconf`.
+    :return: Latency of the sync in seconds.
+    :raises subprocess.CalledProcessError: If the sync fails.
+    """
+    interface = interface or settings.SERVER_WG_NIC
+    if not interface:
+        raise ValueError("SERVER_WG_NIC is not set, cannot sync WireGuard.")
+    start = time.perf_counter()
+    path = config_path or interface_config_path(interface)
+    with _applied_lock:
+        signature = file_key(path)  # Taken before reading: a later write gives another key
+        config = load_wg_config(path)
+        desired = desired_state(config)
+        signature_applied, previous = _applied.pop(interface, (None, None))  # Restored only after a successful sync
+        if full:
+            previous = None
+        elif previous is None or signature is None or signature != signature_applied:
+            # Changed since this process applied it, possibly by another writer: compare with the kernel
+            previous = kernel_state(interface, config)
+        delta = None
+        if not full and previous is not None and previous[0] == desired[0]:
+            delta = peer_delta(previous[1], desired[1])
+            if len(delta) > settings.WG_SET_MAX_PEERS:
+                delta = None
+        if delta is not None:
+            try:
+                set_peers(interface, delta)
+            except subprocess.CalledProcessError as e:
+                print(f"[WARNING] wg set failed ({e}), falling back to wg syncconf.")
+                delta = None
+        if delta is None:
+            stripped = render_stripped_config(config)
+            subprocess.run(["wg", "syncconf", interface, "/dev/stdin"], input=stripped, text=True, check=True)
+        _applied[interface] = (signature, desired)
+    return time.perf_counter() - start
+
+
+def record_applied_state(interface, state, signature):
+    """
+    Sets the kernel state known to be applied (e.g. after the reconciler
+    changed the interface), so the next sync computes its difference from it.
+    :param interface: Interface name.
+    :param state: Output of desired_state().
+    :param signature: file_key() of the configuration the state was built from.
+    """
+    with _applied_lock:
+        _applied[interface] = (signature, state)
+
+
+class SyncScheduler:
+    """Debounces sync requests for one interface and runs them in a background thread."""
+
+    def __init__(self, interface=None, config_path=None, window=None, max_delay=None, sync=None):
+        """
+        :param interface: Interface name; defaults to settings.SERVER_WG_NIC.
+        :param config_path: Configuration file; defaults to /etc/wireguard/<interface>.conf.
+        :param window: Quiet period before a sync; defaults to settings.WG_SYNC_WINDOW.
+        :param max_delay: Longest delay of a request; defaults to settings.WG_SYNC_MAX_DELAY.
+        :param sync: Function (interface, config_path) -> latency; defaults to sync_wireguard.
+        """
+        self.interface = interface
+        self.config_path = config_path
+        self.window = settings.WG_SYNC_WINDOW if window is None else window
+        self.max_delay = settings.WG_SYNC_MAX_DELAY if max_delay is None else max_delay
+        self._sync = sync or sync_wireguard
+        self._cond = threading.Condition()
+        self._thread = None
+        self._pending = 0           # Requests not covered by a started sync
+        self._first_request = None
+        self._last_request = None
+        self._flushing = False
+        self._started = 0           # Number of started syncs
+        self._done = 0              # Number of finished syncs
+        self._errors = {}           # {sync number: exception} of failed syncs someone waits for
+        self._waiting = {}          # {sync number: number of waiting requests}
+        self.stats = {"requests": 0, "syncs": 0, "errors": 0, "last_latency": None, "max_latency": 0.0}
+
+    def request(self, wait=False):
+        """
+        Asks for a sync of the interface.
+        :param wait: Block until a sync that started after this request has finished.
+        :raises Exception: With wait=True, the error of that sync.
+        """
+        with self._cond:
+            now = time.monotonic()
+            self._pending += 1
+            self.stats["requests"] += 1
+            if self._first_request is None:
+                self._first_request = now
+            self._last_request = now
+            target = self._started + 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._worker, name="wg-sync", daemon=True)
+                self._thread.start()
+            else:
+                self._cond.notify_all()
+            if wait:
+                self._wait_for(target)
+
+    def flush(self):
+        """Runs a pending sync now and waits until all requested syncs have finished."""
+        with self._cond:
+            target = self._started + 1 if self._pending else self._started
+            if self._pending:
+                self._flushing = True
+                self._cond.notify_all()
+            self._wait_for(target)
+
+    def _wait_for(self, target):
+        self._waiting[target] = self._waiting.get(target, 0) + 1
+        try:
+            while self._done < target:
+                self._cond.wait()
+            error = self._errors.get(target)
+        finally:
+            # The error is kept only until the last waiter of that sync has seen it
+            self._waiting[target] -= 1
+            if not self._waiting[target]:
+                del self._waiting[target]
+                self._errors.pop(target, None)
+        if error is not None:
+            raise error
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while True:
+                    if not self._pending:
+                        self._thread = None  # Idle: the next request starts a new thread
+                        return
+                    now = time.monotonic()
+                    deadline = min(self._last_request + self.window, self._first_request + self.max_delay)
+                    if self._flushing or now >= deadline:
+                        break
+                    self._cond.wait(deadline - now)
+                requests, self._pending = self._pending, 0
+                self._first_request = self._last_request = None
+                self._flushing = False
+                self._started += 1
+                number = self._started
+
+            error = latency = None
+            try:
+                latency = self._sync(self.interface, self.config_path)
+            except Exception as e:
+                error = e
+
+            with self._cond:
+                self.stats["syncs"] += 1
+                if error is None:
+                    self.stats["last_latency"] = latency
+                    self.stats["max_latency"] = max(self.stats["max_latency"], latency)
+                    print(f"WireGuard synced for interface {self.interface or settings.SERVER_WG_NIC} "
+                          f"in {latency * 1000:.1f} ms ({requests} request(s))")
+                else:
+                    self.stats["errors"] += 1
+                    if number in self._waiting:
+                        self._errors[number] = error
+                    print(f"[ERROR] WireGuard sync failed: {error}")
+                self._done = number
+                self._cond.notify_all()
+
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def get_sync_scheduler(interface=None):
+    """Returns the process-wide scheduler of an interface."""
+    interface = interface or settings.SERVER_WG_NIC
+    with _schedulers_lock:
+        scheduler = _schedulers.get(interface)
+        if scheduler is None:
+            scheduler = _schedulers[interface] = SyncScheduler(interface)
+        return scheduler
+
+
+def request_sync(interface=None, wait=False):
+    """Requests a debounced sync of an interface (see SyncScheduler.request)."""
+    get_sync_scheduler(interface).request(wait=wait)
+
+
+@atexit.register
+def flush_pending_syncs():
+    """Runs the syncs still waiting for their window (called at exit)."""
+    with _schedulers_lock:
+        schedulers = list(_schedulers.values())
+    for scheduler in schedulers:
+        try:
+            scheduler.flush()
+        except Exception:
+            pass  # Already reported by the worker
@@ -40,11 +40,46 @@ PROJECT_DIR = BASE_DIR  # For compatibility, PROJECT_DIR equals BASE_DIR
 WG_CONFIG_DIR = BASE_DIR / "user/data/wg_configs"  # Path to user WireGuard configurations
 QR_CODE_DIR = BASE_DIR / "user/data/qrcodes"      # Path to saved QR codes
 STALE_CONFIG_DIR = BASE_DIR / "user/data/usr_stale_config"  # Path to stale user configurations
-USER_DB_PATH = BASE_DIR / "user/data/user_records.json"  # User database
+ARTIFACT_DIR = BASE_DIR / "user/data/artifacts"  # Client configs and QR codes (content-addressed, replaces the two directories above)
+USER_DB_PATH = BASE_DIR / "user/data/user_records.json"  # User database (JSON, legacy backend)
+USER_DB_SQLITE_PATH = BASE_DIR / "user/data/user_records.sqlite3"  # User database (SQLite backend)
+USER_DB_BACKEND = "sqlite"  # User database backend: "sqlite" (default), "journal" or "json" (legacy)
+USER_DB_JOURNAL_MAX_BYTES = 1024 * 1024  # "journal" backend: compact the journal into the snapshot past this size
+USER_DB_BINARY_SNAPSHOT = True  # "json"/"journal" backends: keep user_records.snapshot, a binary copy that loads faster than the JSON
+FSYNC_WRITES = True  # Flush database and configuration writes to disk before the atomic rename completes
 #IP_DB_PATH = BASE_DIR / "user/data/ip_records.json"      # IP address database
 SERVER_CONFIG_FILE = Path("/etc/wireguard/wg0.conf")     # Path to WireGuard server configuration file
 SERVER_BACKUP_CONFIG_FILE = Path("/etc/wireguard/wg0.conf.bak") # Path to WireGuard server backup configuration file
 PARAMS_FILE = Path("/etc/wireguard/params")             # Path to WireGuard parameters file
+WG_SYNC_WINDOW = 0.05    # Seconds without new changes before the kernel is synced (a burst of changes gives one sync)
+WG_SYNC_MAX_DELAY = 5.0  # Upper bound in seconds between the first change and the sync, even if changes keep coming
+WG_SET_MAX_PEERS = 256   # Peer changes applied with `wg set`; larger differences use one `wg syncconf`
+WG_SET_BATCH = 64        # Peers per `wg set` call
+RECONCILE_INTERVAL = 300 # Seconds between reconciler runs while the admin panel is running (0 disables them)
+RECONCILE_PAUSE = 0.1    # Seconds between `wg set` batches of the reconciler
+TELEMETRY_INTERVAL = 10          # Seconds between `wg show dump` samples of the admin panel poller
+TELEMETRY_PERSIST_INTERVAL = 60  # Seconds between writes of the sampled traffic/handshakes to the user database (0 disables them)
+TRAFFIC_HISTORY_DIR = BASE_DIR / "user/data/traffic"  # Per-peer traffic time series (one fixed-size file per peer)
+TRAFFIC_HISTORY_TIERS = (  # (bucket seconds, buckets kept), fine to coarse; ~76 KiB per peer with these values
+    (10, 360),      # Raw samples: 1 hour
+    (60, 1440),     # Minutes: 1 day
+    (3600, 720),    # Hours: 30 days
+    (86400, 730),   # Days: 2 years
+)
+TRAFFIC_HISTORY_MAX_OPEN = 512  # Series files of peers missing from the latest sample kept memory-mapped (active peers always are)
+IP_ALLOCATOR_PATH = BASE_DIR / "user/data/ip_allocator.json"  # Bitmap of taken tunnel addresses, reservations and quarantine
+IP_QUARANTINE = 7 * 86400  # Seconds before the address of a deleted user is handed out again
+IP_RESERVED = ()           # Addresses of the subnet never handed out to users (e.g. ("10.66.66.10",))
+QR_CACHE_DIR = BASE_DIR / "user/data/qr_cache"  # Rendered QR codes keyed by config hash (None keeps them in memory only)
+QR_CACHE_MAX_BYTES = 32 * 1024 * 1024          # Memory bound of the QR code cache (PNG bytes)
+QR_CACHE_DISK_MAX_BYTES = 64 * 1024 * 1024     # Disk bound of QR_CACHE_DIR; least recently used files are deleted
+KEY_POOL_PATH = BASE_DIR / "user/data/key_pool.bin"      # Pre-generated key sets, encrypted (mode 0600)
+KEY_POOL_KEY_PATH = BASE_DIR / "user/data/key_pool.key"  # Encryption key of the key pool (mode 0600)
+KEY_POOL_SIZE = 500            # Key sets kept ready for new users (0 disables the pool)
+KEY_POOL_LOW_WATER = 100       # A refill starts when fewer key sets are left
+KEY_POOL_REFILL_INTERVAL = 60  # Seconds between pool checks while the admin panel is running (0 disables them)
+KEYGEN_BACKEND = "auto"    # Key generation: "native" (in-process, needs cryptography), "wg" (wg genkey/pubkey/genpsk) or "auto"
+WG_DUAL_STACK = True       # New users also get an IPv6 address if wg0.conf has an IPv6 Address (e.g. fd42:42:42::1/64)
 
 # WireGuard parameters
 DEFAULT_TRIAL_DAYS = 30  # Default account validity in days
@@ -58,6 +93,7 @@ LOG_DIR = BASE_DIR / "user/data/logs"  # Directory for storing logs
 DIAGNOSTICS_LOG = LOG_DIR / "diagnostics.log"  # Diagnostics log file
 SUMMARY_REPORT_PATH = LOG_DIR / "summary_report.txt"  # File for storing summary reports
 LOG_FILE_PATH = LOG_DIR / "app.log"  # Application log file
+DELETED_USERS_LOG = LOG_DIR / "deleted_users.jsonl"  # One JSON line per deleted user (removed_at, addresses, public key; no secrets)
 LOG_LEVEL = "DEBUG"  # Logging level: DEBUG, INFO, WARNING, ERROR
 
 # Paths for reports and message database
@@ -129,7 +165,9 @@ def check_paths():
         "PROJECT_DIR": PROJECT_DIR,
         "WG_CONFIG_DIR": WG_CONFIG_DIR,
         "QR_CODE_DIR": QR_CODE_DIR,
+        "ARTIFACT_DIR": ARTIFACT_DIR,
         "USER_DB_PATH": USER_DB_PATH,
+        "USER_DB_SQLITE_PATH": USER_DB_SQLITE_PATH,
         #"IP_DB_PATH": IP_DB_PATH,
         "SERVER_CONFIG_FILE": SERVER_CONFIG_FILE,
         "PARAMS_FILE": PARAMS_FILE,
@@ -0,0 +1,72 @@
+import unittest
+import os
+import sys
+import tempfile
+from pathlib import Path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from modules.artifact_store import ArtifactStore, import_flat_directories
+
+
+class TestArtifactStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.store = ArtifactStore(self.dir / "artifacts")
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp.cleanup()
+
+    def test_put_and_resolve(self):
+        """Тест: файл хранится в подкаталогах по хэшу и находится через манифест."""
+        path = self.store.put("alice", "config", "[Interface]\n")
+        self.assertEqual(path.suffix, ".conf")
+        self.assertEqual(path.parent.parent.parent, self.dir / "artifacts" / "objects")
+        self.assertTrue(path.name.startswith(path.parent.parent.name + path.parent.name))
+        self.assertEqual(self.store.path("alice", "config"), path)
+        self.assertEqual(self.store.read("alice", "config"), b"[Interface]\n")
+        self.assertIsNone(self.store.path("alice", "qr"))
+        self.assertIsNone(self.store.path("bob", "config"))
+
+    def test_identical_blobs_are_deduplicated(self):
+        """Тест: одинаковое содержимое хранится один раз и удаляется с последней ссылкой."""
+        first = self.store.put("alice", "qr", b"png")
+        second = self.store.put("bob", "qr", b"png")
+        self.assertEqual(first, second)
+        self.store.remove("alice")
+        self.assertTrue(second.exists())
+        self.store.remove("bob")
+        self.assertFalse(second.exists())
+
+    def test_replacing_artifact_collects_old_blob(self):
+        """Тест: при замене файла старый объект удаляется."""
+        old = self.store.put("alice", "config", "old")
+        new = self.store.put("alice", "config", "new")
+        self.assertFalse(old.exists())
+        self.assertEqual(self.store.path("alice", "config"), new)
+
+    def test_remove_returns_entries(self):
+        """Тест: удаление пользователя возвращает удалённые записи манифеста."""
+        self.store.put("alice", "config", "cfg")
+        self.store.put("alice", "qr", b"png")
+        removed = dict(self.store.remove("alice"))
+        self.assertEqual(set(removed), {"config", "qr"})
+        self.assertEqual(self.store.count(), 0)
+
+    def test_import_flat_directories(self):
+        """Тест: перенос файлов из старых плоских каталогов."""
+        config_dir = self.dir / "wg_configs"
+        qr_dir = self.dir / "qrcodes"
+        config_dir.mkdir()
+        qr_dir.mkdir()
+        (config_dir / "alice.conf").write_text("cfg")
+        (config_dir / "notes.txt").write_text("ignored")
+        (qr_dir / "alice.png").write_bytes(b"png")
+        self.assertEqual(import_flat_directories(self.store, config_dir, qr_dir), 2)
+        self.assertEqual(self.store.read("alice", "qr"), b"png")
+        self.assertEqual(import_flat_directories(self.store, config_dir, qr_dir), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
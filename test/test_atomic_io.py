@@ -0,0 +1,98 @@
+import unittest
+import fcntl
+import os
+import stat
+import sys
+import tempfile
+import threading
+from pathlib import Path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from modules.atomic_io import (
+    lock_path,
+    locked,
+    read_text,
+    write_text,
+    append_text,
+    splice_bytes,
+    read_json,
+    write_json
+)
+
+
+class TestAtomicIO(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.path = self.dir / "wg0.conf"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_write_replaces_file_and_keeps_mode(self):
+        """Тест: атомарная запись сохраняет права файла и не оставляет временных файлов."""
+        self.path.write_text("old")
+        os.chmod(self.path, 0o600)
+        write_text(self.path, "new", fsync=True)
+        self.assertEqual(read_text(self.path), "new")
+        self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0o600)
+        self.assertEqual(sorted(p.name for p in self.dir.iterdir()), ["wg0.conf", "wg0.conf.lock"])
+
+    def test_append_and_json(self):
+        """Тест: дописывание текста и чтение/запись JSON."""
+        append_text(self.path, "a\n")
+        append_text(self.path, "b\n")
+        self.assertEqual(read_text(self.path), "a\nb\n")
+        write_json(self.dir / "data.json", {"alice": 1})
+        self.assertEqual(read_json(self.dir / "data.json"), {"alice": 1})
+        self.assertEqual(read_json(self.dir / "missing.json", default={}), {})
+
+    def test_splice_bytes(self):
+        """Тест: замена диапазона байтов сохраняет начало и конец файла и его права."""
+        self.path.write_bytes(b"head|middle|tail")
+        os.chmod(self.path, 0o600)
+        splice_bytes(self.path, 5, 11, b"new")
+        self.assertEqual(self.path.read_bytes(), b"head|new|tail")
+        splice_bytes(self.path, 0, 0, b">")
+        self.assertEqual(self.path.read_bytes(), b">head|new|tail")
+        self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0o600)
+        with self.assertRaises(ValueError):
+            splice_bytes(self.path, 10, 100, b"")
+
+    def test_exclusive_lock_excludes_other_descriptors(self):
+        """Тест: эксклюзивная блокировка видна другим открытым дескрипторам."""
+        self.path.write_text("")
+        with locked(self.path):
+            fd = os.open(lock_path(self.path), os.O_RDWR)
+            try:
+                with self.assertRaises(BlockingIOError):
+                    fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+            finally:
+                os.close(fd)
+
+    def test_lock_is_reentrant(self):
+        """Тест: повторный захват блокировки в том же потоке не блокирует."""
+        write_text(self.path, "1")
+        with locked(self.path):
+            write_text(self.path, read_text(self.path) + "2")
+        self.assertEqual(read_text(self.path), "12")
+
+    def test_concurrent_read_modify_write_loses_nothing(self):
+        """Тест: параллельные циклы чтение-изменение-запись не теряют обновлений."""
+        write_text(self.path, "0")
+
+        def increment():
+            for _ in range(20):
+                with locked(self.path):
+                    write_text(self.path, str(int(read_text(self.path)) + 1), fsync=False)
+
+        threads = [threading.Thread(target=increment) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(read_text(self.path), "80")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,175 @@
+import unittest
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+from unittest import mock
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from modules.ip_allocator import (
+    IpAllocator,
+    allocate_ip,
+    client_networks,
+    confirm_allocations,
+    ipv6_address,
+    free_ips,
+    release_ips,
+    reserve_ip
+)
+from modules.user_store import file_key
+from modules.wg_config import WgConfig, peer_block
+
+INTERFACE = "[Interface]\nAddress = 10.66.66.1/24,fd42:42:42::1/64\nListenPort = 51820\n\n"
+T0 = 1_700_000_000
+
+
+def config_text(*peers):
+    return INTERFACE + "".join(
+        peer_block(name, f"key-{name}=", "psk", f"{address}/32") for name, address in peers
+    )
+
+
+class TestIpAllocator(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.config = Path(self.tmp.name) / "wg0.conf"
+        self.state = Path(self.tmp.name) / "ip_allocator.json"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write_config(self, *peers):
+        self.config.write_text(config_text(*peers))
+        os.utime(self.config, ns=(T0 * 10**9, T0 * 10**9 + len(peers)))  # Distinct mtime per write
+
+    def allocate(self, now=T0, exclude=()):
+        return allocate_ip(self.config, "10.66.66.0/24", exclude=exclude, state_path=self.state, now=now)
+
+    def test_skips_server_network_and_used_addresses(self):
+        """Тест: адрес сервера, адрес сети и занятые (в т.ч. заблокированные) адреса не выдаются."""
+        text = config_text(("alice", "10.66.66.2"))
+        text += "# " + peer_block("bob", "key-bob=", "psk", "10.66.66.3/32").replace("\n", "\n# ", 3)
+        self.config.write_text(text)
+        self.assertEqual(self.allocate(), "10.66.66.4")
+        self.assertEqual(self.allocate(exclude={"10.66.66.5"}), "10.66.66.6")
+
+    def test_server_address_of_params_is_not_handed_out(self):
+        """Тест: старая установка с Address = 10.66.66.0/24 — адрес сервера .1 из params не выдаётся."""
+        self.config.write_text("[Interface]\nAddress = 10.66.66.0/24\nListenPort = 51820\n\n")
+        network, _ = client_networks(self.config, "10.66.66.1")
+        self.assertEqual(str(network), "10.66.66.0/24")
+        allocated = []
+        with self.assertRaises(ValueError):  # Until the subnet is full, across free_ips() calls
+            while True:
+                allocated.append(
+                    allocate_ip(self.config, network, state_path=self.state, now=T0, server_ipv4="10.66.66.1")
+                )
+                free_ips(["10.66.66.1"], state_path=self.state)
+        self.assertEqual(allocated[:2], ["10.66.66.2", "10.66.66.3"])
+        self.assertEqual(len(allocated), 253)
+        self.assertNotIn("10.66.66.1", allocated)
+
+    def test_next_fit_and_full_subnet(self):
+        """Тест: адреса выдаются по порядку, при заполнении подсети — ValueError."""
+        allocator = IpAllocator("10.0.0.0/29")
+        allocator.sync(WgConfig.parse("[Interface]\nAddress = 10.0.0.1/29\n"))
+        self.assertEqual([allocator.allocate() for _ in range(5)],
+                         ["10.0.0.2", "10.0.0.3", "10.0.0.4", "10.0.0.5", "10.0.0.6"])
+        with self.assertRaises(ValueError):
+            allocator.allocate()
+
+    def test_deleted_address_is_quarantined(self):
+        """Тест: адрес удалённого пользователя выдаётся снова только после карантина."""
+        self.write_config(("alice", "10.66.66.2"), ("bob", "10.66.66.3"))
+        self.assertEqual(self.allocate(), "10.66.66.4")
+        self.write_config(("bob", "10.66.66.3"))  # alice deleted
+        with mock.patch("settings.IP_QUARANTINE", 3600):
+            self.assertEqual(self.allocate(T0 + 10), "10.66.66.5")
+            allocator = IpAllocator.from_dict(json.loads(self.state.read_text()), "10.66.66.0/24")
+            self.assertIn("10.66.66.2", allocator.quarantine)
+            # After the quarantine the lowest free address after the cursor wraps back to it
+            allocator.cursor = 254
+            allocator.expire(T0 + 3611)
+            self.assertEqual(allocator.allocate(), "10.66.66.2")
+
+    def test_rebuilds_on_drift_and_other_subnet(self):
+        """Тест: ручное изменение wg0.conf и смена подсети перестраивают битовую карту."""
+        self.write_config(("alice", "10.66.66.2"))
+        self.assertEqual(self.allocate(), "10.66.66.3")
+        self.write_config(("alice", "10.66.66.2"), ("manual", "10.66.66.4"))  # Added by hand
+        self.assertEqual(self.allocate(), "10.66.66.5")
+        self.assertEqual(
+            allocate_ip(self.config, "10.77.0.0/24", state_path=self.state, now=T0), "10.77.0.1"
+        )
+
+    def test_reservations(self):
+        """Тест: зарезервированные адреса не выдаются до снятия резерва."""
+        self.write_config()
+        reserve_ip("10.66.66.2", "10.66.66.0/24", state_path=self.state)
+        self.assertEqual(self.allocate(), "10.66.66.3")
+        with self.assertRaises(ValueError):
+            reserve_ip("10.1.1.1", "10.66.66.0/24", state_path=self.state)
+        with mock.patch("settings.IP_RESERVED", ("10.66.66.4",)):
+            self.assertEqual(self.allocate(), "10.66.66.5")
+
+    def test_large_subnet_uses_every_host(self):
+        """Тест: в подсети /16 выдаются и адреса .0 и .255 внутри диапазона."""
+        allocator = IpAllocator("10.66.0.0/16")
+        allocator.sync(WgConfig.parse("[Interface]\nAddress = 10.66.0.1/16\n"))
+        addresses = [allocator.allocate() for _ in range(20000)]
+        self.assertEqual(len(set(addresses)), 20000)
+        self.assertEqual(addresses[:2], ["10.66.0.2", "10.66.0.3"])
+        self.assertIn("10.66.0.255", addresses)
+        self.assertIn("10.66.1.0", addresses)
+        self.assertEqual(len(allocator.bitmap), 8192)
+
+    def test_client_networks_and_ipv6_offset(self):
+        """Тест: подсети берутся из Address в wg0.conf, IPv6 — по смещению IPv4-адреса."""
+        self.config.write_text("[Interface]\nAddress = 10.66.0.1/20,fd42:42:42::1/64\n")
+        ipv4, ipv6 = client_networks(self.config)
+        self.assertEqual((str(ipv4), str(ipv6)), ("10.66.0.0/20", "fd42:42:42::/64"))
+        self.assertEqual(ipv6_address("10.66.1.7", ipv4, ipv6), "fd42:42:42::107")
+        with mock.patch("settings.WG_DUAL_STACK", False):
+            self.assertIsNone(client_networks(self.config)[1])
+        self.config.unlink()
+        with mock.patch("settings.USER_SET_SUBNET", "10.8.0.0/16"):
+            self.assertEqual(str(client_networks(self.config, "10.8.0.1")[0]), "10.8.0.0/16")
+
+    def test_confirmed_write_is_not_drift(self):
+        """Тест: после подтверждённой записи wg0.conf файл не сравнивается заново."""
+        self.write_config(("alice", "10.66.66.2"))
+        self.assertEqual(self.allocate(), "10.66.66.3")
+        written = file_key(self.config)
+        self.write_config(("alice", "10.66.66.2"), ("bob", "10.66.66.3"))
+        confirm_allocations(self.config, written, state_path=self.state)
+        with mock.patch.object(IpAllocator, "sync") as sync:
+            self.assertEqual(self.allocate(), "10.66.66.4")
+        sync.assert_not_called()
+
+    def test_release_quarantines_at_once(self):
+        """Тест: адреса удалённого пользователя сразу уходят в карантин, без сравнения с wg0.conf."""
+        self.write_config(("alice", "10.66.66.2"))
+        self.assertEqual(self.allocate(), "10.66.66.3")
+        release_ips(["10.66.66.2/32", "fd42:42:42::2/128", "N/A"], state_path=self.state, now=T0)
+        allocator = IpAllocator.from_dict(json.loads(self.state.read_text()), "10.66.66.0/24")
+        self.assertIn("10.66.66.2", allocator.quarantine)
+        self.assertTrue(allocator.is_taken("10.66.66.2"))
+        release_ips(["10.66.66.9"], state_path=Path(self.tmp.name) / "missing.json")  # No state: nothing to do
+
+    def test_free_returns_unwritten_addresses_at_once(self):
+        """Тест: адреса неудавшегося создания пользователя сразу возвращаются без карантина."""
+        self.write_config(("alice", "10.66.66.2"))
+        self.assertEqual(self.allocate(), "10.66.66.3")
+        self.assertEqual(self.allocate(exclude={"10.66.66.3"}), "10.66.66.4")
+        release_ips(["10.66.66.2"], state_path=self.state, now=T0)
+        free_ips(["10.66.66.3/32", "10.66.66.4/32", "fd42:42:42::4/128", "10.66.66.2"], state_path=self.state)
+        allocator = IpAllocator.from_dict(json.loads(self.state.read_text()), "10.66.66.0/24")
+        self.assertFalse(allocator.is_taken("10.66.66.3"))
+        self.assertFalse(allocator.is_taken("10.66.66.4"))
+        self.assertIn("10.66.66.2", allocator.quarantine)  # A released address stays in quarantine
+        self.assertEqual(self.allocate(), "10.66.66.5")    # Next fit; 3 and 4 are reused on wrap-around
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+import base64
+import os
+import stat
+import sys
+import tempfile
+from pathlib import Path
+from unittest import mock
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from modules import key_pool
+from modules.key_pool import HEADER, RECORD_SIZE, KeyPool, take_keys
+from modules.keygen import NativeBackend
+
+
+@unittest.skipIf(key_pool.AESGCM is None, "cryptography is not installed")
+class TestKeyPool(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.pool = KeyPool(self.dir / "key_pool.bin", self.dir / "key_pool.key")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_refill_and_take(self):
+        """Тест: пул пополняется до цели, ключи выдаются по одному и не повторяются."""
+        self.assertIsNone(self.pool.take())
+        self.assertEqual(self.pool.refill(target=12, batch=5), 12)
+        self.assertEqual(len(self.pool), 12)
+        self.assertEqual(self.pool.refill(target=12), 0)
+        taken = [self.pool.take() for _ in range(12)]
+        self.assertIsNone(self.pool.take())
+        self.assertEqual(len({keys[0] for keys in taken}), 12)
+        native = NativeBackend()
+        for private_key, public_key, preshared_key in taken:
+            self.assertEqual(native.public_key(private_key), public_key)
+            self.assertEqual(len(preshared_key), 44)
+
+    def test_files_are_private_and_encrypted(self):
+        """Тест: файлы пула доступны только владельцу, ключи хранятся в зашифрованном виде."""
+        self.pool.refill(target=3)
+        for path in (self.pool.path, self.pool.key_path):
+            self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o600)
+        data = Path(self.pool.path).read_bytes()
+        self.assertEqual(len(data), HEADER.size + 3 * RECORD_SIZE)
+        private_key, _, _ = KeyPool(self.pool.path, self.pool.key_path).take()
+        self.assertNotIn(base64.b64decode(private_key), data)
+
+    def test_partial_record_is_dropped(self):
+        """Тест: недописанная последняя запись отбрасывается."""
+        self.pool.refill(target=2)
+        with open(self.pool.path, "ab") as f:
+            f.write(b"x" * 10)
+        self.assertIsNotNone(self.pool.take())
+        self.assertEqual(len(self.pool), 1)
+
+    def test_take_keys_uses_pool_and_falls_back(self):
+        """Тест: take_keys берёт ключи из пула, при пустом или отключённом пуле генерирует их."""
+        self.pool.refill(target=1)
+        expected = KeyPool(self.pool.path, self.pool.key_path)
+        with mock.patch("settings.KEY_POOL_PATH", self.pool.path), \
+                mock.patch("settings.KEY_POOL_KEY_PATH", self.pool.key_path), \
+                mock.patch("modules.key_pool.request_refill") as request_refill:
+            first = take_keys()
+            second = take_keys()
+            self.assertEqual(request_refill.call_count, 2)
+        self.assertEqual(len(expected), 0)
+        self.assertNotEqual(first, second)
+        self.assertEqual(NativeBackend().public_key(second[0]), second[1])
+        with mock.patch("settings.KEY_POOL_SIZE", 0):
+            self.assertIsNone(key_pool.get_key_pool())
+            self.assertEqual(len(take_keys()), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,16 @@
 'USING: # PYTHONPATH=/var/www/html/grav/user/scripts/wg_qr_generator python3 -m unittest test_keygen.py'
 
 import unittest
+import base64
+import os
+import shutil
 import subprocess
-from modules.keygen import generate_private_key, generate_public_key
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from modules import keygen
+from modules.keygen import generate_private_key, generate_public_key, generate_preshared_key
 
+@unittest.skipUnless(shutil.which("wg"), "wg is not installed")
 class TestKeygen(unittest.TestCase):
 
     def test_generate_private_key(self):
@@ -38,12 +45,55 @@ class TestKeygen(unittest.TestCase):
     def test_invalid_private_key(self):
         '''
         Проверяем, что при некорректном приватном ключе возникает ошибка
-        Сообщение `wg: Key is not the correct length or format` связано с этим тестом.
+        Сообщение `Key is not the correct length or format` связано с этим тестом.
         Оно возникает, так как передается недопустимый ключ (b"invalid_key").
         '''
         invalid_key_bytes = b"invalid_key"
-        with self.assertRaises(subprocess.CalledProcessError):
+        with self.assertRaises(ValueError):
             generate_public_key(invalid_key_bytes)  # Передаем bytes напрямую
 
+@unittest.skipIf(keygen.X25519PrivateKey is None, "cryptography is not installed")
+class TestNativeKeygen(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = keygen.NativeBackend()
+
+    def test_rfc7748_vector(self):
+        """Тест: открытый ключ совпадает с тестовым вектором RFC 7748."""
+        private_key = base64.b64encode(keygen.RFC7748_PRIVATE)
+        self.assertEqual(self.backend.public_key(private_key), base64.b64encode(keygen.RFC7748_PUBLIC))
+        self.assertEqual(keygen.self_test(samples=2), [])
+
+    def test_key_format_matches_wg(self):
+        """Тест: ключи в формате `wg` — base64 длиной 44, закрытый ключ «зажат» как в `wg genkey`."""
+        private_key = self.backend.private_key()
+        raw = base64.b64decode(private_key)
+        self.assertEqual((len(private_key), len(raw)), (44, 32))
+        self.assertEqual(raw[0] & 7, 0)
+        self.assertEqual(raw[31] & 0xC0, 0x40)
+        self.assertEqual(len(self.backend.public_key(private_key + b"\n")), 44)
+        self.assertEqual(len(self.backend.preshared_key()), 44)
+        self.assertEqual(len({self.backend.preshared_key() for _ in range(100)}), 100)
+
+    def test_invalid_key(self):
+        """Тест: некорректный ключ отклоняется так же, как `wg pubkey`."""
+        for key in (b"invalid_key", base64.b64encode(b"x" * 31), b"!" * 44):
+            with self.assertRaises(ValueError):
+                self.backend.public_key(key)
+
+    @unittest.skipUnless(shutil.which("wg"), "wg is not installed")
+    def test_matches_wg_binary(self):
+        """Тест: открытые ключи совпадают с `wg pubkey`."""
+        for _ in range(5):
+            private_key = self.backend.private_key()
+            expected = subprocess.check_output(['wg', 'pubkey'], input=private_key).strip()
+            self.assertEqual(self.backend.public_key(private_key), expected)
+
+    def test_module_functions_use_backend(self):
+        """Тест: функции модуля генерируют ключи выбранным бэкендом."""
+        self.assertEqual(len(generate_public_key(generate_private_key())), 44)
+        self.assertEqual(len(generate_preshared_key()), 44)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+import os
+import sys
+import tempfile
+from pathlib import Path
+from unittest import mock
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import main
+from modules.wg_changeset import ChangeSetError
+from test.test_wg_config import SAMPLE_CONFIG
+
+PARAMS = {
+    "SERVER_PUB_KEY": "serverpub=",
+    "SERVER_PUB_IP": "203.0.113.1",
+    "SERVER_PORT": "51820",
+    "CLIENT_DNS_1": "1.1.1.1",
+    "CLIENT_DNS_2": "1.0.0.1",
+    "SERVER_WG_IPV4": "10.66.66.1",
+}
+
+
+class TestGenerateConfigs(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.path = self.dir / "wg0.conf"
+        self.path.write_text(SAMPLE_CONFIG)
+        self.artifacts = mock.Mock()
+        self.artifacts.put.side_effect = lambda username, kind, data: self.dir / f"{username}.{kind}"
+        keys = iter((b"priv%d=" % i, b"pub%d=" % i, b"psk%d=" % i) for i in range(10))
+        self.patches = [
+            mock.patch("settings.IP_ALLOCATOR_PATH", self.dir / "ip_allocator.json"),
+            mock.patch.object(main, "get_server_wg_nic", return_value="wg0"),
+            mock.patch.object(main, "take_keys", side_effect=lambda: next(keys)),
+            mock.patch.object(main, "generate_qr_code", side_effect=lambda text, output: output.write(b"PNG")),
+            mock.patch.object(main, "get_artifact_store", return_value=self.artifacts),
+            mock.patch.object(main, "request_sync"),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in reversed(self.patches):
+            patch.stop()
+        self.tmp.cleanup()
+
+    def test_failed_creation_stores_no_artifacts(self):
+        """Тест: если пользователи не добавлены в wg0.conf, их конфигурации и QR-коды не сохраняются."""
+        with self.assertRaises(ChangeSetError):
+            main.generate_configs([("dave", "N/A", "N/A"), ("alice", "N/A", "N/A")], PARAMS, self.path)
+        self.artifacts.put.assert_not_called()
+        self.assertEqual(self.path.read_text(), SAMPLE_CONFIG)
+
+    def test_artifacts_are_stored_after_the_peers(self):
+        """Тест: после записи клиентов в wg0.conf сохраняются их конфигурации, QR-коды и записи."""
+        store = mock.Mock()
+        with mock.patch.object(main, "get_user_store", return_value=store):
+            paths = main.generate_configs([("dave", "N/A", "N/A")], PARAMS, self.path)
+        self.assertEqual(paths["dave"], (str(self.dir / "dave.config"), str(self.dir / "dave.qr")))
+        self.assertIn("### Client dave", self.path.read_text())
+        self.assertEqual([call.args[1] for call in self.artifacts.put.call_args_list], ["config", "qr"])
+        record = store.put.call_args.args[1]
+        self.assertEqual(record["public_key"], "pub0=")
+        self.assertEqual(record["qr_code_path"], str(self.dir / "dave.qr"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+import os
+import sys
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from modules.main_registration_fields import (
+    USER_RECORD_SCHEMA_VERSION,
+    UserRecord,
+    create_user_record,
+    compact_user_record,
+    expand_user_record
+)
+
+
+class TestUserRecord(unittest.TestCase):
+
+    def setUp(self):
+        self.full = create_user_record(
+            username="alice",
+            address="10.66.66.2",
+            public_key="pub",
+            preshared_key="psk",
+            qr_code_path="/tmp/alice.png"
+        )
+
+    def test_compact_keeps_only_non_default_fields(self):
+        """Тест: в компактной форме хранятся только отличающиеся от умолчаний поля."""
+        compact = compact_user_record(self.full)
+        self.assertEqual(compact["schema_version"], USER_RECORD_SCHEMA_VERSION)
+        self.assertEqual(
+            set(compact) - {"schema_version"},
+            {"username", "user_id", "created_at", "expires_at", "allowed_ips",
+             "public_key", "preshared_key", "qr_code_path"}
+        )
+
+    def test_round_trip(self):
+        """Тест: развёрнутая запись совпадает с исходной, включая порядок полей."""
+        expanded = expand_user_record(compact_user_record(self.full))
+        self.assertEqual(expanded, self.full)
+        self.assertEqual(list(expanded), list(self.full))
+
+    def test_legacy_record_is_accepted(self):
+        """Тест: старые записи без версии схемы читаются как есть."""
+        legacy = dict(self.full, status="blocked", allowed_ips_custom="10.66.66.9")
+        record = UserRecord.from_dict(legacy)
+        self.assertEqual(record["status"], "blocked")
+        self.assertEqual(record["allowed_ips_custom"], "10.66.66.9")
+        self.assertEqual(record.get("total_spent"), "0.00 USD")
+
+    def test_extra_fields_preserved(self):
+        """Тест: поля вне схемы сохраняются."""
+        record = UserRecord.from_dict(dict(self.full, config_path="/tmp/alice.conf"))
+        self.assertEqual(compact_user_record(record)["config_path"], "/tmp/alice.conf")
+        self.assertEqual(record["config_path"], "/tmp/alice.conf")
+
+    def test_derived_fields_keep_value_when_source_changes(self):
+        """Тест: производные даты не меняются при продлении expires_at."""
+        record = UserRecord.from_dict(self.full)
+        old_expiry = record["expires_at"]
+        record["expires_at"] = "2099-01-01T00:00:00"
+        self.assertEqual(record["auto_delete_date"], old_expiry)
+        self.assertEqual(record["expires_at"], "2099-01-01T00:00:00")
+
+    def test_setting_default_value_clears_field(self):
+        """Тест: запись значения по умолчанию не увеличивает компактную форму."""
+        record = UserRecord.from_dict(self.full)
+        record["status"] = "blocked"
+        self.assertIn("status", record.to_compact())
+        record["status"] = "active"
+        self.assertNotIn("status", record.to_compact())
+
+    def test_default_lists_are_not_shared(self):
+        """Тест: списки по умолчанию не разделяются между записями."""
+        first = UserRecord.from_dict(self.full)
+        first["tags"].append("changed")
+        self.assertEqual(UserRecord.from_dict(self.full)["tags"], ["default-user"])
+
+    def test_no_instance_dict(self):
+        """Тест: запись использует __slots__ без __dict__."""
+        self.assertFalse(hasattr(UserRecord(), "__dict__"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+import unittest
+import os
+import stat
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from unittest import mock
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from modules.qr_cache import RENDER_PARAMS, QrCache, qr_key
+
+
+def fake_render(text, params):
+    return f"PNG:{params['box_size']}:{text}".encode()
+
+
+class TestQrCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_renders_each_config_once(self):
+        """Тест: QR-код одной конфигурации отрисовывается один раз."""
+        render = mock.Mock(side_effect=fake_render)
+        cache = QrCache(max_bytes=1024, render=render)
+        self.assertEqual(cache.get("config-a"), b"PNG:10:config-a")
+        self.assertEqual(cache.get("config-a"), b"PNG:10:config-a")
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual((cache.hits, cache.renders), (1, 1))
+
+    def test_key_depends_on_text_and_params(self):
+        """Тест: ключ — хэш текста конфигурации и параметров отрисовки."""
+        self.assertEqual(qr_key("a"), qr_key("a"))
+        self.assertNotEqual(qr_key("a"), qr_key("b"))
+        self.assertNotEqual(qr_key("a"), qr_key("a", dict(RENDER_PARAMS, box_size=6)))
+
+    def test_lru_bounded_by_bytes(self):
+        """Тест: память ограничена по байтам, вытесняются давно не использованные записи."""
+        render = mock.Mock(side_effect=lambda text, params: text.encode() * 10)
+        cache = QrCache(max_bytes=30, render=render)  # Room for three 10-byte images
+        for text in ("a", "b", "c"):
+            cache.get(text)
+        cache.get("a")          # "b" is now the least recently used
+        cache.get("d")          # Evicts "b"
+        self.assertEqual(cache.size, 30)
+        cache.get("a")
+        cache.get("c")
+        self.assertEqual(render.call_count, 4)
+        cache.get("b")
+        self.assertEqual(render.call_count, 5)
+        cache.get("x" * 4)      # Larger than the bound: returned, not kept
+        self.assertLessEqual(cache.size, 30)
+
+    def test_disk_tier_is_shared(self):
+        """Тест: дисковый уровень переиспользуется другим экземпляром (другим процессом)."""
+        QrCache(max_bytes=1024, directory=self.dir, render=fake_render).get("config-a")
+        render = mock.Mock(side_effect=fake_render)
+        other = QrCache(max_bytes=1024, directory=self.dir, render=render)
+        self.assertEqual(other.get("config-a"), b"PNG:10:config-a")
+        render.assert_not_called()
+        self.assertEqual(other.disk_hits, 1)
+        files = list(self.dir.glob("*/*.png"))
+        self.assertEqual(len(files), 1)
+        self.assertEqual(stat.S_IMODE(files[0].stat().st_mode), 0o600)
+
+    def test_disk_tier_bounded_by_bytes(self):
+        """Тест: дисковый уровень ограничен по байтам, удаляются давно не использованные файлы."""
+        render = mock.Mock(side_effect=lambda text, params: text.encode() * 10)
+        cache = QrCache(max_bytes=0, directory=self.dir, render=render, disk_max_bytes=40)
+        for age, text in enumerate("abcd"):
+            cache.get(text)
+            path = cache._disk_path(qr_key(text))
+            os.utime(path, (time.time() - 100 + age, time.time() - 100 + age))
+        os.utime(cache._disk_path(qr_key("a")))  # "a" used recently: "b" is the oldest
+        cache.get("e")                           # 50 bytes: trimmed down to 30
+        left = sorted(path.read_bytes()[:1].decode() for path in self.dir.glob("*/*.png"))
+        self.assertEqual(left, ["a", "d", "e"])
+        self.assertEqual(cache._disk_size, 30)
+
+    def test_remove_and_clear_drop_files(self):
+        """Тест: QR-код удалённого пользователя (с закрытым ключом) удаляется из памяти и с диска."""
+        cache = QrCache(max_bytes=1024, directory=self.dir, render=fake_render)
+        cache.get("config-a")
+        cache.get("config-b")
+        self.assertTrue(cache.remove("config-a"))
+        self.assertFalse(cache._disk_path(qr_key("config-a")).exists())
+        self.assertEqual(cache.size, len(b"PNG:10:config-b"))
+        self.assertFalse(cache.remove("config-a"))
+
+        self.assertEqual(cache.clear(disk=True), 1)
+        self.assertEqual(list(self.dir.glob("*/*.png")), [])
+        self.assertEqual(cache.size, 0)
+
+    def test_concurrent_requests_render_once(self):
+        """Тест: одновременные запросы одной конфигурации ждут одну отрисовку."""
+        def slow_render(text, params):
+            time.sleep(0.05)
+            return fake_render(text, params)
+
+        render = mock.Mock(side_effect=slow_render)
+        cache = QrCache(max_bytes=1024, render=render)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get("config-a"))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [b"PNG:10:config-a"] * 5)
+        self.assertEqual(render.call_count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+import unittest
+import os
+import sys
+import tempfile
+from pathlib import Path
+from unittest import mock
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from modules import wg_sync
+from modules.reconciler import build_plan, apply_plan
+from modules.user_store import JsonUserStore
+from modules.wg_config import WgConfig
+from test.test_wg_config import SAMPLE_CONFIG
+
+FAKE_WG = """#!/bin/sh
+# `wg show <nic> dump` prints $WG_DUMP, other calls are recorded in $WG_LOG
+if [ "$1" = "show" ]; then cat "$WG_DUMP"; exit 0; fi
+echo "$@" >> "$WG_LOG"
+"""
+
+KERNEL_DUMP = (
+    "serverkey=\tserverpub=\t51820\toff\n"
+    "alicekey=\talicepsk=\t(none)\tfd42:42:42::2/128,10.66.66.2/32\t0\t0\t0\toff\n"
+    "carolkey=\t(none)\t1.2.3.4:5555\t10.66.66.4/32\t1700000000\t100\t200\toff\n"
+    "strangerkey=\t(none)\t(none)\t10.66.66.50/32\t0\t0\t0\toff\n"
+)
+
+
+class TestReconciler(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.path = self.dir / "wg0.conf"
+        self.path.write_text(SAMPLE_CONFIG)
+        self.log = self.dir / "wg.log"
+        (self.dir / "dump").write_text(KERNEL_DUMP)
+        wg = self.dir / "wg"
+        wg.write_text(FAKE_WG)
+        wg.chmod(0o755)
+        env = {
+            "PATH": f"{self.dir}{os.pathsep}{os.environ.get('PATH', '')}",
+            "WG_LOG": str(self.log),
+            "WG_DUMP": str(self.dir / "dump"),
+        }
+        self.patches = [
+            mock.patch.dict(os.environ, env),
+            mock.patch.dict(wg_sync._applied, clear=True),
+            mock.patch("settings.RECONCILE_PAUSE", 0),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+        self.store = JsonUserStore(self.dir / "user_records.json")
+        self.store.put("alice", {"username": "alice", "status": "blocked", "public_key": "alicekey="})
+        self.store.put("bob", {"username": "bob", "status": "active"})
+        self.store.put("dave", {"username": "dave", "public_key": "davekey=",
+                                "preshared_key": "davepsk=", "allowed_ips": "10.66.66.5/32"})
+        self.store.put("erin", {"username": "erin"})
+
+    def tearDown(self):
+        for patch in reversed(self.patches):
+            patch.stop()
+        self.tmp.cleanup()
+
+    def test_only_conflicting_new_peer_is_skipped(self):
+        """Тест: клиент с занятым адресом пропускается, остальные новые клиенты добавляются."""
+        self.store.put("frank", {"username": "frank", "public_key": "frankkey=",
+                                 "preshared_key": "frankpsk=", "allowed_ips": "10.66.66.3/32"})
+        plan = build_plan(self.store, self.path, "wg0")
+        self.assertEqual([add["name"] for add in plan.changes.adds], ["dave"])
+        notes = "\n".join(plan.notes)
+        self.assertIn("new peer 'frank' skipped: address 10.66.66.3 of 'frank' is already used by 'bob'", notes)
+        self.assertNotIn("'dave' skipped", notes)
+
+    def test_plan_covers_config_and_kernel_drift(self):
+        """Тест: план блокирует/разблокирует по базе, добавляет клиентов и исправляет ядро."""
+        plan = build_plan(self.store, self.path, "wg0")
+        self.assertEqual([add["name"] for add in plan.changes.adds], ["dave"])
+        self.assertEqual(plan.changes.blocks, {"alice": True, "bob": False})
+        self.assertEqual(dict(plan.kernel), {
+            "alicekey=": None,
+            "strangerkey=": None,
+            "bobkey=": {"preshared_key": "bobpsk=", "allowed_ips": "10.66.66.3/32,fd42:42:42::3/128"},
+            "davekey=": {"preshared_key": "davepsk=", "allowed_ips": "10.66.66.5/32"},
+        })
+        self.assertEqual(len(plan), 7)
+        notes = "\n".join(plan.notes)
+        self.assertIn("'erin' has no peer", notes)
+        self.assertIn("'carol' in wg0.conf has no user record", notes)
+        self.assertIn("block 'alice'", plan.summary())
+
+        # Dry run: nothing is written
+        self.assertEqual(self.path.read_text(), SAMPLE_CONFIG)
+        self.assertFalse(self.log.exists())
+
+    def test_apply_plan(self):
+        """Тест: применение плана меняет wg0.conf и вызывает `wg set` только для расхождений."""
+        plan = build_plan(self.store, self.path, "wg0")
+        self.assertEqual(apply_plan(plan), 7)
+        config = WgConfig.parse(self.path.read_text())
+        self.assertTrue(config.peer_by_name("alice").blocked)
+        self.assertFalse(config.peer_by_name("bob").blocked)
+        self.assertEqual(config.peer_by_name("dave").public_key, "davekey=")
+
+        calls = self.log.read_text().splitlines()
+        self.assertEqual(len(calls), 1)
+        self.assertIn("peer alicekey= remove", calls[0])
+        self.assertIn("peer strangerkey= remove", calls[0])
+        self.assertNotIn("carolkey=", calls[0])
+        self.assertEqual(wg_sync._applied["wg0"], (None, plan.state))  # wg0.conf was written: read the kernel next time
+
+    def test_unreadable_interface_still_plans_config(self):
+        """Тест: если интерфейс недоступен, план для wg0.conf всё равно строится."""
+        (self.dir / "wg").write_text("#!/bin/sh\nexit 1\n")
+        plan = build_plan(self.store, self.path, "wg0")
+        self.assertIsNone(plan.kernel)
+        self.assertEqual(len(plan), 3)
+        self.assertIn("interface wg0 could not be read", "\n".join(plan.notes))
+
+
+if __name__ == "__main__":
+    unittest.main()
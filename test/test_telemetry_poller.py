@@ -0,0 +1,65 @@
+import unittest
+import os
+import sys
+import subprocess
+import threading
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from modules.telemetry_poller import TelemetryPoller
+from modules.wg_dump import parse_dump_line
+
+PEER_LINE = "alicekey=\t(none)\t1.2.3.4:5555\t10.66.66.2/32\t1700000000\t{rx}\t{tx}\toff"
+
+
+class TestTelemetryPoller(unittest.TestCase):
+
+    def setUp(self):
+        self.samples = 0
+        self.sampled = threading.Event()
+        self.fail = False
+
+    def reader(self, interface):
+        if self.fail:
+            raise subprocess.CalledProcessError(1, ["wg"])
+        self.samples += 1
+        self.sampled.set()
+        peer = parse_dump_line(PEER_LINE.format(rx=self.samples * 100, tx=self.samples * 10))
+        return None, {peer.public_key: peer}
+
+    def test_snapshot_before_first_sample(self):
+        """Тест: до первого опроса снимок пустой и не блокирует."""
+        poller = TelemetryPoller("wg0", interval=60, persist_interval=0, reader=self.reader)
+        self.assertEqual(len(poller.snapshot.peers), 0)
+        self.assertIsNone(poller.snapshot.age)
+        self.assertIn("Waiting", poller.snapshot.describe())
+
+    def test_poll_once_and_failure_keeps_previous_peers(self):
+        """Тест: ошибка опроса сохраняет прежние данные и запоминает ошибку."""
+        poller = TelemetryPoller("wg0", interval=60, persist_interval=0, reader=self.reader)
+        snapshot = poller.poll_once()
+        self.assertEqual(snapshot.peers["alicekey="].transfer_rx, 100)
+        self.assertLess(snapshot.age, 5)
+        self.fail = True
+        failed = poller.poll_once()
+        self.assertIs(failed.peers, snapshot.peers)
+        self.assertEqual(failed.sampled_at, snapshot.sampled_at)
+        self.assertIn("failed", failed.describe())
+        with self.assertRaises(TypeError):
+            failed.peers["bobkey="] = None  # Snapshots are read-only
+
+    def test_background_thread_samples_periodically(self):
+        """Тест: фоновый поток регулярно обновляет снимок."""
+        poller = TelemetryPoller("wg0", interval=0.01, persist_interval=0, reader=self.reader)
+        poller.start()
+        poller.start()  # Second call does not start another thread
+        try:
+            for _ in range(3):
+                self.sampled.clear()
+                self.assertTrue(self.sampled.wait(5))
+        finally:
+            poller.stop()
+        self.assertGreaterEqual(self.samples, 3)
+        self.assertLessEqual(len([t for t in threading.enumerate() if t.name == "wg-telemetry"]), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
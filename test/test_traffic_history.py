@@ -0,0 +1,118 @@
+import unittest
+import os
+import sys
+import tempfile
+from pathlib import Path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from modules.traffic_history import FLEET, TrafficHistory
+from modules.wg_dump import WgPeerStatus
+
+T0 = 1_700_000_000 - 1_700_000_000 % 3600  # Start of an hour
+TIERS = ((10, 6), (60, 10), (3600, 4))
+
+
+def peer(public_key, rx, tx):
+    return WgPeerStatus(public_key, None, None, [], 0, rx, tx, None)
+
+
+class TestTrafficHistory(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.history = TrafficHistory(self.dir, TIERS, max_open=2)
+
+    def tearDown(self):
+        self.history.close()
+        self.tmp.cleanup()
+
+    def record_every_10s(self, start, count, rx_step, tx_step=0, key="alice/+key="):
+        for i in range(count):
+            rx = (start + i) * rx_step
+            tx = (start + i) * tx_step
+            self.history.record({key: peer(key, rx, tx), "bob": peer("bob", 1000 * (start + i), 0)},
+                                T0 + (start + i) * 10)
+
+    def test_bytes_between_uses_cumulative_slots(self):
+        """Тест: трафик за интервал [since, until) — разность накопленных счётчиков."""
+        self.record_every_10s(0, 30, rx_step=100, tx_step=1)  # 5 minutes, 100 B per 10 s
+        key = "alice/+key="
+        self.assertEqual(self.history.bytes_between(key, T0, T0 + 291), (2900, 29))
+        # Recent range: 10-second precision
+        self.assertEqual(self.history.bytes_between(key, T0 + 240, T0 + 290), (500, 5))
+        # Older than the raw ring (60 s): minute precision
+        self.assertEqual(self.history.bytes_between(key, T0 + 60, T0 + 180), (1200, 12))
+        self.assertEqual(self.history.bytes_between("unknown", T0, T0 + 290), (0, 0))
+        self.assertTrue((self.dir / "alice_-key=.ts").exists())
+
+    def test_counter_reset_and_gaps(self):
+        """Тест: сброс счётчика ядра не даёт отрицательных значений, пропуски заполняются."""
+        key = "alice/+key="
+        self.history.record({key: peer(key, 5000, 0)}, T0)          # Baseline
+        self.history.record({key: peer(key, 6000, 0)}, T0 + 10)     # +1000
+        self.history.record({key: peer(key, 300, 0)}, T0 + 20)      # Reset: +300
+        self.history.record({key: peer(key, 500, 0)}, T0 + 7200)    # Two hours later: +200
+        self.assertEqual(self.history.bytes_between(key, T0, T0 + 7201), (1500, 0))
+        # The idle hour in between has no traffic
+        self.assertEqual(self.history.bytes_between(key, T0 + 3600, T0 + 7199), (0, 0))
+        self.assertEqual(self.history.bytes_between(key, T0, T0 + 3600), (1300, 0))
+
+    def test_fleet_series(self):
+        """Тест: суммарный трафик всех клиентов по минутам."""
+        self.record_every_10s(0, 19, rx_step=100)  # 3 minutes
+        series = self.history.fleet_series(60, T0, T0 + 180)
+        self.assertEqual([start for start, _, _ in series], [T0, T0 + 60, T0 + 120])
+        # alice 100 B and bob 1000 B per 10 s; the first sample is the baseline
+        self.assertEqual([rx for _, rx, _ in series], [5 * 1100, 6 * 1100, 6 * 1100])
+        self.assertEqual(self.history.bytes_between(FLEET, T0, T0 + 180), (17 * 1100, 0))
+        with self.assertRaises(ValueError):
+            self.history.fleet_series(30, T0)
+
+    def test_files_have_fixed_size(self):
+        """Тест: размер файла не растёт с числом записей."""
+        self.record_every_10s(0, 500, rx_step=10)
+        size = self.history.file_size()
+        self.assertEqual(size, 64 + (6 + 10 + 4) * 24)
+        for path in self.dir.glob("*.ts"):
+            self.assertEqual(path.stat().st_size, size)
+
+    def test_active_peers_stay_mapped(self):
+        """Тест: клиенты из последнего замера не вытесняются, неактивных открыто не больше max_open."""
+        peers = {f"key{i}=": peer(f"key{i}=", 0, 0) for i in range(5)}
+        self.history.record(peers, T0)
+        mapped = dict(self.history._open)
+        self.history.record(peers, T0 + 10)
+        self.assertEqual(len(self.history._open), 6)  # 5 peers and the fleet
+        for name, series in self.history._open.items():
+            self.assertIs(series, mapped[name])  # Not unmapped and mapped again
+
+        self.history.record({"key0=": peer("key0=", 0, 0)}, T0 + 20)
+        self.assertEqual(set(self.history._open) - {"key0=", FLEET}, {"key3=", "key4="})
+
+    def test_forget_and_clear(self):
+        """Тест: удаление истории одного клиента (удалён или сменил ключ) и всей истории."""
+        self.record_every_10s(0, 3, rx_step=100)
+        self.assertTrue(self.history.forget("alice/+key="))
+        self.assertFalse((self.dir / "alice_-key=.ts").exists())
+        self.assertEqual(self.history.bytes_between("alice/+key=", T0, T0 + 30), (0, 0))
+        self.assertFalse(self.history.forget("alice/+key="))
+        self.assertTrue((self.dir / "bob.ts").exists())
+
+        self.assertEqual(self.history.clear(), 2)  # bob and the fleet
+        self.assertEqual(list(self.dir.glob("*.ts")), [])
+        self.assertEqual(self.history._open, {})
+
+    def test_history_survives_reopen(self):
+        """Тест: история сохраняется в файлах и читается новым экземпляром."""
+        self.record_every_10s(0, 10, rx_step=100)
+        self.history.close()
+        reopened = TrafficHistory(self.dir, TIERS)
+        self.assertEqual(reopened.bytes_between("alice/+key=", T0, T0 + 91), (900, 0))
+        reopened.close()
+        changed = TrafficHistory(self.dir, ((10, 6),))  # Other layout: starts over
+        self.assertEqual(changed.bytes_between("alice/+key=", T0, T0 + 91), (0, 0))
+        changed.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import unittest
+import os
+import sys
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+from unittest import mock
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from modules.main_registration_fields import create_user_record
+from modules.traffic_updater import account_traffic, format_transfer, traffic_totals, update_user_telemetry
+from modules.user_store import JsonUserStore
+from modules.wg_dump import WgPeerStatus
+
+MARCH = datetime(2024, 3, 31, 23, 59, tzinfo=timezone.utc)
+APRIL = datetime(2024, 4, 1, 0, 1, tzinfo=timezone.utc)
+
+
+def peer(rx, tx):
+    return WgPeerStatus("pub", None, None, [], 0, rx, tx, None)
+
+
+class TestTrafficAccounting(unittest.TestCase):
+
+    def setUp(self):
+        self.record = create_user_record(
+            username="alice",
+            address="10.66.66.2",
+            public_key="pub",
+            preshared_key="psk",
+            qr_code_path="/tmp/alice.png"
+        )
+
+    def account(self, rx, tx, now=MARCH):
+        fields = account_traffic(self.record, peer(rx, tx), now)
+        self.record.update(fields)
+        return fields
+
+    def test_accumulates_integer_bytes(self):
+        """Тест: трафик накапливается в целых байтах относительно базовой линии."""
+        self.account(1000, 200)
+        self.account(1500, 300)
+        self.assertEqual((self.record["rx_bytes"], self.record["tx_bytes"]), (1500, 300))
+        self.assertEqual((self.record["rx_baseline"], self.record["tx_baseline"]), (1500, 300))
+        self.assertEqual(self.record["period_start"], "2024-03")
+        self.assertEqual(self.record["period_rx_bytes"], 1500)
+
+    def test_counter_reset_keeps_totals(self):
+        """Тест: сброс счётчиков ядра (перезапуск интерфейса) не теряет накопленный трафик."""
+        self.account(5000, 500)
+        self.account(700, 70)  # Interface restarted: 700 B are new
+        self.assertEqual((self.record["rx_bytes"], self.record["tx_bytes"]), (5700, 570))
+        self.assertEqual(self.record["rx_baseline"], 700)
+
+    def test_period_rollover(self):
+        """Тест: с началом нового месяца счётчики периода начинаются с нуля."""
+        self.account(1000, 100, MARCH)
+        self.account(1600, 150, APRIL)
+        self.assertEqual(self.record["rx_bytes"], 1600)
+        self.assertEqual(self.record["period_start"], "2024-04")
+        self.assertEqual((self.record["period_rx_bytes"], self.record["period_tx_bytes"]), (600, 50))
+
+    def test_unchanged_counters_produce_no_update(self):
+        """Тест: без нового трафика изменений нет."""
+        self.account(1000, 100)
+        self.assertEqual(self.account(1000, 100), {})
+
+    def test_totals_include_live_sample(self):
+        """Тест: отображаемые итоги включают ещё не сохранённый трафик из снимка."""
+        self.account(1000, 100)
+        totals = traffic_totals(self.record, peer(3048, 100), MARCH)
+        self.assertEqual(totals["rx_bytes"], 3048)
+        self.assertEqual(self.record["rx_bytes"], 1000)  # Nothing is written
+        self.assertEqual(format_transfer(totals["rx_bytes"], totals["tx_bytes"]),
+                         "2.98 KiB received, 100 B sent")
+
+
+class TestUserTelemetry(unittest.TestCase):
+
+    def test_one_read_of_records_for_traffic_and_handshakes(self):
+        """Тест: трафик и рукопожатия обновляются по одному чтению записей и индекса ключей."""
+        with tempfile.TemporaryDirectory() as tmp:
+            store = JsonUserStore(Path(tmp) / "user_records.json")
+            store.put("alice", {"username": "alice", "public_key": "pub"})
+            sample = WgPeerStatus("pub", None, None, [], 1_700_000_000, 1000, 2000, None)
+            with mock.patch("modules.traffic_updater.get_user_store", return_value=store), \
+                    mock.patch("modules.handshake_updater.get_user_store", return_value=store), \
+                    mock.patch.object(store, "all", wraps=store.all) as read_all, \
+                    mock.patch.object(store, "index_map", wraps=store.index_map) as index_map:
+                update_user_telemetry("wg0", peers={"pub": sample})
+            self.assertEqual(read_all.call_count, 1)
+            self.assertEqual(index_map.call_count, 1)
+            record = store.get("alice")
+            self.assertEqual((record["rx_bytes"], record["tx_bytes"]), (1000, 2000))
+            self.assertNotEqual(record.get("last_handshake", "Never"), "Never")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+from unittest.mock import patch
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from modules.user_cache import UserRecordsCache
+from modules.user_store import JsonUserStore, SqliteUserStore
+
+
+class TestUserRecordsCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.store = SqliteUserStore(self.dir / "user_records.sqlite3")
+        self.store.put("alice", {"username": "alice", "status": "active"})
+        self.cache = UserRecordsCache(store_getter=lambda: self.store)
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp.cleanup()
+
+    def test_repeated_reads_hit_cache(self):
+        """Тест: повторное чтение не обращается к базе."""
+        first = self.cache.snapshot()
+        with patch.object(self.store, "all", side_effect=AssertionError("reloaded")):
+            self.assertIs(self.cache.snapshot(), first)
+
+    def test_snapshot_is_read_only(self):
+        """Тест: снимок и записи доступны только для чтения."""
+        snapshot = self.cache.snapshot()
+        with self.assertRaises(TypeError):
+            snapshot["bob"] = {}
+        with self.assertRaises(TypeError):
+            snapshot["alice"]["status"] = "blocked"
+
+    def test_own_write_invalidates(self):
+        """Тест: запись через хранилище обновляет кэш, старый снимок не меняется."""
+        old = self.cache.snapshot()
+        self.store.update("alice", {"status": "blocked"})
+        new = self.cache.snapshot()
+        self.assertEqual(new["alice"]["status"], "blocked")
+        self.assertEqual(old["alice"]["status"], "active")
+
+    def test_external_change_detected_by_stat(self):
+        """Тест: изменение файла другим процессом обнаруживается по stat."""
+        path = self.dir / "user_records.json"
+        path.write_text(json.dumps({"alice": {"status": "active"}}))
+        store = JsonUserStore(path)
+        cache = UserRecordsCache(store_getter=lambda: store)
+        self.assertEqual(cache.snapshot()["alice"]["status"], "active")
+        path.write_text(json.dumps({"alice": {"status": "blocked"}, "bob": {}}))
+        self.assertEqual(cache.snapshot()["alice"]["status"], "blocked")
+
+    def test_explicit_invalidate(self):
+        """Тест: явная инвалидация приводит к перезагрузке."""
+        first = self.cache.snapshot()
+        self.cache.invalidate()
+        self.assertIsNot(self.cache.snapshot(), first)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+from unittest import mock
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from modules import user_cleanup
+from modules.user_cleanup import forget_user
+
+
+class TestForgetUser(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.log = Path(self.tmp.name) / "logs" / "deleted_users.jsonl"
+        self.patches = [
+            mock.patch.object(user_cleanup.settings, "DELETED_USERS_LOG", self.log),
+            mock.patch.object(user_cleanup, "forget_keys"),
+            mock.patch.object(user_cleanup, "get_artifact_store"),
+            mock.patch.object(user_cleanup, "release_ips"),
+        ]
+        for patch in self.patches:
+            patch.start()
+        user_cleanup.get_artifact_store.return_value.remove.return_value = []
+
+    def tearDown(self):
+        for patch in reversed(self.patches):
+            patch.stop()
+        self.tmp.cleanup()
+
+    def test_deletion_is_logged_without_secrets(self):
+        """Тест: время удаления сохраняется в журнале удалённых пользователей, без ключей."""
+        for username in ("alice", "bob"):
+            record = {
+                "public_key": f"{username}key=",
+                "preshared_key": f"{username}psk=",
+                "allowed_ips": "10.66.66.2/32",
+                "email": "N/A",
+            }
+            forget_user(username, record)
+            self.assertIn("removed_at", record)
+
+        entries = [json.loads(line) for line in self.log.read_text().splitlines()]
+        self.assertEqual([entry["username"] for entry in entries], ["alice", "bob"])
+        self.assertEqual(entries[1]["removed_at"], record["removed_at"])
+        self.assertEqual(entries[0]["public_key"], "alicekey=")
+        self.assertNotIn("preshared_key", entries[0])
+        user_cleanup.release_ips.assert_called_with(["10.66.66.2/32"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,312 @@
+import unittest
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+from unittest.mock import patch
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from modules import user_store
+from modules.user_store import (
+    JsonUserStore,
+    JournalJsonUserStore,
+    SqliteUserStore,
+    UserStore,
+    migrate_json_to_sqlite,
+    get_user_store
+)
+from modules.main_registration_fields import compact_user_record
+
+
+def stored(record):
+    """Сравнимая форма записи: только поля, отличные от значений по умолчанию."""
+    return compact_user_record(record) if record is not None else None
+
+
+class UserStoreContract:
+    """Общие проверки для всех бэкендов хранилища пользователей."""
+
+    def make_store(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.store = self.make_store()
+
+    def tearDown(self):
+        if hasattr(self.store, "close"):
+            self.store.close()
+        self.tmp.cleanup()
+
+    def test_put_and_get(self):
+        """Тест: запись и чтение пользователя."""
+        self.store.put("alice", {"username": "alice", "status": "active"})
+        self.assertEqual(stored(self.store.get("alice")), stored({"username": "alice", "status": "active"}))
+        self.assertEqual(self.store.get("alice")["group"], "guest")  # Значение по умолчанию
+        self.assertIsNone(self.store.get("bob"))
+        self.assertIn("alice", self.store)
+        self.assertNotIn("bob", self.store)
+
+    def test_update_merges_fields(self):
+        """Тест: обновление отдельных полей записи."""
+        self.store.put("alice", {"username": "alice", "status": "active", "email": "a@b.c"})
+        self.assertTrue(self.store.update("alice", {"status": "blocked"}))
+        self.assertEqual(stored(self.store.get("alice")), stored({"username": "alice", "status": "blocked", "email": "a@b.c"}))
+        self.assertFalse(self.store.update("bob", {"status": "blocked"}))
+
+    def test_delete(self):
+        """Тест: удаление пользователя возвращает удалённую запись."""
+        self.store.put("alice", {"username": "alice"})
+        self.assertEqual(stored(self.store.delete("alice")), stored({"username": "alice"}))
+        self.assertIsNone(self.store.delete("alice"))
+        self.assertEqual(len(self.store), 0)
+
+    def test_all_keeps_insertion_order(self):
+        """Тест: порядок пользователей сохраняется при обновлении."""
+        for name in ["c", "a", "b"]:
+            self.store.put(name, {"username": name})
+        self.store.put("c", {"username": "c", "status": "blocked"})
+        self.assertEqual(list(self.store.all()), ["c", "a", "b"])
+        self.assertEqual(self.store.usernames(), ["c", "a", "b"])
+
+    def test_replace_all_and_clear(self):
+        """Тест: полная замена и очистка базы."""
+        self.store.put("alice", {"username": "alice"})
+        self.store.replace_all({"bob": {"username": "bob"}})
+        self.assertEqual(list(self.store.all()), ["bob"])
+        self.store.clear()
+        self.assertEqual(self.store.count(), 0)
+
+    def test_batch_commits_on_exit(self):
+        """Тест: пакет обновлений записывается при выходе из блока."""
+        self.store.put("alice", {"username": "alice"})
+        self.store.put("bob", {"username": "bob"})
+        with self.store.batch() as batch:
+            batch.update("alice", {"transfer": "1 MiB"})
+            batch.update("bob", {"last_handshake": "Never"})
+            batch.update("alice", {"last_handshake": "2025-01-01 00:00:00 UTC"})
+            batch.update("ghost", {"status": "blocked"})
+            self.assertNotEqual(self.store.get("alice")["transfer"], "1 MiB")  # Ещё не записано
+        self.assertEqual(batch.updated, 2)
+        self.assertEqual(self.store.get("alice")["transfer"], "1 MiB")
+        self.assertEqual(self.store.get("alice")["last_handshake"], "2025-01-01 00:00:00 UTC")
+        self.assertEqual(self.store.get("bob")["last_handshake"], "Never")
+        self.assertNotIn("ghost", self.store)
+
+    def test_batch_discarded_on_error(self):
+        """Тест: при исключении в блоке пакет не записывается."""
+        self.store.put("alice", {"username": "alice", "status": "active"})
+        with self.assertRaises(RuntimeError):
+            with self.store.batch() as batch:
+                batch.update("alice", {"status": "blocked"})
+                raise RuntimeError("producer failed")
+        self.assertEqual(self.store.get("alice")["status"], "active")
+
+    def test_iter_users_projects_fields(self):
+        """Тест: потоковое чтение возвращает только запрошенные поля."""
+        self.store.put("alice", {"username": "alice", "telegram_id": "42"})
+        self.store.put("bob", {"username": "bob"})
+        users = list(self.store.iter_users(fields=["telegram_id", "status", "peer"]))
+        self.assertEqual(users, [
+            ("alice", {"telegram_id": "42", "status": "active"}),
+            ("bob", {"telegram_id": "N/A", "status": "active"}),
+        ])
+        self.assertEqual(dict(self.store.iter_users())["bob"], self.store.get("bob"))
+
+    def test_find_by_secondary_indexes(self):
+        """Тест: поиск пользователя по имени, ключу, IP и user_id."""
+        self.store.put("Alice", {"username": "Alice", "public_key": "pubA", "user_id": "id-a",
+                                 "allowed_ips": "10.66.66.2/32"})
+        self.store.put("bob", {"username": "bob", "public_key": "pubB", "allowed_ips": "10.66.66.3/32"})
+        self.assertEqual(self.store.find("username", "ALICE"), "Alice")
+        self.assertEqual(self.store.find("public_key", "pubB"), "bob")
+        self.assertEqual(self.store.find("allowed_ips", "10.66.66.2"), "Alice")
+        self.assertEqual(self.store.find("allowed_ips", "10.66.66.3/32"), "bob")
+        self.assertEqual(self.store.find("user_id", "id-a"), "Alice")
+        self.assertIsNone(self.store.find("public_key", "missing"))
+        self.assertEqual(self.store.index_map("public_key"), {"pubA": "Alice", "pubB": "bob"})
+
+    def test_indexes_follow_writes(self):
+        """Тест: индексы обновляются при изменении и удалении пользователя."""
+        self.store.put("alice", {"username": "alice", "public_key": "old"})
+        self.store.update("alice", {"public_key": "new"})
+        self.assertIsNone(self.store.find("public_key", "old"))
+        self.assertEqual(self.store.find("public_key", "new"), "alice")
+        self.store.delete("alice")
+        self.assertIsNone(self.store.find("public_key", "new"))
+        self.assertIsNone(self.store.find("username", "alice"))
+        self.store.replace_all({"bob": {"username": "bob", "public_key": "pubB"}})
+        self.assertEqual(self.store.find("public_key", "pubB"), "bob")
+
+
+class TestJsonUserStore(UserStoreContract, unittest.TestCase):
+
+    def make_store(self):
+        return JsonUserStore(self.dir / "user_records.json")
+
+    def test_batch_is_one_file_write(self):
+        """Тест: пакет обновлений перезаписывает файл один раз."""
+        self.store.put("alice", {"username": "alice"})
+        self.store.put("bob", {"username": "bob"})
+        with patch("modules.user_store.write_json", wraps=user_store.write_json) as write:
+            with self.store.batch() as batch:
+                batch.update("alice", {"status": "blocked"})
+                batch.update("bob", {"status": "blocked"})
+        self.assertEqual(write.call_count, 1)
+
+
+    def test_binary_snapshot_used_for_loading(self):
+        """Тест: при актуальном бинарном снимке JSON не разбирается."""
+        store = JsonUserStore(self.dir / "users.json", binary_snapshot=True)
+        store.put("alice", {"username": "alice", "status": "blocked"})
+        self.assertTrue((self.dir / "users.snapshot").exists())
+        with patch("modules.user_store.json.loads", side_effect=AssertionError("JSON parsed")):
+            self.assertEqual(JsonUserStore(self.dir / "users.json", binary_snapshot=True).get("alice")["status"], "blocked")
+
+    def test_stale_binary_snapshot_ignored(self):
+        """Тест: снимок старше изменённого вручную JSON не используется."""
+        store = JsonUserStore(self.dir / "users.json", binary_snapshot=True)
+        store.put("alice", {"username": "alice"})
+        (self.dir / "users.json").write_text(json.dumps({"bob": {"username": "bob"}}))
+        reopened = JsonUserStore(self.dir / "users.json", binary_snapshot=True)
+        self.assertEqual(reopened.usernames(), ["bob"])
+        self.assertEqual(reopened.usernames(), ["bob"])  # Снимок пересоздан из JSON
+
+
+class TestJournalJsonUserStore(UserStoreContract, unittest.TestCase):
+
+    def make_store(self):
+        return JournalJsonUserStore(self.dir / "user_records.json", compact_threshold=10 ** 6)
+
+    def test_update_appends_patch(self):
+        """Тест: обновление дописывает патч в журнал, не трогая снимок."""
+        self.store.replace_all({"alice": {"username": "alice", "status": "active"}})
+        snapshot = (self.dir / "user_records.json").read_text()
+        self.store.update("alice", {"status": "blocked"})
+        self.assertEqual((self.dir / "user_records.json").read_text(), snapshot)
+        lines = (self.dir / "user_records.json.journal").read_text().splitlines()
+        self.assertEqual(json.loads(lines[-1]), {"op": "update", "user": "alice", "data": {"status": "blocked"}})
+
+    def test_replay_after_restart(self):
+        """Тест: новое хранилище восстанавливает состояние из журнала."""
+        self.store.put("alice", {"username": "alice", "status": "active"})
+        self.store.update("alice", {"status": "blocked"})
+        self.store.put("bob", {"username": "bob"})
+        self.store.delete("bob")
+        with open(self.dir / "user_records.json.journal", "a") as f:
+            f.write('{"op": "put", "user": "torn"')  # Запись, оборванная сбоем
+        reopened = JournalJsonUserStore(self.dir / "user_records.json")
+        self.assertEqual(list(reopened.all()), ["alice"])
+        self.assertEqual(reopened.get("alice")["status"], "blocked")
+
+    def test_sees_changes_of_other_writers(self):
+        """Тест: изменения другого процесса подхватываются из журнала."""
+        self.store.put("alice", {"username": "alice"})
+        other = JournalJsonUserStore(self.dir / "user_records.json")
+        other.update("alice", {"status": "blocked"})
+        self.assertEqual(self.store.get("alice")["status"], "blocked")
+
+    def test_batch_is_one_journal_write(self):
+        """Тест: пакет обновлений дописывается в журнал одной операцией."""
+        self.store.put("alice", {"username": "alice"})
+        self.store.put("bob", {"username": "bob"})
+        with patch.object(self.store, "_append", wraps=self.store._append) as append:
+            with self.store.batch() as batch:
+                batch.update("alice", {"status": "blocked"})
+                batch.update("bob", {"status": "blocked"})
+        self.assertEqual(append.call_count, 1)
+        self.assertEqual(self.store.get("bob")["status"], "blocked")
+
+    def test_compaction(self):
+        """Тест: сжатие переносит журнал в снимок и очищает журнал."""
+        self.store.compact_threshold = 1
+        self.store.put("alice", {"username": "alice"})
+        self.store._compactor.join()
+        self.assertEqual((self.dir / "user_records.json.journal").stat().st_size, 0)
+        self.assertEqual(json.loads((self.dir / "user_records.json").read_text()), {"alice": stored({"username": "alice"})})
+        self.assertEqual(self.store.get("alice")["username"], "alice")
+
+    def test_returned_records_are_copies(self):
+        """Тест: изменение возвращённой записи не меняет хранилище."""
+        self.store.put("alice", {"username": "alice", "tags": []})
+        self.store.get("alice")["tags"].append("changed")
+        self.assertEqual(self.store.get("alice")["tags"], [])
+
+
+class TestSqliteUserStore(UserStoreContract, unittest.TestCase):
+
+    def make_store(self):
+        return SqliteUserStore(self.dir / "user_records.sqlite3")
+
+    def test_wal_mode(self):
+        """Тест: база данных работает в режиме WAL."""
+        mode = self.store._connect().execute("PRAGMA journal_mode").fetchone()[0]
+        self.assertEqual(mode, "wal")
+
+    def test_write_while_iterating(self):
+        """Тест: запись в базу во время потокового чтения."""
+        for name in ["a", "b", "c"]:
+            self.store.put(name, {"username": name})
+        for username, record in self.store.iter_users(fields=["status"]):
+            self.store.update(username, {"status": "blocked"})
+        self.assertEqual({r["status"] for r in self.store.all().values()}, {"blocked"})
+
+    def test_existing_database_is_indexed_on_open(self):
+        """Тест: база без таблицы индексов индексируется при открытии."""
+        self.store.put("alice", {"username": "alice", "public_key": "pubA"})
+        self.store._connect().execute("DROP TABLE user_index")
+        self.store.close()
+        reopened = SqliteUserStore(self.dir / "user_records.sqlite3")
+        self.assertEqual(reopened.find("public_key", "pubA"), "alice")
+        reopened.close()
+
+
+class TestUserStoreInterface(unittest.TestCase):
+
+    def test_incomplete_backend_cannot_be_created(self):
+        """Тест: бэкенд без всех методов интерфейса не создаётся."""
+        class PartialStore(UserStore):
+            def get(self, username):
+                return None
+
+        with self.assertRaises(TypeError):
+            PartialStore()
+
+
+class TestMigration(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.json_path = self.dir / "user_records.json"
+        self.sqlite_path = self.dir / "user_records.sqlite3"
+        self.json_path.write_text(json.dumps({
+            "alice": {"username": "alice", "status": "active"},
+            "bob": {"username": "bob", "status": "blocked"},
+        }))
+
+    def tearDown(self):
+        user_store._stores.clear()
+        self.tmp.cleanup()
+
+    def test_migrate_json_to_sqlite(self):
+        """Тест: перенос пользователей из JSON в SQLite."""
+        self.assertEqual(migrate_json_to_sqlite(self.json_path, self.sqlite_path), 2)
+        store = SqliteUserStore(self.sqlite_path)
+        self.assertEqual(stored(store.get("bob")), stored({"username": "bob", "status": "blocked"}))
+        store.close()
+
+    def test_get_user_store_migrates_once(self):
+        """Тест: при первом открытии SQLite-база создаётся из JSON."""
+        user_store._stores.clear()
+        with patch("modules.user_store.settings.USER_DB_PATH", self.json_path), \
+             patch("modules.user_store.settings.USER_DB_SQLITE_PATH", self.sqlite_path):
+            store = get_user_store("sqlite")
+            self.assertEqual(store.usernames(), ["alice", "bob"])
+            self.assertIs(get_user_store("sqlite"), store)
+        store.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+import unittest
+import os
+import sys
+import subprocess
+import tempfile
+from pathlib import Path
+from unittest import mock
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from modules.wg_changeset import ChangeSet, ChangeSetError
+from modules.wg_config import WgConfig, load_wg_config
+from test.test_wg_config import SAMPLE_CONFIG
+
+
+class TestChangeSet(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "wg0.conf"
+        self.path.write_text(SAMPLE_CONFIG)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_apply_many_operations(self):
+        """Тест: добавление, удаление, блокировка и смена ключей за одну запись."""
+        changes = ChangeSet(self.path)
+        for i in range(5, 55):
+            changes.add_peer(f"user{i}", f"key{i}=", f"psk{i}=", f"10.66.66.{i}/32")
+        changes.remove_peer("alice")
+        changes.unblock("bob")
+        changes.set_keys("carol", public_key="newcarolkey=", preshared_key="newcarolpsk=")
+        changes.block("carol")
+        with mock.patch("modules.wg_changeset.forget_keys") as forget_keys:
+            self.assertEqual(changes.apply(sync=False), 4)
+        forget_keys.assert_called_once_with("carol", "carolkey=")  # Traffic history of the old key
+        self.assertEqual(len(changes), 0)
+
+        config = WgConfig.parse(self.path.read_text())
+        self.assertIsNone(config.peer_by_name("alice"))
+        self.assertFalse(config.peer_by_name("bob").blocked)
+        carol = config.peer_by_name("carol")
+        self.assertTrue(carol.blocked)
+        self.assertEqual(carol.public_key, "newcarolkey=")
+        self.assertEqual(carol.preshared_key, "newcarolpsk=")
+        self.assertEqual(config.peer_by_ip("10.66.66.54").name, "user54")
+        self.assertEqual(len(config.peers), 52)
+        self.assertEqual(load_wg_config(self.path).names(), config.names())
+
+    def test_invalid_change_set_changes_nothing(self):
+        """Тест: при конфликте адресов, ключей или имён файл не изменяется."""
+        changes = ChangeSet(self.path)
+        changes.add_peer("dave", "davekey=", "psk=", "10.66.66.2/32")    # alice's address
+        changes.add_peer("erin", "alicekey=", "psk=", "10.66.66.20/32")  # alice's key
+        changes.add_peer("Carol", "carol2=", "psk=", "10.66.66.21/32")   # existing name
+        changes.block("mallory")                                         # unknown client
+        with self.assertRaises(ChangeSetError) as context:
+            changes.apply(sync=False)
+        self.assertEqual(len(context.exception.problems), 4)
+        self.assertEqual(self.path.read_text(), SAMPLE_CONFIG)
+
+    def test_removed_peer_frees_name_and_address(self):
+        """Тест: имя и адрес удаляемого клиента можно использовать в том же наборе."""
+        changes = ChangeSet(self.path)
+        changes.remove_peer("alice")
+        changes.add_peer("alice", "alicekey2=", "psk=", "10.66.66.2/32")
+        changes.apply(sync=False)
+        self.assertEqual(load_wg_config(self.path).peer_by_name("alice").public_key, "alicekey2=")
+
+    def test_addresses_of_queued_peers(self):
+        """Тест: адреса добавляемых клиентов доступны для выбора следующего IP."""
+        changes = ChangeSet(self.path)
+        changes.add_peer("dave", "davekey=", "psk=", "10.66.66.5/32,fd42:42:42::5/128")
+        self.assertEqual(changes.addresses(), {"10.66.66.5", "fd42:42:42::5"})
+
+    def test_waiting_apply_reports_sync_error(self):
+        """Тест: при ожидании синхронизации её ошибка передаётся вызывающему (блокировка не считается успешной)."""
+        from gradio_admin.functions import block_user
+
+        error = subprocess.CalledProcessError(1, ["wg", "set"])
+        with mock.patch("modules.wg_changeset.request_sync", side_effect=error) as request_sync:
+            with self.assertRaises(subprocess.CalledProcessError):
+                ChangeSet(self.path, "wg0").block("alice").apply(wait=True)
+            request_sync.assert_called_once_with("wg0", wait=True)
+            with mock.patch.object(block_user, "SERVER_CONFIG_FILE", self.path):
+                self.assertFalse(block_user.update_wireguard_config("alice", block=False))
+        self.assertFalse(load_wg_config(self.path).peer_by_name("alice").blocked)
+
+    def test_failed_block_keeps_user_status(self):
+        """Тест: если конфигурацию изменить не удалось, статус в базе не меняется."""
+        from gradio_admin.functions import block_user
+
+        store = mock.MagicMock()
+        store.__contains__.return_value = True
+        with mock.patch.object(block_user, "get_user_store", return_value=store), \
+                mock.patch.object(block_user, "SERVER_CONFIG_FILE", self.path):
+            success, message = block_user.block_user("nobody")  # No peer in wg0.conf: ChangeSetError
+        self.assertFalse(success)
+        self.assertIn("Failed to block VPN access", message)
+        store.update.assert_not_called()
+        store.update_many.assert_not_called()
+
+        # Written but not synced: the database follows wg0.conf, access is not restored from it
+        error = subprocess.CalledProcessError(1, ["wg", "set"])
+        with mock.patch.object(block_user, "get_user_store", return_value=store), \
+                mock.patch.object(block_user, "SERVER_CONFIG_FILE", self.path), \
+                mock.patch("modules.wg_changeset.request_sync", side_effect=error):
+            success, message = block_user.block_user("carol")
+        self.assertFalse(success)
+        store.update_many.assert_called_once_with({"carol": {"status": "blocked"}})
+
+
+if __name__ == "__main__":
+    unittest.main()
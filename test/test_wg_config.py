@@ -0,0 +1,173 @@
+import unittest
+import os
+import sys
+import tempfile
+from pathlib import Path
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from modules.wg_config import WgConfig, load_wg_config, add_peer, remove_peer, set_peer_blocked
+
+SAMPLE_CONFIG = """[Interface]
+Address = 10.66.66.1/24,fd42:42:42::1/64
+ListenPort = 51820
+PrivateKey = serverkey=
+
+### Client alice
+[Peer]
+PublicKey = alicekey=
+PresharedKey = alicepsk=
+AllowedIPs = 10.66.66.2/32,fd42:42:42::2/128
+
+### Client bob
+# [Peer]
+# PublicKey = bobkey=
+# PresharedKey = bobpsk=
+# AllowedIPs = 10.66.66.3/32,fd42:42:42::3/128
+
+### Client carol
+[Peer]
+PublicKey = carolkey=
+# AllowedIPs = 10.66.66.9/32
+AllowedIPs = 10.66.66.4/32
+"""
+
+
+class TestWgConfig(unittest.TestCase):
+
+    def setUp(self):
+        self.config = WgConfig.parse(SAMPLE_CONFIG)
+
+    def test_interface_and_peers(self):
+        """Тест: секция [Interface] и все клиенты в порядке файла."""
+        self.assertEqual(self.config.interface.get("ListenPort"), "51820")
+        self.assertEqual(self.config.names(), ["alice", "bob", "carol"])
+        self.assertEqual([str(n) for n in self.config.interface_networks()],
+                         ["10.66.66.0/24", "fd42:42:42::/64"])
+
+    def test_blocked_peer(self):
+        """Тест: закомментированный [Peer] разбирается и помечается как заблокированный."""
+        bob = self.config.peer_by_name("bob")
+        self.assertTrue(bob.blocked)
+        self.assertEqual(bob.public_key, "bobkey=")
+        self.assertFalse(self.config.peer_by_name("alice").blocked)
+
+    def test_lookups(self):
+        """Тест: поиск по имени, публичному ключу и AllowedIPs."""
+        alice = self.config.peer_by_name("ALICE")
+        self.assertIs(self.config.peer_by_public_key("alicekey="), alice)
+        self.assertIs(self.config.peer_by_ip("fd42:42:42::2/128"), alice)
+        self.assertIs(self.config.peer_by_ip("10.66.66.3"), self.config.peer_by_name("bob"))
+        self.assertIsNone(self.config.peer_by_name("dave"))
+
+    def test_comments_inside_active_peer_are_ignored(self):
+        """Тест: комментарий внутри активного блока не считается параметром."""
+        self.assertEqual(self.config.peer_by_name("carol").allowed_ips, ["10.66.66.4/32"])
+        self.assertNotIn("10.66.66.9", self.config.used_addresses())
+
+    def test_block_line_ranges(self):
+        """Тест: диапазон строк блока начинается с комментария ### Client."""
+        lines = self.config.lines
+        start, end = self.config.line_range(self.config.peer_by_name("alice"))
+        self.assertEqual(lines[start], "### Client alice\n")
+        self.assertEqual(lines[end], "### Client bob\n")
+        removed = "".join(lines[:start] + lines[end:])
+        self.assertEqual(WgConfig.parse(removed).names(), ["bob", "carol"])
+
+
+class TestLoadWgConfig(unittest.TestCase):
+
+    def test_cache_follows_file_changes(self):
+        """Тест: повторная загрузка берётся из кэша, изменение файла вызывает повторный разбор."""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "wg0.conf"
+            path.write_text(SAMPLE_CONFIG)
+            first = load_wg_config(path)
+            self.assertIs(load_wg_config(path), first)
+
+            path.write_text(SAMPLE_CONFIG + "\n### Client dave\n[Peer]\nPublicKey = davekey=\n")
+            second = load_wg_config(path)
+            self.assertIsNot(second, first)
+            self.assertIsNotNone(second.peer_by_name("dave"))
+
+    def test_missing_file(self):
+        """Тест: отсутствующий файл вызывает FileNotFoundError."""
+        with tempfile.TemporaryDirectory() as tmp:
+            with self.assertRaises(FileNotFoundError):
+                load_wg_config(Path(tmp) / "missing.conf")
+
+
+class TestWgConfigEditing(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / "wg0.conf"
+        self.path.write_text(SAMPLE_CONFIG)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def assert_cache_matches_file(self):
+        cached = load_wg_config(self.path)
+        parsed = WgConfig.parse(self.path.read_text())
+        self.assertEqual(cached.lines, parsed.lines)
+        self.assertEqual(cached.spans, parsed.spans)
+        self.assertEqual(cached.size, parsed.size)
+        self.assertEqual([(p.name, p.blocked, p.options) for p in cached.peers],
+                         [(p.name, p.blocked, p.options) for p in parsed.peers])
+        for position, peer in enumerate(parsed.peers):
+            self.assertEqual(cached.peer_by_name(peer.name).options, peer.options)
+            self.assertEqual(cached.position(cached.peer_by_name(peer.name)), position)
+
+    def test_add_peer(self):
+        """Тест: новый клиент дописывается в конец файла."""
+        add_peer(self.path, "dave", "davekey=", "davepsk=", "10.66.66.5/32")
+        self.assertTrue(self.path.read_text().endswith(
+            "\n### Client dave\n[Peer]\nPublicKey = davekey=\nPresharedKey = davepsk=\nAllowedIPs = 10.66.66.5/32\n"))
+        self.assertEqual(load_wg_config(self.path).peer_by_ip("10.66.66.5").name, "dave")
+        self.assert_cache_matches_file()
+
+    def test_remove_peer(self):
+        """Тест: удаляется только блок клиента вместе с комментарием ### Client."""
+        removed = remove_peer(self.path, name="alice")
+        self.assertEqual(removed.public_key, "alicekey=")
+        text = self.path.read_text()
+        self.assertNotIn("alice", text)
+        self.assertIn("### Client bob\n# [Peer]", text)
+        self.assertIsNone(remove_peer(self.path, name="alice"))
+        self.assert_cache_matches_file()
+
+    def test_block_and_unblock(self):
+        """Тест: блокировка комментирует секцию [Peer], разблокировка восстанавливает файл."""
+        self.assertTrue(set_peer_blocked(self.path, "alice", True))
+        self.assertIn("### Client alice\n# [Peer]\n# PublicKey = alicekey=\n", self.path.read_text())
+        self.assertTrue(load_wg_config(self.path).peer_by_name("alice").blocked)
+        self.assert_cache_matches_file()
+
+        self.assertTrue(set_peer_blocked(self.path, "alice", False))
+        self.assertTrue(set_peer_blocked(self.path, "bob", False))
+        self.assertTrue(set_peer_blocked(self.path, "bob", True))
+        self.assertEqual(self.path.read_text(), SAMPLE_CONFIG)
+        self.assertFalse(set_peer_blocked(self.path, "dave", True))
+        self.assert_cache_matches_file()
+
+    def test_edits_keep_non_ascii_offsets(self):
+        """Тест: смещения в байтах верны для имён не в ASCII."""
+        add_peer(self.path, "мария", "mkey=", "mpsk=", "10.66.66.6/32")
+        add_peer(self.path, "eve", "evekey=", "evepsk=", "10.66.66.7/32")
+        remove_peer(self.path, name="мария")
+        set_peer_blocked(self.path, "eve", True)
+        self.assertEqual(load_wg_config(self.path).size, self.path.stat().st_size)
+        self.assert_cache_matches_file()
+
+    def test_many_edits_keep_positions(self):
+        """Тест: после серии правок позиции и диапазоны клиентов совпадают с новым разбором."""
+        for number in range(40):
+            add_peer(self.path, f"user{number}", f"key{number}=", "psk=", f"10.66.67.{number}/32")
+        for number in range(0, 40, 3):
+            remove_peer(self.path, name=f"user{number}")
+        for number in range(1, 40, 3):
+            set_peer_blocked(self.path, f"user{number}", True)
+        self.assert_cache_matches_file()
+
+
+if __name__ == "__main__":
+    unittest.main()
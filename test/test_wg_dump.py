@@ -0,0 +1,78 @@
+import unittest
+import os
+import sys
+import subprocess
+import tempfile
+from pathlib import Path
+from unittest import mock
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from modules.wg_dump import (
+    WgInterfaceStatus,
+    format_bytes,
+    iter_wg_dump,
+    parse_dump_line,
+    read_wg_dump
+)
+
+DUMP = (
+    "privkey=\tserverpub=\t51820\toff\n"
+    "alicekey=\talicepsk=\t[2001:db8::7]:40123\t10.66.66.2/32,fd42:42:42::2/128\t1700000000\t5000\t123456789\t25\n"
+    "bobkey=\t(none)\t(none)\t(none)\t0\t0\t0\toff\n"
+)
+
+
+class TestWgDump(unittest.TestCase):
+
+    def test_parse_peer_line(self):
+        """Тест: счётчики и рукопожатие — целые числа, IPv6-адрес точки подключения разбирается целиком."""
+        peer = parse_dump_line(DUMP.splitlines()[1])
+        self.assertEqual(peer.public_key, "alicekey=")
+        self.assertEqual(peer.preshared_key, "alicepsk=")
+        self.assertEqual(peer.endpoint, "[2001:db8::7]:40123")
+        self.assertEqual(peer.endpoint_host, "2001:db8::7")
+        self.assertEqual(peer.endpoint_port, 40123)
+        self.assertEqual(peer.allowed_ips, ["10.66.66.2/32", "fd42:42:42::2/128"])
+        self.assertEqual((peer.latest_handshake, peer.transfer_rx, peer.transfer_tx), (1700000000, 5000, 123456789))
+        self.assertEqual(peer.persistent_keepalive, 25)
+
+    def test_parse_empty_peer_and_interface(self):
+        """Тест: значения (none) и off превращаются в None."""
+        peer = parse_dump_line(DUMP.splitlines()[2])
+        self.assertIsNone(peer.preshared_key)
+        self.assertIsNone(peer.endpoint)
+        self.assertIsNone(peer.endpoint_host)
+        self.assertEqual(peer.allowed_ips, [])
+        self.assertIsNone(peer.persistent_keepalive)
+        interface = parse_dump_line(DUMP.splitlines()[0], interface_line=True)
+        self.assertEqual((interface.public_key, interface.listen_port, interface.fwmark), ("serverpub=", 51820, None))
+        self.assertFalse(hasattr(interface, "private_key"))
+        with self.assertRaises(ValueError):
+            parse_dump_line("garbage")
+
+    def test_read_dump_with_one_process(self):
+        """Тест: весь дамп читается одним вызовом wg."""
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp = Path(tmp)
+            (tmp / "dump").write_text(DUMP)
+            wg = tmp / "wg"
+            wg.write_text(f'#!/bin/sh\necho "$@" >> "{tmp}/calls"\ncat "{tmp}/dump"\n')
+            wg.chmod(0o755)
+            with mock.patch.dict(os.environ, {"PATH": f"{tmp}{os.pathsep}{os.environ.get('PATH', '')}"}):
+                interface, peers = read_wg_dump("wg0")
+                self.assertIsInstance(next(iter_wg_dump("wg0")), WgInterfaceStatus)
+                wg.write_text("#!/bin/sh\nexit 1\n")
+                with self.assertRaises(subprocess.CalledProcessError):
+                    read_wg_dump("wg0")
+            self.assertEqual(interface.listen_port, 51820)
+            self.assertEqual(sorted(peers), ["alicekey=", "bobkey="])
+            self.assertEqual((tmp / "calls").read_text().splitlines()[0], "show wg0 dump")
+
+    def test_format_bytes(self):
+        """Тест: форматирование размеров как в `wg show`."""
+        self.assertEqual(format_bytes(92), "92 B")
+        self.assertEqual(format_bytes(5000), "4.88 KiB")
+        self.assertEqual(format_bytes(123456789), "117.74 MiB")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,268 @@
+import unittest
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from unittest import mock
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from modules.wg_changeset import ChangeSet
+from modules.wg_config import WgConfig
+from modules import wg_sync
+from modules.wg_sync import SyncScheduler, desired_state, peer_delta, render_stripped_config, sync_wireguard
+from test.test_wg_config import SAMPLE_CONFIG
+
+
+class TestRenderStrippedConfig(unittest.TestCase):
+
+    def test_wg_quick_options_and_blocked_peers_are_left_out(self):
+        """Тест: как в wg-quick strip — без Address/DNS/PostUp и без заблокированных клиентов."""
+        config = WgConfig.parse(SAMPLE_CONFIG.replace(
+            "ListenPort = 51820\n", "ListenPort = 51820\nDNS = 1.1.1.1\nPostUp = iptables -A FORWARD\n"))
+        self.assertEqual(render_stripped_config(config), (
+            "[Interface]\n"
+            "ListenPort = 51820\n"
+            "PrivateKey = serverkey=\n"
+            "\n[Peer]\n"
+            "PublicKey = alicekey=\n"
+            "PresharedKey = alicepsk=\n"
+            "AllowedIPs = 10.66.66.2/32,fd42:42:42::2/128\n"
+            "\n[Peer]\n"
+            "PublicKey = carolkey=\n"
+            "AllowedIPs = 10.66.66.4/32\n"
+        ))
+
+
+FAKE_WG = """#!/bin/sh
+# Prints $WG_DUMP for `wg show`; records the arguments and the preshared keys read from /dev/fd/<n>
+if [ "$1" = "show" ]; then
+    [ -f "$WG_DUMP" ] && cat "$WG_DUMP"
+    exit 0
+fi
+echo "$@" >> "$WG_LOG"
+for arg in "$@"; do
+    case "$arg" in /dev/fd/*) cat "$arg" >> "$WG_LOG" ;; esac
+done
+[ "$1" = "syncconf" ] && cat > /dev/null
+exit 0
+"""
+
+
+class TestIncrementalSync(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.path = self.dir / "wg0.conf"
+        self.path.write_text(SAMPLE_CONFIG)
+        self.log = self.dir / "wg.log"
+        wg = self.dir / "wg"
+        wg.write_text(FAKE_WG)
+        wg.chmod(0o755)
+        self.dump = self.dir / "dump"
+        env = {
+            "PATH": f"{self.dir}{os.pathsep}{os.environ.get('PATH', '')}",
+            "WG_LOG": str(self.log),
+            "WG_DUMP": str(self.dump),
+        }
+        self.patches = [
+            mock.patch.dict(os.environ, env),
+            mock.patch.dict(wg_sync._applied, clear=True),
+            mock.patch.object(wg_sync, "generate_public_key", return_value=b"serverpub="),
+        ]
+        for patch in self.patches:
+            patch.start()
+
+    def tearDown(self):
+        for patch in reversed(self.patches):
+            patch.stop()
+        self.tmp.cleanup()
+
+    def wg_calls(self):
+        calls = self.log.read_text().splitlines() if self.log.exists() else []
+        self.log.unlink(missing_ok=True)
+        return calls
+
+    def kernel_has(self, text):
+        """Writes the `wg show dump` of an interface that applied the configuration text."""
+        config = WgConfig.parse(text)
+        lines = [f"serverkey=\tserverpub=\t{config.interface.get('ListenPort')}\toff\n"]
+        lines += [
+            f"{key}\t{psk or '(none)'}\t(none)\t{ips}\t0\t0\t0\toff\n"
+            for key, (psk, ips) in desired_state(config)[1].items()
+        ]
+        self.dump.write_text("".join(lines))
+
+    def test_peer_delta(self):
+        """Тест: разница состояний — удаление, новый клиент и изменённые поля."""
+        previous = {"a": ("psk", "10.0.0.2/32"), "b": ("", "10.0.0.3/32"), "c": ("psk", "10.0.0.4/32")}
+        desired = {"b": ("", "10.0.0.3/32"), "c": ("", "10.0.0.5/32"), "d": ("", "10.0.0.6/32")}
+        self.assertEqual(peer_delta(previous, desired), [
+            ("a", None),
+            ("c", {"preshared_key": "", "allowed_ips": "10.0.0.5/32"}),
+            ("d", {"allowed_ips": "10.0.0.6/32"}),
+        ])
+        self.assertEqual(peer_delta(desired, desired), [])
+
+    def test_unreadable_kernel_is_full_then_only_changed_peers_are_set(self):
+        """Тест: без состояния ядра — syncconf, далее только `wg set` для изменённых клиентов."""
+        sync_wireguard("wg0", self.path)
+        self.assertEqual(self.wg_calls(), ["syncconf wg0 /dev/stdin"])
+
+        sync_wireguard("wg0", self.path)  # Nothing changed
+        self.assertEqual(self.wg_calls(), [])
+
+        self.kernel_has(self.path.read_text())
+        ChangeSet(self.path).block("alice").unblock("bob").apply(sync=False)
+        sync_wireguard("wg0", self.path)
+        calls = self.wg_calls()
+        self.assertEqual(calls[0].split()[:3], ["set", "wg0", "peer"])
+        self.assertIn("peer alicekey= remove", calls[0])
+        self.assertIn("peer bobkey= preshared-key /dev/fd/", calls[0])
+        self.assertIn("allowed-ips 10.66.66.3/32", calls[0])
+        self.assertEqual(calls[1:], ["bobpsk="])
+        self.assertEqual(wg_sync._applied["wg0"][1], desired_state(WgConfig.parse(self.path.read_text())))
+
+    def test_first_sync_reads_the_kernel_state(self):
+        """Тест: первая синхронизация процесса сравнивает с `wg show dump`, а не делает syncconf."""
+        self.dump.write_text(
+            "serverkey=\tserverpub=\t51820\toff\n"
+            "alicekey=\talicepsk=\t(none)\tfd42:42:42::2/128,10.66.66.2/32\t0\t0\t0\toff\n"
+            "davekey=\t(none)\t(none)\t10.66.66.5/32\t0\t0\t0\toff\n"
+        )
+        sync_wireguard("wg0", self.path)
+        calls = self.wg_calls()
+        self.assertEqual(len(calls), 1)
+        self.assertIn("peer davekey= remove", calls[0])
+        self.assertIn("peer carolkey= allowed-ips 10.66.66.4/32", calls[0])
+        self.assertNotIn("alicekey=", calls[0])  # Same addresses in another order
+
+        wg_sync._applied.clear()
+        self.dump.write_text("serverkey=\tserverpub=\t51821\toff\n")  # Other ListenPort
+        sync_wireguard("wg0", self.path)
+        self.assertEqual(self.wg_calls(), ["syncconf wg0 /dev/stdin"])
+
+    def test_peer_added_by_another_process_is_removed_when_blocked(self):
+        """Тест: клиент, добавленный другим процессом (main.py), удаляется из ядра при блокировке."""
+        self.kernel_has(SAMPLE_CONFIG)
+        sync_wireguard("wg0", self.path)
+        self.assertEqual(self.wg_calls(), [])
+
+        # main.py adds frank and syncs the interface itself
+        ChangeSet(self.path).add_peer("frank", "frankkey=", "frankpsk=", "10.66.66.6/32").apply(sync=False)
+        self.kernel_has(self.path.read_text())
+
+        ChangeSet(self.path).block("frank").apply(sync=False)
+        sync_wireguard("wg0", self.path)
+        calls = self.wg_calls()
+        self.assertEqual(len(calls), 1)
+        self.assertIn("peer frankkey= remove", calls[0])
+
+    def test_interface_change_and_large_delta_fall_back_to_syncconf(self):
+        """Тест: изменение [Interface] или много клиентов — полный syncconf."""
+        self.kernel_has(SAMPLE_CONFIG)
+        sync_wireguard("wg0", self.path)
+        self.wg_calls()
+        self.path.write_text(self.path.read_text().replace("ListenPort = 51820", "ListenPort = 51821"))
+        sync_wireguard("wg0", self.path)
+        self.assertEqual(self.wg_calls(), ["syncconf wg0 /dev/stdin"])
+        self.kernel_has(self.path.read_text())
+
+        changes = ChangeSet(self.path)
+        for i in range(10, 20):
+            changes.add_peer(f"user{i}", f"key{i}=", "", f"10.66.66.{i}/32")
+        changes.apply(sync=False)
+        with mock.patch.object(wg_sync.settings, "WG_SET_MAX_PEERS", 5):
+            sync_wireguard("wg0", self.path)
+        self.assertEqual(self.wg_calls(), ["syncconf wg0 /dev/stdin"])
+
+
+class TestSyncScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+
+    def fake_sync(self, interface, config_path):
+        self.calls.append(interface)
+        return 0.001
+
+    def test_burst_is_coalesced(self):
+        """Тест: серия запросов в пределах окна даёт одну синхронизацию."""
+        scheduler = SyncScheduler("wg0", window=0.05, max_delay=5, sync=self.fake_sync)
+        for _ in range(20):
+            scheduler.request()
+        scheduler.request(wait=True)
+        self.assertEqual(self.calls, ["wg0"])
+        self.assertEqual(scheduler.stats["requests"], 21)
+        self.assertEqual(scheduler.stats["syncs"], 1)
+        self.assertEqual(scheduler.stats["last_latency"], 0.001)
+
+    def test_errors_are_kept_only_for_waiters(self):
+        """Тест: ошибка синхронизации хранится, пока её не получат все ожидающие запросы."""
+        def failing_sync(interface, config_path):
+            raise RuntimeError("wg failed")
+
+        scheduler = SyncScheduler("wg0", window=0.01, max_delay=5, sync=failing_sync)
+        scheduler.request()  # Nobody waits: the error is only reported
+        time.sleep(0.1)
+        self.assertEqual(scheduler.stats["errors"], 1)
+        self.assertEqual(scheduler._errors, {})
+        with self.assertRaises(RuntimeError):
+            scheduler.request(wait=True)
+        self.assertEqual(scheduler.stats["errors"], 2)
+        self.assertEqual(scheduler._errors, {})
+        self.assertEqual(scheduler._waiting, {})
+
+    def test_max_delay_bounds_the_wait(self):
+        """Тест: при непрерывных запросах синхронизация всё равно выполняется через max_delay."""
+        scheduler = SyncScheduler("wg0", window=0.05, max_delay=0.1, sync=self.fake_sync)
+        deadline = time.monotonic() + 0.35
+        while time.monotonic() < deadline:
+            scheduler.request()
+            time.sleep(0.01)
+        scheduler.flush()
+        self.assertGreaterEqual(len(self.calls), 3)
+
+    def test_flush_runs_pending_sync_now(self):
+        """Тест: flush() выполняет отложенную синхронизацию без ожидания окна."""
+        scheduler = SyncScheduler("wg0", window=60, max_delay=60, sync=self.fake_sync)
+        scheduler.request()
+        started = time.monotonic()
+        scheduler.flush()
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(len(self.calls), 1)
+        scheduler.flush()  # Nothing pending
+        self.assertEqual(len(self.calls), 1)
+
+    def test_wait_reports_sync_error(self):
+        """Тест: ошибка синхронизации передаётся ожидающему запросу."""
+        def failing_sync(interface, config_path):
+            raise RuntimeError("wg failed")
+        scheduler = SyncScheduler("wg0", window=0.01, sync=failing_sync)
+        with self.assertRaises(RuntimeError):
+            scheduler.request(wait=True)
+        self.assertEqual(scheduler.stats["errors"], 1)
+
+    def test_request_during_sync_gets_its_own_sync(self):
+        """Тест: запрос во время синхронизации вызывает ещё одну синхронизацию."""
+        running = threading.Event()
+        release = threading.Event()
+
+        def slow_sync(interface, config_path):
+            self.calls.append(interface)
+            running.set()
+            release.wait(5)
+            return 0.0
+
+        scheduler = SyncScheduler("wg0", window=0.01, sync=slow_sync)
+        scheduler.request()
+        self.assertTrue(running.wait(5))
+        scheduler.request()
+        release.set()
+        scheduler.flush()
+        self.assertEqual(len(self.calls), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -38,6 +38,9 @@ sys.path.append(str(PROJECT_ROOT))
 # Attempt to import project settings
 try:
     from settings import BASE_DIR, SERVER_CONFIG_FILE, PARAMS_FILE, LLM_API_URL
+    from modules.wg_config import WgConfig
+    from modules.wg_dump import read_wg_dump
+    from modules.handshake_updater import convert_handshake_timestamp
 except ModuleNotFoundError as e:
     logger = logging.getLogger(__name__)
     logger.error("Unable to find the settings module. Ensure settings.py is located in the project root.")
@@ -72,12 +75,12 @@ def get_last_restart():
         return "No data"
 
 def get_wg_status():
-    """Gets the WireGuard status using the `wg show` command."""
+    """Gets the WireGuard peers with a single `wg show <nic> dump` call."""
     try:
-        output = subprocess.check_output(["sudo", "wg", "show"], text=True)
-        return output
-    except subprocess.CalledProcessError as e:
-        logger.error(f"Error executing wg show command: {e}")
+        _, peers = read_wg_dump()
+        return peers
+    except (OSError, subprocess.CalledProcessError, ValueError) as e:
+        logger.error(f"Error executing wg show dump command: {e}")
         return f"Error executing wg show: {e}"
 
 def read_config_file(filepath):
@@ -92,80 +95,35 @@ def read_config_file(filepath):
         logger.error(f"Error reading file {filepath}: {e}")
         return f"Error reading file {filepath}: {e}"
 
-def parse_wg_show(output):
-    """Parses the output of the `wg show` command and extracts peer data."""
-    def convert_to_simple_format(size_str):
-        """Converts size strings to a simple format (MB or GB)."""
-        try:
-            size, unit = size_str.split()
-            size = float(size)
-            if unit.lower().startswith("kib"):
-                size_mb = size / 1024
-                return f"{size_mb:.2f} MB"
-            elif unit.lower().startswith("mib"):
-                return f"{size:.2f} MB"
-            elif unit.lower().startswith("gib"):
-                return f"{size:.2f} GB"
-            else:
-                return size_str
-        except Exception:
-            return "No data"
-
-    peers = []
-    current_peer = None
-
-    for line in output.splitlines():
-        line = line.strip()
-        if line.startswith("peer:"):
-            if current_peer:
-                peers.append(current_peer)
-            current_peer = {
-                "PublicKey": line.split("peer:")[1].strip(),
-                "Transfer": {"Received": "No data", "Sent": "No data"},
-                "LatestHandshake": "No data"
-            }
-        elif "latest handshake:" in line and current_peer:
-            handshake_data = line.split("latest handshake:")[1].strip()
-            current_peer["LatestHandshake"] = handshake_data if handshake_data else "No data"
-        elif "transfer:" in line and current_peer:
-            transfer_data = line.split("transfer:")[1].split(",")
-            if len(transfer_data) == 2:
-                current_peer["Transfer"] = {
-                    "Received": convert_to_simple_format(transfer_data[0].strip()) or "No data",
-                    "Sent": convert_to_simple_format(transfer_data[1].strip()) or "No data"
-                }
-
-    if current_peer:
-        peers.append(current_peer)
-
-    return {"peers": peers}
+def parse_wg_show(peers):
+    """Converts the peers read with `wg show <nic> dump` into report data."""
+    def convert_to_simple_format(size_bytes):
+        """Converts a byte count to a simple format (MB or GB)."""
+        size_mb = size_bytes / 1024 ** 2
+        if size_mb < 1024:
+            return f"{size_mb:.2f} MB"
+        return f"{size_mb / 1024:.2f} GB"
+
+    return {"peers": [
+        {
+            "PublicKey": peer.public_key,
+            "Endpoint": peer.endpoint or "No data",
+            "AllowedIPs": peer.allowed_ips,
+            "Transfer": {
+                "Received": convert_to_simple_format(peer.transfer_rx),
+                "Sent": convert_to_simple_format(peer.transfer_tx)
+            },
+            "LatestHandshake": convert_handshake_timestamp(peer.latest_handshake)
+        }
+        for peer in peers.values()
+    ]}
 
 def parse_config_with_logins(content):
     """Parses the WireGuard configuration file and matches peers with logins."""
-    peer_data = []
-    current_login = None
-    current_peer = {}
-
-    for line in content.splitlines():
-        line = line.strip()
-        if line.startswith("### Client"):
-            if current_peer:
-                peer_data.append(current_peer)
-            current_login = line.split("Client")[-1].strip()
-            current_peer = {"login": current_login, "peer": {}}
-        elif line.startswith("[Peer]"):
-            if current_peer:
-                peer_data.append(current_peer)
-            current_peer = {"login": current_login, "peer": {}}
-        elif "=" in line:
-            key, value = map(str.strip, line.split("=", 1))
-            if current_peer:
-                current_peer["peer"][key] = value
-
-    if current_peer:
-        peer_data.append(current_peer)
-
-    return peer_data
+    return [
+        {"login": peer.name, "peer": peer.as_dict()}
+        for peer in WgConfig.parse(content).peers
+    ]
 
 def parse_config_file(content):
     """Parses the contents of a configuration file and returns a dictionary."""
@@ -186,7 +144,7 @@ def collect_and_analyze_wg_data():
     params_config = read_config_file(PARAMS_FILE)
 
     # Data analysis
-    data["wg_status"] = parse_wg_show(wg_status) if "Error" not in wg_status else wg_status
+    data["wg_status"] = parse_wg_show(wg_status) if isinstance(wg_status, dict) else wg_status
     data["wg0_config"] = parse_config_with_logins(wg0_config) if "Error" not in wg0_config else wg0_config
     data["params_config"] = parse_config_file(params_config) if "Error" not in params_config else params_config
     data["last_restart"] = get_last_restart()